@@ -1,12 +1,65 @@
-from fastapi import FastAPI
+import json
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from .modes.services import run
+from typing import List, Dict, Literal, Optional
+from .modes.services import run, public_result
+from .modes.batch import run_batch
+from .data_backend import load
+from .metrics import metrics
+from .llm.governor import governor, Overloaded
+from .config import DATA_BACKEND, INDEX_ADVISOR_ON_STARTUP, BATCH_MAX_QUERIES, RESULT_MAX_AGE_S
+from . import index_advisor
+from .resolver import resolver
+from .jobs import jobs
+from .responses import json_response, send, not_modified, etag_matches
+from .results import results, is_current, RESULT_ID
 
 class QueryPayload(BaseModel):
     query: str
+    session_id: Optional[str] = None
+    history: Optional[List[Dict[str, str]]] = None
+    # "feature", "small_n", "large_n", "borocode" or "h3"; city scale defaults to CITY_AGGREGATE_LEVEL
+    level: Optional[str] = None
+    # statistic mapped for aggregated numeric results: mean, median, count, min or max
+    stat: Optional[str] = None
+    # "llm" narrates the summary with the model, "template" locally and instantly, "none" skips it
+    explain: Literal["llm", "template", "none"] = "llm"
 
-app = FastAPI()
+class BatchPayload(BaseModel):
+    queries: List[str]
+    explain: Literal["llm", "template", "none"] = "llm"
+
+class JobPayload(BaseModel):
+    # either one query (class "query", run like /analyze) or a list (class "batch")
+    query: Optional[str] = None
+    queries: Optional[List[str]] = None
+    session_id: Optional[str] = None
+    history: Optional[List[Dict[str, str]]] = None
+    level: Optional[str] = None
+    stat: Optional[str] = None
+    explain: Literal["llm", "template", "none"] = "llm"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load()
+    try:
+        resolver.build()
+    except Exception as e:
+        print("[resolver] build failed:", e)
+    if DATA_BACKEND == "postgis" and INDEX_ADVISOR_ON_STARTUP in ("report", "apply"):
+        try:
+            index_advisor.run(INDEX_ADVISOR_ON_STARTUP)
+        except Exception as e:
+            print("[index_advisor] failed:", e)
+    jobs.start()
+    yield
+    jobs.stop()
+    metrics.flush()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,20 +68,79 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(Overloaded)
+def overloaded(request, exc: Overloaded):
+    return JSONResponse(
+        status_code=exc.status,
+        content={"error": f"LLM_OVERLOADED: {exc.reason}"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 @app.post("/analyze")
-def analyze(payload: QueryPayload):
-    result = run(payload.query)
-    return {
-        "mode": result['mode'],
-        "geojson": result['geojson'],
-        "column": result['column'],
-        "dtype": result['dtype'],
-        "scale": result['scale'],
-        "region": result['region'],
-        "table": result['table'],
-        "filters": result['filters'],
-        "summary": result['summary'],
-        "explanation": result['explanation'],
-        "usage": result['usage'],
-        "error": result['error'],
-    }
+def analyze(payload: QueryPayload, request: Request):
+    result = run(payload.query, session_id=payload.session_id, history=payload.history, level=payload.level, stat=payload.stat,
+                 explain=payload.explain)
+    # the GeoJSON arrives pre-serialized and is spliced into the body as-is,
+    # then the body is compressed as the client's Accept-Encoding allows
+    return json_response(request, public_result(result))
+
+
+@app.get("/results/{result_id}")
+def get_result(result_id: str, request: Request):
+    """The data part of an earlier answer; immutable for its data version, so clients revalidate with 304s."""
+    if not RESULT_ID.match(result_id):
+        raise HTTPException(status_code=404, detail="unknown result")
+    if not is_current(result_id):
+        # minted against older data: the client has to ask again
+        metrics.incr("results.stale")
+        raise HTTPException(status_code=404, detail="result is from an older data version")
+    # the payload decides the encoding, and with it the ETag, that a full response would carry
+    payload = results.get(result_id)
+    if payload is None:
+        metrics.incr("results.miss")
+        raise HTTPException(status_code=404, detail="result expired")
+    headers = {"Cache-Control": f"public, max-age={RESULT_MAX_AGE_S}, immutable"}
+    if etag_matches(request.headers.get("if-none-match"), result_id):
+        metrics.incr("results.not_modified")
+        return not_modified(request, payload, headers=headers, tag=result_id)
+    metrics.incr("results.hit")
+    return send(request, payload, headers=headers, tag=result_id)
+
+
+@app.post("/analyze/batch")
+def analyze_batch(payload: BatchPayload):
+    if len(payload.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"at most {BATCH_MAX_QUERIES} queries per batch")
+
+    def lines():
+        # one JSON object per line, in completion order; "index" points back into the request
+        for item in run_batch(payload.queries, payload.explain):
+            yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs", status_code=202)
+def submit_job(payload: JobPayload):
+    if (payload.query is None) == (payload.queries is None):
+        raise HTTPException(status_code=422, detail="give either query or queries")
+    if payload.queries is not None:
+        if len(payload.queries) > BATCH_MAX_QUERIES:
+            raise HTTPException(status_code=413, detail=f"at most {BATCH_MAX_QUERIES} queries per batch")
+        job = jobs.submit("batch", {"queries": payload.queries, "explain": payload.explain})
+    else:
+        job = jobs.submit("query", payload.model_dump(exclude={"queries"}))
+    return {"id": job["id"], "class": job["class"], "status": job["status"], "url": f"/jobs/{job['id']}"}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, request: Request):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown or expired job")
+    return json_response(request, job)
+
+
+@app.get("/metrics")
+def get_metrics():
+    return {**metrics.snapshot(), "llm_governor": governor.state()}
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from .regions import polygons
+
+# spread reported next to the median; the template explainer reads skew from these
+PERCENTILES = {"p10": 0.10, "p25": 0.25, "p75": 0.75, "p90": 0.90}
+
+
+def percentiles(values) -> dict:
+    """PERCENTILES of the non-missing values, None when there are none."""
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {k: None for k in PERCENTILES}
+    qs = np.quantile(values, list(PERCENTILES.values()))
+    return {k: float(q) for k, q in zip(PERCENTILES, qs)}
+
+
+def numeric_stats(total) -> dict:
+    """Summary statistics from the overall row of a grouped aggregation."""
+    def num(v):
+        return None if v is None or pd.isna(v) else float(v)
+
+    stats = {
+        "count": int(total["count"]),
+        "mean": num(total["mean"]),
+        "median": num(total["median"]),
+        "min": num(total["min"]),
+        "max": num(total["max"]),
+    }
+    stats.update({k: num(total[k]) for k in PERCENTILES if k in total})
+    return stats
+
+
+def categorical_groups(parts: pd.DataFrame, totals: pd.Series, level: str, col: str):
+    """Dominant category per region from (level, value, n) counts, plus exact overall counts."""
+    parts = parts.dropna(subset=[level]).sort_values([level, "n"], ascending=[True, False])
+    count = parts.groupby(level)["n"].sum()
+    top = parts.drop_duplicates(level).set_index(level)
+    groups = pd.DataFrame({
+        col: top["value"],
+        "share": (top["n"] / count).round(4),
+        "count": count,
+    }).rename_axis(level).reset_index()
+    totals = totals[totals > 0].sort_values(ascending=False)
+    return groups, {"count": int(totals.sum()), "counts": totals}
+
+
+def attach(groups: pd.DataFrame, level: str, dissolve):
+    """Join per-region aggregates onto the precomputed region polygons."""
+    shapes = polygons.get(level, dissolve)
+    groups = groups.copy()
+    if level == "borocode":
+        groups[level] = pd.to_numeric(groups[level]).astype("Int64")
+    else:
+        groups[level] = groups[level].astype(str)
+    return shapes.merge(groups, on=level, how="inner")
@@ -0,0 +1,146 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path="../.env")
+
+# categorical summaries keep the top-k categories and fold the rest into "other"
+SUMMARY_TOP_K = int(os.getenv("SUMMARY_TOP_K", "8"))
+
+# search returns this many ranked candidate regions alongside the best one
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", "5"))
+
+# server-side conversation sessions
+SESSION_TTL_S = int(os.getenv("SESSION_TTL_S", "3600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "2"))
+SESSION_TURN_CHARS = int(os.getenv("SESSION_TURN_CHARS", "400"))
+SESSION_MAX_PLANS = int(os.getenv("SESSION_MAX_PLANS", "10"))
+# fetch every schema column with an analyze result so follow-up filters on other
+# columns can be applied to the session frame instead of going back to the db;
+# off by default since it widens every analyze fetch
+SESSION_FRAME_ALL_COLUMNS = os.getenv("SESSION_FRAME_ALL_COLUMNS", "false").lower() == "true"
+# at these scales (a single large_n region, its rows grouped by small_n) the answer is small
+# enough to also carry every numeric column, so "and built_year?" after "heightroof" in the
+# same region is answered from the session frame; the frame caps below still apply
+SESSION_FRAME_NUMERIC_SCALES = [
+    s.strip() for s in os.getenv("SESSION_FRAME_NUMERIC_SCALES", "large_n").split(",") if s.strip()
+]
+# session frames larger than these are not kept; all kept frames together stay under the total
+SESSION_FRAME_MAX_ROWS = int(os.getenv("SESSION_FRAME_MAX_ROWS", "50000"))
+SESSION_FRAME_MAX_BYTES = int(os.getenv("SESSION_FRAME_MAX_BYTES", str(32 * 1024 * 1024)))
+SESSION_FRAMES_TOTAL_BYTES = int(os.getenv("SESSION_FRAMES_TOTAL_BYTES", str(256 * 1024 * 1024)))
+
+# data backend: "postgis" queries the database per request, "snapshot" serves
+# buildings/street_block from an in-memory columnar copy loaded at startup
+DATA_BACKEND = os.getenv("DATA_BACKEND", "postgis")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "../data/snapshot")
+# log every SQL statement with its parameters, and each PREPARE, as it runs (postgis backend);
+# off by default: statements are timed per name in the metrics query log either way
+SQL_DEBUG = os.getenv("SQL_DEBUG", "false").lower() == "true"
+
+# process metrics, flushed per worker so offline tools can read them
+METRICS_DIR = os.getenv("METRICS_DIR", "../data/metrics")
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "60"))
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))
+
+# index advisor: "off", "report" or "apply" at startup (postgis backend only)
+INDEX_ADVISOR_ON_STARTUP = os.getenv("INDEX_ADVISOR_ON_STARTUP", "off")
+BRIN_MIN_CORRELATION = float(os.getenv("BRIN_MIN_CORRELATION", "0.8"))
+
+# pre-flight guardrail: above these estimates an analyze result is downgraded
+GUARD_MAX_ROWS = int(os.getenv("GUARD_MAX_ROWS", "100000"))
+GUARD_MAX_BYTES = int(os.getenv("GUARD_MAX_BYTES", str(100 * 1024 * 1024)))
+GUARD_SAMPLE_ROWS = int(os.getenv("GUARD_SAMPLE_ROWS", "20000"))
+GUARD_AGGREGATE_LEVEL = os.getenv("GUARD_AGGREGATE_LEVEL", "small_n")
+
+# region polygons, dissolved once from street blocks along the neighbourhood membership
+REGIONS_DIR = os.getenv("REGIONS_DIR", "../data/regions")
+REGIONS_JSON = os.getenv("REGIONS_JSON", "../notebooks/regions.json")
+NEIGHBORHOOD_CSV = os.getenv("NEIGHBORHOOD_CSV", "../notebooks/neighborhood_list.csv")
+# city-scale analyze results are aggregated per region unless the request asks for "feature"
+CITY_AGGREGATE_LEVEL = os.getenv("CITY_AGGREGATE_LEVEL", "small_n")
+
+# hex-grid output: H3 resolution per analyze scale (needs the optional h3 package)
+H3_RESOLUTIONS = {
+    "city": int(os.getenv("H3_RES_CITY", "8")),
+    "borough": int(os.getenv("H3_RES_BOROUGH", "9")),
+    "large_n": int(os.getenv("H3_RES_LARGE_N", "10")),
+}
+
+# coalesce identical in-flight requests, SQL fetches and explanations into one execution
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() == "true"
+
+# /analyze/batch: parallel planning/explaining workers and the largest accepted batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+
+# LLM governor: concurrent calls, rolling tokens-per-minute budget (0 = unlimited),
+# and the latency budget after which a request is rejected instead of queued
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_TPM_BUDGET = int(os.getenv("LLM_TPM_BUDGET", "200000"))
+LLM_EST_OUTPUT_TOKENS = int(os.getenv("LLM_EST_OUTPUT_TOKENS", "600"))
+LLM_DEFAULT_LATENCY_MS = float(os.getenv("LLM_DEFAULT_LATENCY_MS", "3000"))
+LLM_REQUEST_BUDGET_S = float(os.getenv("LLM_REQUEST_BUDGET_S", "30"))
+
+# per-stage LLM timeouts and hedging: after a stage's p95 latency a duplicate call is fired
+# and the first answer wins; HEDGE_BUDGET is the fraction of calls allowed a hedge
+LLM_STAGE_TIMEOUTS = {
+    "mode": float(os.getenv("LLM_TIMEOUT_MODE_S", "20")),
+    "plan": float(os.getenv("LLM_TIMEOUT_PLAN_S", "40")),
+    "explain": float(os.getenv("LLM_TIMEOUT_EXPLAIN_S", "40")),
+}
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "1500"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# when a plan fails validation, ask the model once more for just the failing fields
+LLM_REASK = os.getenv("LLM_REASK", "true").lower() == "true"
+
+# resolver: lowest char n-gram cosine similarity accepted when snapping a plan value
+RESOLVER_MIN_SCORE = float(os.getenv("RESOLVER_MIN_SCORE", "0.45"))
+
+# explanation cache: entries (0 disables), lifetime, and the significant digits
+# summary floats are rounded to before hashing
+EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", "1024"))
+EXPLAIN_CACHE_TTL_S = float(os.getenv("EXPLAIN_CACHE_TTL_S", "3600"))
+EXPLAIN_CACHE_DIGITS = int(os.getenv("EXPLAIN_CACHE_DIGITS", "3"))
+
+# process pool for GeoJSON encoding and summaries (0 workers = always inline);
+# frames with fewer rows than CPU_POOL_MIN_ROWS are never shipped to it
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "0"))
+CPU_POOL_MIN_ROWS = int(os.getenv("CPU_POOL_MIN_ROWS", "50000"))
+
+# response compression: encodings offered in order of preference (brotli and zstd need
+# the optional "compress" extras), the smallest body worth compressing, and how many
+# serialized payloads keep their compressed variants for reuse
+COMPRESS_ENCODINGS = [e.strip() for e in os.getenv("COMPRESS_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()]
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1400"))
+PAYLOAD_CACHE_SIZE = int(os.getenv("PAYLOAD_CACHE_SIZE", "64"))
+PAYLOAD_CACHE_TTL_S = float(os.getenv("PAYLOAD_CACHE_TTL_S", "600"))
+
+# GET /results/{id}: data parts of answers addressed by (compiled plan, data version).
+# DATA_VERSION overrides the version tag; otherwise the snapshot build stamp is used, or on
+# postgis the single value DATA_VERSION_SQL returns (a stamp the ETL writes), re-read every
+# DATA_VERSION_TTL_S. Without any of them no result ids are minted.
+DATA_VERSION = os.getenv("DATA_VERSION", "")
+DATA_VERSION_SQL = os.getenv("DATA_VERSION_SQL", "")
+DATA_VERSION_TTL_S = float(os.getenv("DATA_VERSION_TTL_S", "60"))
+RESULTS_DIR = os.getenv("RESULTS_DIR", "../data/results")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "128"))
+RESULT_TTL_S = float(os.getenv("RESULT_TTL_S", "86400"))
+RESULT_MAX_AGE_S = int(os.getenv("RESULT_MAX_AGE_S", "3600"))
+
+# asynchronous jobs: SQLite queue shared by every worker process, how many jobs of each
+# class may run at once (across processes), the LLM budget of one job, and how long
+# finished jobs are kept; a running job not heard from for JOB_STALE_S is failed
+JOBS_DB = os.getenv("JOBS_DB", "../data/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LIMITS = {
+    "query": int(os.getenv("JOB_LIMIT_QUERY", "4")),
+    "batch": int(os.getenv("JOB_LIMIT_BATCH", "1")),
+}
+JOB_BUDGET_S = float(os.getenv("JOB_BUDGET_S", "600"))
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "86400"))
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "900"))
+JOB_POLL_S = float(os.getenv("JOB_POLL_S", "0.5"))
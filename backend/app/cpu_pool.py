@@ -0,0 +1,136 @@
+import sys
+import time
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from .metrics import metrics
+from .responses import RawJSON
+from .config import CPU_POOL_WORKERS, CPU_POOL_MIN_ROWS
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _pa():
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    return pa, ipc
+
+
+def _executor():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawned workers start clean instead of inheriting the server's threads and connections
+            _pool = ProcessPoolExecutor(max_workers=CPU_POOL_WORKERS, mp_context=mp.get_context("spawn"))
+            print("[cpu_pool] started", CPU_POOL_WORKERS, "workers")
+        return _pool
+
+
+def _share(df: pd.DataFrame):
+    """Write df as an Arrow IPC stream straight into a new shared memory block."""
+    pa, ipc = _pa()
+    geometry = isinstance(df, gpd.GeoDataFrame)
+    if geometry:
+        geom = df.geometry.name
+        table = pa.Table.from_pandas(pd.DataFrame(df.drop(columns=geom)), preserve_index=False)
+        table = table.append_column(geom, pa.array(shapely.to_wkb(df.geometry.values), type=pa.large_binary()))
+        meta = {**(table.schema.metadata or {}), b"geometry": geom.encode(),
+                b"crs": (df.crs.to_wkt() if df.crs else "").encode()}
+        table = table.replace_schema_metadata(meta)
+    else:
+        table = pa.Table.from_pandas(pd.DataFrame(df), preserve_index=False)
+
+    sink = pa.MockOutputStream()
+    _write(table, sink)
+    shm = shared_memory.SharedMemory(create=True, size=max(sink.size(), 1))
+    _write(table, pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)))
+    return shm
+
+
+def _write(table, sink):
+    # kept in its own frame so no writer outlives the call and pins the shared block
+    _, ipc = _pa()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _attach(name: str):
+    # the parent owns the block; the worker must not unlink it when it exits
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _frame(table):
+    meta = table.schema.metadata or {}
+    if b"geometry" not in meta:
+        return table.to_pandas()
+    geom = meta[b"geometry"].decode()
+    df = table.drop_columns([geom]).to_pandas()
+    geoms = shapely.from_wkb(table.column(geom).to_numpy(zero_copy_only=False))
+    return gpd.GeoDataFrame(df, geometry=gpd.GeoSeries(geoms, name=geom), crs=meta[b"crs"].decode() or None)
+
+
+def _run_shared(name: str, fn, args):
+    """Worker side: map the block, rebuild the frame and run fn on it."""
+    pa, ipc = _pa()
+    shm = _attach(name)
+    try:
+        table = ipc.open_stream(pa.py_buffer(shm.buf)).read_all()
+        result = fn(_frame(table), *args)
+        del table
+        return result
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # a column still views the block; it is unmapped when the worker exits
+            pass
+
+
+def run(fn, df, *args):
+    """fn(df, *args), in the process pool when df is large enough to stall other requests.
+
+    fn must be a module-level function; its result is pickled back, so it should
+    be small (a summary, a grouped frame, a JSON string).
+    """
+    global _pool
+    rows = 0 if df is None else len(df)
+    if CPU_POOL_WORKERS <= 0 or rows < CPU_POOL_MIN_ROWS:
+        return fn(df, *args)
+
+    start = time.perf_counter()
+    shm = _share(df)
+    try:
+        result = _executor().submit(_run_shared, shm.name, fn, args).result()
+    except BrokenProcessPool as e:
+        print("[cpu_pool] pool broken, running inline:", e)
+        metrics.incr("cpu_pool.broken")
+        with _lock:
+            _pool = None
+        return fn(df, *args)
+    finally:
+        shm.close()
+        shm.unlink()
+    metrics.incr("cpu_pool.offloaded")
+    metrics.observe(f"cpu_pool.{fn.__name__}", (time.perf_counter() - start) * 1000)
+    return result
+
+
+def _to_json(gdf) -> str:
+    return gdf.to_json()
+
+
+def geojson(gdf) -> RawJSON:
+    """GeoJSON text for gdf, kept serialized so the response can splice it in without re-encoding."""
+    return RawJSON(run(_to_json, gdf))
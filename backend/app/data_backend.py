@@ -0,0 +1,115 @@
+import time
+import threading
+
+from .config import DATA_BACKEND, DATA_VERSION, DATA_VERSION_TTL_S
+from .singleflight import SingleFlight, make_key
+from .aggregate import attach
+from .plan_compiler import (
+    SCALE_GROUP_COL,
+    PlanError,
+    compile_analyze,
+    compile_search,
+    compile_search_final,
+    compile_compare,
+    compile_frame,
+    plan_digest,
+)
+
+# each backend only provides the fetches: fetch_compiled, fetch_guarded, fetch_frame and dissolve_small_n
+if DATA_BACKEND == "snapshot":
+    from . import snapshot as backend
+    from .snapshot import load, snapshot
+elif DATA_BACKEND == "postgis":
+    from . import db as backend
+
+    def load():
+        pass
+else:
+    raise ValueError(f"unknown DATA_BACKEND: {DATA_BACKEND}")
+
+print("[data_backend] using", DATA_BACKEND)
+
+queries = SingleFlight("sql")
+
+_stamp = {"value": None, "read": 0.0}
+_stamp_lock = threading.Lock()
+
+
+def data_version():
+    """Tag that changes whenever the data behind a compiled plan may have changed; None when unknown.
+
+    Every worker process must agree on it, so there is no per-process fallback.
+    """
+    if DATA_VERSION:
+        return DATA_VERSION
+    if DATA_BACKEND == "snapshot":
+        return snapshot.version
+    with _stamp_lock:
+        if time.monotonic() - _stamp["read"] >= DATA_VERSION_TTL_S:
+            _stamp["value"] = backend.data_stamp()
+            _stamp["read"] = time.monotonic()
+        return _stamp["value"]
+
+
+def _run(compile_fn, *args, fetch=None, **kwargs):
+    try:
+        compiled = compile_fn(*args, **kwargs)
+    except PlanError as e:
+        print("invalid plan:", e)
+        return {"gdf": None, "error": f"INVALID_PLAN: {e}"}
+
+    fetch = fetch or backend.fetch_compiled
+    try:
+        # identical compiled statements in flight share one fetch
+        result = queries.do(make_key(fetch.__name__, compiled), fetch, compiled)
+        # a Bernoulli sample differs on every run, so it gets no plan digest and hence no result id
+        sampled = (result.get("downgrade") or {}).get("applied") == "sample"
+        return {**result, "plan": None if sampled else plan_digest(compiled)}
+    except Exception as e:
+        print("failed to retrieve data:", e)
+        return {"gdf": None, "error": str(e)}
+
+
+def get_data_analyze(column, scale, table, filters, extra_columns=None, level=None):
+    if not column:
+        print("no column matched")
+        return {"gdf": None, "error": "no appropriate column"}
+    return _run(compile_analyze, column, scale, table, filters, extra_columns, level, fetch=backend.fetch_guarded)
+
+
+def get_data_search(column):
+    if not column:
+        print("no column matched")
+        return {"gdf": None, "error": "no appropriate column"}
+    print("column:", column)
+    return _run(compile_search, column)
+
+
+def get_data_search_final(column, scale, neighborhood):
+    if not column:
+        print("no column matched")
+        return {"gdf": None, "error": "no appropriate column"}
+    if not scale or neighborhood is None:
+        print("missing scale or neighborhood")
+        return {"gdf": None, "error": "missing scale or neighborhood"}
+    print("column:", column, "scale:", scale, "neighborhood:", neighborhood)
+    return _run(compile_search_final, column, scale, neighborhood)
+
+
+def get_data_compare(column, scale, table, regions, filters):
+    if not column or column == "NO_MATCH":
+        print("no column matched")
+        return {"gdf": None, "error": "no appropriate column"}
+    if not regions:
+        print("no regions to compare")
+        return {"gdf": None, "error": "no regions to compare"}
+    return _run(compile_compare, column, scale, table, regions, filters)
+
+
+def get_region_shapes(groups, level):
+    """Per-region rows joined onto the precomputed region polygons; no block table is read."""
+    return attach(groups, level, backend.dissolve_small_n)
+
+
+def get_data_frame(table, columns, filters):
+    return _run(compile_frame, table, columns, filters, fetch=backend.fetch_frame)
@@ -1,145 +1,218 @@
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
 import os
+import json
+import time
 import geopandas as gpd
 
+from .dtypes import compact_frame, dtype_map
+from .metrics import metrics
+from .guardrail import decide, sample_fraction
+from .aggregate import numeric_stats, categorical_groups, attach, PERCENTILES
+from . import hexgrid
+from .config import DATA_VERSION_SQL, SQL_DEBUG
+
 load_dotenv(dotenv_path="../.env")
 
 DB_URL = os.getenv("db_url")
-engine = create_engine(DB_URL)
-
-def get_data_analyze(column, scale, table, filters):
-    if not column:
-        print("no column matched")
-        return {"gdf": None, "error": "no appropriate column"}
-
-    base_table = f"public.{table}"
-
-    where_clauses = []
-    params = {}
-
-    if filters:
-        for i, (col, op, val) in enumerate(filters):
-            if val == "NO_MATCH":
-                continue
-            key = f"v{i}"
-            where_clauses.append(f"{col} {op} %({key})s")
-            params[key] = val
-
-    where_sql = " AND ".join(where_clauses) if where_clauses else "TRUE"
-
-    if scale == "city":
-        sql = f"SELECT {column}, borocode, geom FROM {base_table} WHERE {where_sql}"
-    elif scale == "borough":
-        sql = f"SELECT {column}, large_n, geom FROM {base_table} WHERE {where_sql}"
-    elif scale == "large_n":
-        sql = f"SELECT {column}, small_n, geom FROM {base_table} WHERE {where_sql}"
-    print("sql:", sql, "params:", params)
-
-    try:
-        gdf = gpd.read_postgis(sql, con=engine, geom_col="geom", params=params)
-        print("data retrieved from db")
-        return {"gdf": gdf, "error": None}
-    except Exception as e:
-        print("failed to retrieve data:", e)
-        return {"gdf": None, "error": str(e)}
-
-
-
-
-def get_data_search(column):
-    if not column:
-        print("no column matched")
-        return {"gdf": None, "error": "no appropriate column"}
-
-    sql = f"SELECT {column}, borocode, large_n, geom FROM public.street_block"
-    print("column:", column)
-
-    try:
-        gdf = gpd.read_postgis(sql, con=engine, geom_col="geom")
-        print("data retrieved from db")
-        return {"gdf": gdf, "error": None}
-    except Exception as e:
-        print("failed to retrieve data:", e)
-        return {"gdf": None, "error": str(e)}
-
-def get_data_search_final(column, scale, neighborhood):
-    if not column:
-        print("no column matched")
-        return {"gdf": None, "error": "no appropriate column"}
-    if not scale or neighborhood is None:
-        print("missing scale or neighborhood")
-        return {"gdf": None, "error": "missing scale or neighborhood"}
-    
-    if scale == "borough":
-        neighborhood = int(neighborhood)
-
-    params = None
-
-    if scale == "large_n":
-        sql = f"SELECT {column}, large_n, small_n, geom FROM public.buildings WHERE large_n = %s"
-        params = (neighborhood,)
-        print("column:", column, "scale:", scale, "neighborhood:", neighborhood)
-    elif scale == "borough":
-        sql = f"SELECT {column}, borocode, large_n, geom FROM public.street_block WHERE borocode = %s"
-        params = (neighborhood,)
-        print("column:", column, "scale:", scale, "neighborhood:", neighborhood)
+# PostGIS is optional when serving from the snapshot backend
+engine = create_engine(DB_URL) if DB_URL else None
+
+
+def _log_sql(sql, params):
+    if SQL_DEBUG:
+        print("sql:", sql, "params:", params)
+
+
+def _execute_prepared(conn, compiled):
+    # prepared names live as long as the DBAPI connection, tracked in the pool record's info
+    prepared = conn.connection.info.setdefault("prepared", set())
+    name = compiled["name"]
+    if name not in prepared:
+        conn.exec_driver_sql(f"PREPARE {name} AS {compiled['prepared_sql']}")
+        conn.commit()
+        prepared.add(name)
+        if SQL_DEBUG:
+            print("prepared statement:", name, "on connection", id(conn.connection.dbapi_connection))
+    args = ", ".join(f"%({k})s" for k in compiled["params"])
+    sql = f"EXECUTE {name}({args})" if args else f"EXECUTE {name}"
+    return gpd.read_postgis(sql, con=conn, geom_col="geom", params=compiled["params"])
+
+
+def fetch_compiled(compiled):
+    """Run a compiled plan through its per-connection prepared statement."""
+    _log_sql(compiled["sql"], compiled["params"])
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        try:
+            gdf = _execute_prepared(conn, compiled)
+        except Exception as e:
+            if "does not exist" not in str(e) or "prepared statement" not in str(e):
+                raise
+            # server-side state was lost (e.g. connection reset); prepare again once
+            conn.rollback()
+            conn.connection.info["prepared"] = set()
+            gdf = _execute_prepared(conn, compiled)
+    metrics.record_query(compiled, (time.perf_counter() - start) * 1000, "postgis")
+    print("data retrieved from db")
+    gdf, memory = compact_frame(gdf, compiled["table"])
+    return {"gdf": gdf, "error": None, "memory": memory}
+
+
+def fetch_frame(compiled):
+    """Attribute-only fetch for a compiled frame; plain DataFrame, no geometry."""
+    _log_sql(compiled["sql"], compiled["params"])
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        df = pd.read_sql(compiled["sql"], con=conn, params=compiled["params"])
+    metrics.record_query(compiled, (time.perf_counter() - start) * 1000, "postgis")
+    df, memory = compact_frame(df, compiled["table"])
+    return {"gdf": df, "error": None, "memory": memory}
+
+
+def estimate(conn, compiled):
+    """Planner row and width estimate for a compiled statement, without running it."""
+    raw = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled['sql']}", compiled["params"]).scalar()
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+    return plan["Plan Rows"], plan["Plan Width"]
+
+
+def dissolve_small_n():
+    """Street blocks unioned per small_n; only run when the region polygons are (re)built."""
+    sql = ("SELECT small_n, ST_Multi(ST_Union(geom)) AS geom FROM public.street_block "
+           "WHERE small_n IS NOT NULL GROUP BY small_n")
+    return gpd.read_postgis(sql, con=engine, geom_col="geom")
+
+
+def fetch_aggregated(conn, compiled, level):
+    """One grouped pass per region plus the overall row the summary is built from; also returns the SQL."""
+    col = compiled["column"]
+    table = compiled["table"]
+    where = compiled["where_sql"]
+    if dtype_map(table).get(col) == "numeric":
+        spread = ", ".join(f"percentile_cont({q}) WITHIN GROUP (ORDER BY {col}) AS {k}"
+                           for k, q in PERCENTILES.items())
+        sql = (
+            f"SELECT {level}, count({col}) AS count, avg({col}) AS mean, "
+            f"percentile_cont(0.5) WITHIN GROUP (ORDER BY {col}) AS median, "
+            f"min({col}) AS min, max({col}) AS max, {spread}, GROUPING({level}) AS is_total "
+            f"FROM public.{table} WHERE {where} "
+            f"GROUP BY GROUPING SETS (({level}), ())"
+        )
+        _log_sql(sql, compiled["params"])
+        df = pd.read_sql(sql, con=conn, params=compiled["params"])
+        total = df[df["is_total"] == 1].iloc[0]
+        groups = (df[(df["is_total"] == 0) & df[level].notna()]
+                  .drop(columns=["is_total", *PERCENTILES]).rename(columns={"mean": col}))
+        stats = numeric_stats(total)
     else:
-        print("unsupported scale:", scale)
-        return {"gdf": None, "error": f"unsupported scale: {scale}"}
-
-    try:
-        gdf = gpd.read_postgis(sql, con=engine, geom_col="geom", params=params)
-        print("data retrieved from db")
-        return {"gdf": gdf, "error": None}
-    except Exception as e:
-        print("failed to retrieve data:", e)
-        return {"gdf": None, "error": str(e)}
-    
-
-
-def get_data_compare(column, scale, table, region1, region2, filters):
-    if not column or column == "NO_MATCH":
-        print("no column matched")
-        return {"gdf": None, "error": "no appropriate column"}
-
-    base_table = f"public.{table}"
-    params = {}
-
-    if scale == "borough":
-        region_clause = "borocode IN (%(r1)s, %(r2)s)"
-        region = "borocode"
-        params["r1"] = region1
-        params["r2"] = region2
-    elif scale == "large_n":
-        region_clause = "large_n IN (%(r1)s, %(r2)s)"
-        region = "large_n"
-        params["r1"] = region1
-        params["r2"] = region2
-    else:
-        print("invalid scale:", scale)
-        return {"gdf": None, "error": f"invalid scale: {scale}"}
-
-    where_parts = [region_clause]
-
-    if filters:
-        for i, (col, op, val) in enumerate(filters):
-            if val == "NO_MATCH":
-                continue
-            key = f"v{i}"
-            where_parts.append(f"{col} {op} %({key})s")
-            params[key] = val
-
-    where_sql = " AND ".join(where_parts)
-
-    sql = f"SELECT {column}, {region}, geom FROM {base_table} WHERE {where_sql}"
-    print("sql:", sql, "params:", params)
-
+        sql = (
+            f"SELECT {level}, {col} AS value, count(*) AS n, GROUPING({level}) AS is_total "
+            f"FROM public.{table} WHERE {where} AND {col} IS NOT NULL "
+            f"GROUP BY GROUPING SETS (({level}, {col}), ({col}))"
+        )
+        _log_sql(sql, compiled["params"])
+        df = pd.read_sql(sql, con=conn, params=compiled["params"])
+        totals = df[df["is_total"] == 1]
+        groups, stats = categorical_groups(
+            df[df["is_total"] == 0], pd.Series(totals["n"].to_numpy(), index=totals["value"]), level, col
+        )
+    return attach(groups, level, dissolve_small_n), stats, sql
+
+
+def fetch_sample(conn, compiled, decision):
+    col = compiled["column"]
+    where = compiled["where_sql"]
+    table = compiled["table"]
+    sql = (f"SELECT {', '.join(compiled['columns'])}, geom FROM public.{table} "
+           f"TABLESAMPLE BERNOULLI ({sample_fraction(decision):.6f}) WHERE {where} LIMIT {decision['sample_rows']}")
+    _log_sql(sql, compiled["params"])
+    gdf = gpd.read_postgis(sql, con=conn, geom_col="geom", params=compiled["params"])
+    # category counts stay exact; only the geometry is sampled
+    counts = pd.read_sql(
+        f"SELECT {col} AS value, count(*) AS n FROM public.{table} WHERE {where} AND {col} IS NOT NULL "
+        f"GROUP BY {col} ORDER BY n DESC",
+        con=conn, params=compiled["params"],
+    )
+    stats = {"count": int(counts["n"].sum()), "counts": pd.Series(counts["n"].to_numpy(), index=counts["value"])}
+    return gdf, stats, sql
+
+
+def fetch_hex(conn, compiled):
+    """Bin feature centroids into H3 cells; PostGIS returns lng/lat only, not the geometry. Also returns the SQL."""
+    col = compiled["column"]
+    sql = (
+        f"SELECT {col}, ST_X(c) AS lng, ST_Y(c) AS lat FROM ("
+        f"SELECT {col}, ST_Transform(ST_Centroid(geom), 4326) AS c "
+        f"FROM public.{compiled['table']} WHERE {compiled['where_sql']}) s"
+    )
+    _log_sql(sql, compiled["params"])
+    df = pd.read_sql(sql, con=conn, params=compiled["params"])
+    crs = conn.exec_driver_sql(
+        f"SELECT Find_SRID('public', '{compiled['table']}', 'geom')"
+    ).scalar()
+    cells = hexgrid.cells_from_points(df["lng"].to_numpy(dtype=float, na_value=np.nan),
+                                      df["lat"].to_numpy(dtype=float, na_value=np.nan),
+                                      compiled["h3_resolution"])
+    numeric = dtype_map(compiled["table"]).get(col) == "numeric"
+    return (*hexgrid.aggregate_cells(cells, df[col], col, numeric, crs or None), sql)
+
+
+def fetch_region_aggregate(compiled):
+    """Fetch a compiled plan aggregated per region (or H3 cell) at its requested level."""
+    start = time.perf_counter()
+    level = compiled["aggregate_level"]
+    with engine.connect() as conn:
+        if level == hexgrid.LEVEL:
+            gdf, stats, sql = fetch_hex(conn, compiled)
+        else:
+            gdf, stats, sql = fetch_aggregated(conn, compiled, level)
+    metrics.incr(f"aggregate.{level}")
+    metrics.record_query(compiled, (time.perf_counter() - start) * 1000, "postgis", kind=f"aggregate_{level}", sql=sql)
+    gdf, memory = compact_frame(gdf, compiled["table"])
+    aggregate = {"level": level, "groups": len(gdf)}
+    if "h3_resolution" in compiled:
+        aggregate["resolution"] = compiled["h3_resolution"]
+    return {"gdf": gdf, "error": None, "memory": memory, "aggregate": aggregate, "stats": stats}
+
+
+def fetch_guarded(compiled):
+    """Fetch a compiled plan, downgrading to an aggregate or a sample when it is too large to ship."""
+    if compiled.get("aggregate_level"):
+        return fetch_region_aggregate(compiled)
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        rows, width = estimate(conn, compiled)
+        decision = decide(compiled, rows, width)
+        if decision is None:
+            conn.rollback()
+        elif decision["applied"] == "aggregate":
+            gdf, stats, sql = fetch_aggregated(conn, compiled, decision["level"])
+        else:
+            gdf, stats, sql = fetch_sample(conn, compiled, decision)
+    if decision is None:
+        return fetch_compiled(compiled)
+
+    metrics.incr(f"guardrail.{decision['applied']}")
+    kind = f"aggregate_{decision['level']}" if decision["applied"] == "aggregate" else "sample"
+    metrics.record_query(compiled, (time.perf_counter() - start) * 1000, "postgis", kind=kind, sql=sql)
+    gdf, memory = compact_frame(gdf, compiled["table"])
+    result = {"gdf": gdf, "error": None, "memory": memory, "downgrade": decision, "stats": stats}
+    if decision["applied"] == "aggregate":
+        result["aggregate"] = {"level": decision["level"], "groups": len(gdf)}
+    return result
+
+
+def data_stamp():
+    """The ETL's data version from DATA_VERSION_SQL, or None when it is not configured or unreadable."""
+    if not DATA_VERSION_SQL or engine is None:
+        return None
     try:
-        gdf = gpd.read_postgis(sql, con=engine, geom_col="geom", params=params)
-        print("data retrieved from db")
-        return {"gdf": gdf, "error": None}
+        with engine.connect() as conn:
+            value = conn.exec_driver_sql(DATA_VERSION_SQL).scalar()
     except Exception as e:
-        print("failed to retrieve data:", e)
-        return {"gdf": None, "error": str(e)}
+        print("[db] data version not read:", e)
+        return None
+    return None if value is None else str(value)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from .llm.llm_prompt import SCHEMA_TABLES
+
+TRUE_VALUES = {"true", "t", "1", "yes"}
+FALSE_VALUES = {"false", "f", "0", "no"}
+
+
+def dtype_map(table: str) -> dict:
+    """Storage kind per column, derived from the schema: category, bool or numeric."""
+    spec = SCHEMA_TABLES.get(table)
+    if spec is None:
+        return {}
+    kinds = {"borocode": "numeric", "large_n": "category", "small_n": "category"}
+    for col, desc in spec["cat"].items():
+        kinds[col] = "bool" if desc and desc.startswith("boolean") else "category"
+    for col in spec["num"]:
+        kinds[col] = "numeric"
+    for col in ("shape_area", "shape_leng"):
+        if col in spec["spine"]:
+            kinds[col] = "numeric"
+    return kinds
+
+
+def _downcast(s: pd.Series) -> pd.Series:
+    if not pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s):
+        return s
+    values = s.to_numpy()
+    if not np.issubdtype(values.dtype, np.floating):
+        return pd.to_numeric(s, downcast="integer")
+    finite = values[~np.isnan(values)]
+    if len(finite) == len(values) and np.array_equal(finite, np.round(finite)):
+        return pd.to_numeric(s, downcast="integer")
+    as32 = values.astype(np.float32)
+    if np.array_equal(as32.astype(np.float64), values, equal_nan=True):
+        return pd.Series(as32, index=s.index, name=s.name)
+    return s
+
+
+def _to_bool(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(s) or s.isna().any():
+        return s
+    text = s.astype(str).str.strip().str.lower()
+    if not text.isin(TRUE_VALUES | FALSE_VALUES).all():
+        return s
+    return text.isin(TRUE_VALUES)
+
+
+def frame_memory(df) -> int:
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def compact_frame(gdf, table: str):
+    """Convert fetched columns to compact dtypes in place; returns the frame and its memory before/after."""
+    before = frame_memory(gdf)
+    for col, kind in dtype_map(table).items():
+        if col not in gdf.columns:
+            continue
+        s = gdf[col]
+        if kind == "category":
+            gdf[col] = s.astype("category")
+        elif kind == "bool":
+            gdf[col] = _to_bool(s)
+        else:
+            gdf[col] = _downcast(s)
+    after = frame_memory(gdf)
+    print("[dtypes]", table, "rows:", len(gdf), "memory:", before, "->", after, "bytes")
+    return gdf, {"before_bytes": before, "after_bytes": after}
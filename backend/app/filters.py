@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+LOWER_OPS = {">", ">="}
+UPPER_OPS = {"<", "<="}
+
+
+def active_filters(filters):
+    return [(col, op, val) for col, op, val in filters or [] if val != "NO_MATCH"]
+
+
+def _number(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _coerce(series: pd.Series, val):
+    if pd.api.types.is_bool_dtype(series):
+        return str(val).strip().lower() in ("true", "t", "1", "yes")
+    if pd.api.types.is_numeric_dtype(series):
+        return float(val)
+    return val
+
+
+def filter_mask(df: pd.DataFrame, filters) -> np.ndarray:
+    """Vectorised equivalent of the SQL WHERE clause built from plan filters."""
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, val in active_filters(filters):
+        s = df[col]
+        v = _coerce(s, val)
+        if isinstance(s.dtype, pd.CategoricalDtype) and op != "=":
+            s = s.astype(object)
+        if op == "=":
+            m = s == v
+        elif op == ">":
+            m = s > v
+        elif op == ">=":
+            m = s >= v
+        elif op == "<":
+            m = s < v
+        elif op == "<=":
+            m = s <= v
+        else:
+            raise ValueError(f"unsupported op: {op}")
+        mask &= np.asarray(m.fillna(False), dtype=bool)
+    return mask
+
+
+def implies(new, old) -> bool:
+    """True when every row passing filter `new` also passes filter `old`."""
+    new_col, new_op, new_val = new
+    old_col, old_op, old_val = old
+    if new_col != old_col:
+        return False
+
+    if old_op == "=":
+        if new_op != "=":
+            return False
+        a, b = _number(new_val), _number(old_val)
+        if a is not None and b is not None:
+            return a == b
+        return str(new_val) == str(old_val)
+
+    a, b = _number(new_val), _number(old_val)
+    if a is None or b is None:
+        return False
+    if old_op in LOWER_OPS:
+        if new_op not in LOWER_OPS and new_op != "=":
+            return False
+        if old_op == ">" and new_op != ">":
+            return a > b
+        return a >= b
+    if old_op in UPPER_OPS:
+        if new_op not in UPPER_OPS and new_op != "=":
+            return False
+        if old_op == "<" and new_op != "<":
+            return a < b
+        return a <= b
+    return False
+
+
+def is_refinement(new_filters, old_filters) -> bool:
+    """True when the rows selected by `new_filters` are a subset of those of `old_filters`."""
+    new_active = active_filters(new_filters)
+    return all(any(implies(n, o) for n in new_active) for o in active_filters(old_filters))
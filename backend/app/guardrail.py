@@ -0,0 +1,28 @@
+from .dtypes import dtype_map
+from .config import GUARD_MAX_ROWS, GUARD_MAX_BYTES, GUARD_SAMPLE_ROWS, GUARD_AGGREGATE_LEVEL
+
+
+def decide(compiled: dict, rows: int, width: int):
+    """Pick a downgrade for an oversized result, or None when it fits the limits."""
+    est_bytes = int(rows) * int(width)
+    if rows <= GUARD_MAX_ROWS and est_bytes <= GUARD_MAX_BYTES:
+        return None
+
+    decision = {
+        "estimated_rows": int(rows),
+        "estimated_bytes": est_bytes,
+        "max_rows": GUARD_MAX_ROWS,
+        "max_bytes": GUARD_MAX_BYTES,
+    }
+    if dtype_map(compiled["table"]).get(compiled["column"]) == "numeric":
+        decision.update({"applied": "aggregate", "level": GUARD_AGGREGATE_LEVEL})
+    else:
+        decision.update({"applied": "sample", "sample_rows": GUARD_SAMPLE_ROWS})
+    print("[guardrail] downgrade:", decision)
+    return decision
+
+
+def sample_fraction(decision: dict) -> float:
+    """Bernoulli percentage that should yield about sample_rows of the estimated rows."""
+    return min(100.0, 120.0 * decision["sample_rows"] / max(decision["estimated_rows"], 1))
+
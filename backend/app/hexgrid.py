@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from .aggregate import numeric_stats, categorical_groups, percentiles
+
+LEVEL = "h3"
+
+
+def _h3():
+    # h3 is only needed for hex-grid output
+    import h3
+    return h3
+
+
+def available() -> bool:
+    try:
+        _h3()
+    except ImportError:
+        return False
+    return True
+
+
+def centroids_lnglat(geoms, crs):
+    """Longitude/latitude arrays of the centroid of each geometry."""
+    pts = gpd.GeoSeries(geoms, crs=crs)
+    if crs is not None and not pts.crs.is_geographic:
+        pts = pts.centroid.to_crs(4326)
+    else:
+        pts = pts.centroid
+    return shapely.get_x(pts.values), shapely.get_y(pts.values)
+
+
+def cells_from_points(lng, lat, res: int) -> np.ndarray:
+    """H3 cell ids as uint64, 0 where the point is missing."""
+    h3 = _h3()
+    out = np.zeros(len(lng), dtype=np.uint64)
+    ok = np.flatnonzero(np.isfinite(lng) & np.isfinite(lat))
+    for i in ok:
+        out[i] = h3.str_to_int(h3.latlng_to_cell(lat[i], lng[i], res))
+    return out
+
+
+def cells_for_geometries(geoms, crs, res: int) -> np.ndarray:
+    lng, lat = centroids_lnglat(geoms, crs)
+    return cells_from_points(lng, lat, res)
+
+
+def cell_frame(groups: pd.DataFrame, crs) -> gpd.GeoDataFrame:
+    """Per-cell aggregates with the hexagon outline as geometry, in the source CRS."""
+    h3 = _h3()
+    ids = [h3.int_to_str(int(c)) for c in groups[LEVEL]]
+    # cell_to_boundary returns (lat, lng) pairs
+    shapes = [shapely.Polygon([(lng, lat) for lat, lng in h3.cell_to_boundary(c)]) for c in ids]
+    gdf = gpd.GeoDataFrame(groups.assign(**{LEVEL: ids}), geometry=shapes, crs=4326).rename_geometry("geom")
+    if crs is not None:
+        gdf = gdf.to_crs(crs)
+    return gdf
+
+
+def aggregate_cells(cells: np.ndarray, values: pd.Series, col: str, numeric: bool, crs):
+    """Group values per H3 cell in one pass; overall statistics cover every selected row."""
+    values = values.reset_index(drop=True)
+    df = pd.DataFrame({LEVEL: cells, col: values})
+    df = df[df[LEVEL] != 0]
+    if numeric:
+        groups = df.groupby(LEVEL)[col].agg(["count", "mean", "median", "min", "max"]).reset_index()
+        groups = groups[groups["count"] > 0].rename(columns={"mean": col})
+        valid = values.dropna()
+        stats = numeric_stats({
+            "count": len(valid),
+            "mean": valid.mean() if len(valid) else None,
+            "median": valid.median() if len(valid) else None,
+            "min": valid.min() if len(valid) else None,
+            "max": valid.max() if len(valid) else None,
+            **percentiles(valid),
+        })
+    else:
+        parts = (df.dropna(subset=[col]).groupby([LEVEL, col], observed=True).size()
+                 .reset_index(name="n").rename(columns={col: "value"}))
+        groups, stats = categorical_groups(parts, values.value_counts(), LEVEL, col)
+    return cell_frame(groups, crs), stats
@@ -0,0 +1,133 @@
+import argparse
+
+from sqlalchemy import text
+
+from .llm.llm_prompt import SCHEMA_TABLES
+from .metrics import load_queries
+from .config import BRIN_MIN_CORRELATION, SQL_DEBUG
+
+REGION_COLS = ("borocode", "large_n", "small_n")
+
+INDEX_SQL = """
+SELECT t.relname AS table_name, i.relname AS index_name, am.amname AS method,
+       array_agg(a.attname ORDER BY k.ord) AS columns
+FROM pg_index x
+JOIN pg_class t ON t.oid = x.indrelid
+JOIN pg_class i ON i.oid = x.indexrelid
+JOIN pg_am am ON am.oid = i.relam
+JOIN pg_namespace n ON n.oid = t.relnamespace
+CROSS JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, ord)
+JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+WHERE n.nspname = 'public' AND t.relname = ANY(:tables)
+GROUP BY t.relname, i.relname, am.amname
+"""
+
+STATS_SQL = """
+SELECT tablename, attname, correlation
+FROM pg_stats
+WHERE schemaname = 'public' AND tablename = ANY(:tables)
+"""
+
+
+def inspect(engine) -> dict:
+    """Existing indexes per table as {table: [(method, leading column), ...]} plus column correlations."""
+    tables = list(SCHEMA_TABLES)
+    indexes = {t: [] for t in tables}
+    correlation = {}
+    with engine.connect() as conn:
+        for row in conn.execute(text(INDEX_SQL), {"tables": tables}):
+            indexes[row.table_name].append((row.method, row.columns[0], row.index_name))
+        for row in conn.execute(text(STATS_SQL), {"tables": tables}):
+            correlation[(row.tablename, row.attname)] = row.correlation
+    return {"indexes": indexes, "correlation": correlation}
+
+
+def advise(state: dict, queries=None) -> list:
+    """Missing btree/GIST indexes and BRIN candidates, ranked by how often their column is filtered."""
+    filter_hits = {}
+    for q in queries or []:
+        for col in q.get("filter_columns", []):
+            key = (q["table"], col)
+            filter_hits[key] = filter_hits.get(key, 0) + q["count"]
+
+    advice = []
+    for table, spec in SCHEMA_TABLES.items():
+        leading = {(method, col) for method, col, _ in state["indexes"].get(table, [])}
+        indexed = {col for _, col in leading}
+
+        for col in REGION_COLS:
+            if col in spec["spine"] and ("btree", col) not in leading:
+                advice.append({
+                    "table": table, "column": col, "method": "btree", "reason": "region predicate",
+                    "hits": filter_hits.get((table, col), 0),
+                })
+        if ("gist", "geom") not in leading and ("spgist", "geom") not in leading:
+            advice.append({"table": table, "column": "geom", "method": "gist", "reason": "spatial index", "hits": 0})
+
+        for col in spec["num"]:
+            if col in indexed:
+                continue
+            corr = state["correlation"].get((table, col))
+            if corr is not None and abs(corr) >= BRIN_MIN_CORRELATION:
+                advice.append({
+                    "table": table, "column": col, "method": "brin",
+                    "reason": f"range predicate, correlation {corr:.2f}",
+                    "hits": filter_hits.get((table, col), 0),
+                })
+
+    for a in advice:
+        a["sql"] = (
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{a['table']}_{a['column']}_{a['method']} "
+            f"ON public.{a['table']} USING {a['method']} ({a['column']})"
+        )
+    return sorted(advice, key=lambda a: a["hits"], reverse=True)
+
+
+def apply(engine, advice: list):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for a in advice:
+            print("[index_advisor] creating:", a["sql"])
+            conn.exec_driver_sql(a["sql"])
+        conn.exec_driver_sql("ANALYZE " + ", ".join(f"public.{t}" for t in SCHEMA_TABLES))
+
+
+def explain_top(engine, queries: list, n: int = 5):
+    """Log EXPLAIN (ANALYZE, BUFFERS) for the statements seen most often in the metrics."""
+    for q in [q for q in queries if q.get("backend") == "postgis"][:n]:
+        print(f"[index_advisor] {q['name']} seen {q['count']}x, avg {q['total_ms'] / q['count']:.1f} ms")
+        if SQL_DEBUG:
+            print("[index_advisor] sql:", q["sql"], "params:", q.get("params"))
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {q['sql']}", q.get("params") or {})
+            for (line,) in rows:
+                print("   ", line)
+            conn.rollback()
+
+
+def run(mode: str = "report", explain: int = 0):
+    from .db import engine
+
+    if engine is None:
+        print("[index_advisor] db_url not set, skipping")
+        return []
+    queries = load_queries()
+    advice = advise(inspect(engine), queries)
+    if not advice:
+        print("[index_advisor] no missing indexes")
+    for a in advice:
+        print(f"[index_advisor] missing {a['method']} on {a['table']}.{a['column']} ({a['reason']}, hits={a['hits']})")
+    if mode == "apply" and advice:
+        apply(engine, advice)
+    if explain:
+        explain_top(engine, queries, explain)
+    return advice
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report or create indexes for hot query predicates.")
+    parser.add_argument("--apply", action="store_true", help="create the missing indexes")
+    parser.add_argument("--explain", type=int, default=0, metavar="N",
+                        help="log EXPLAIN (ANALYZE, BUFFERS) for the N most frequent statements")
+    args = parser.parse_args()
+    run("apply" if args.apply else "report", args.explain)
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+from contextlib import contextmanager
+
+from .modes.services import run, public_result
+from .modes.batch import run_batch
+from .progress import reporting, stage
+from .responses import dumps, RawJSON
+from .metrics import metrics
+from .config import JOBS_DB, JOB_WORKERS, JOB_LIMITS, JOB_BUDGET_S, JOB_TTL_S, JOB_STALE_S, JOB_POLL_S
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        class TEXT NOT NULL,
+        status TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        stages TEXT NOT NULL DEFAULT '[]',
+        progress TEXT,
+        result TEXT,
+        error TEXT,
+        created REAL NOT NULL,
+        started REAL,
+        updated REAL NOT NULL,
+        finished REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, class, created)",
+)
+SWEEP_S = 60
+
+
+class JobQueue:
+    """Jobs in a SQLite file shared by every worker process.
+
+    Each process runs JOB_WORKERS threads that claim queued jobs in creation
+    order, as long as fewer than JOB_LIMITS[class] jobs of that class are running
+    anywhere. Pipeline stages reported through progress.stage() are appended to
+    the job, a heartbeat keeps a running job from being swept as lost, and
+    finished jobs are deleted after JOB_TTL_S.
+    """
+
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ready = False
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_sweep = 0.0
+
+    @contextmanager
+    def _connect(self):
+        # autocommit; _claim opens its own write transaction
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init(self):
+        with self._lock:
+            if self._ready:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                for sql in SCHEMA:
+                    conn.execute(sql)
+            self._ready = True
+
+    def submit(self, job_class: str, payload: dict) -> dict:
+        if job_class not in JOB_LIMITS:
+            raise ValueError(f"unknown job class: {job_class}")
+        self._init()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, class, status, payload, created, updated) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, job_class, json.dumps(payload), now, now),
+            )
+        metrics.incr(f"jobs.{job_class}.submitted")
+        print("[jobs] queued", job_class, job_id)
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        """Job status, stages and result; None when unknown or expired."""
+        self._init()
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["finished"] is not None and time.time() - row["finished"] > JOB_TTL_S:
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                return None
+            ahead = None
+            if row["status"] == "queued":
+                ahead = conn.execute(
+                    "SELECT count(*) FROM jobs WHERE status = 'queued' AND class = ? AND created < ?",
+                    (row["class"], row["created"]),
+                ).fetchone()[0]
+        return {
+            "id": row["id"],
+            "class": row["class"],
+            "status": row["status"],
+            "queued_ahead": ahead,
+            "stages": json.loads(row["stages"]),
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+            # stored serialized; spliced into the response without parsing
+            "result": RawJSON(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created": row["created"],
+            "started": row["started"],
+            "finished": row["finished"],
+            "expires": row["finished"] + JOB_TTL_S if row["finished"] is not None else None,
+        }
+
+    def _claim(self):
+        """Atomically move the oldest queued job of a class below its limit to running."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                running = dict(conn.execute(
+                    "SELECT class, count(*) FROM jobs WHERE status = 'running' GROUP BY class"
+                ).fetchall())
+                open_classes = [c for c, limit in JOB_LIMITS.items() if running.get(c, 0) < limit]
+                row = None
+                if open_classes:
+                    marks = ", ".join("?" for _ in open_classes)
+                    row = conn.execute(
+                        f"SELECT id, class, payload FROM jobs WHERE status = 'queued' AND class IN ({marks}) "
+                        f"ORDER BY created LIMIT 1",
+                        open_classes,
+                    ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', started = ?, updated = ? WHERE id = ?",
+                        (now, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _report(self, job_id: str, name: str, **info):
+        now = time.time()
+        with self._connect() as conn:
+            if info:
+                conn.execute("UPDATE jobs SET progress = ?, updated = ? WHERE id = ?",
+                             (json.dumps(info), now, job_id))
+            else:
+                conn.execute(
+                    "UPDATE jobs SET stages = json_insert(stages, '$[#]', json(?)), updated = ? WHERE id = ?",
+                    (json.dumps({"stage": name, "at": round(now, 3)}), now, job_id),
+                )
+
+    def _finish(self, job_id: str, result=None, error=None) -> bool:
+        """Record the outcome; False when the job is no longer ours (the sweep already failed it)."""
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, updated = ? "
+                "WHERE id = ? AND status = 'running'",
+                ("failed" if error else "done", result, error, now, now, job_id),
+            ).rowcount
+        if not updated:
+            print("[jobs] result dropped, job no longer running:", job_id)
+        return bool(updated)
+
+    def _heartbeat(self, job_id: str, done: threading.Event):
+        # stages can be minutes apart (a long fetch), so liveness is reported separately
+        while not done.wait(max(JOB_STALE_S / 3, 1.0)):
+            try:
+                with self._connect() as conn:
+                    conn.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'",
+                                 (time.time(), job_id))
+            except sqlite3.Error as e:
+                print("[jobs] heartbeat failed:", job_id, e)
+
+    def _execute(self, job_class: str, payload: dict) -> bytes:
+        if job_class == "batch":
+            items = []
+            total = len(payload["queries"])
+            for item in run_batch(payload["queries"], payload.get("explain", "llm")):
+                items.append(item)
+                stage("items", done=len(items), total=total)
+            return dumps({"items": sorted(items, key=lambda i: i["index"])})
+
+        result = run(payload["query"], session_id=payload.get("session_id"), history=payload.get("history"),
+                     level=payload.get("level"), stat=payload.get("stat"), explain=payload.get("explain", "llm"),
+                     budget_s=JOB_BUDGET_S)
+        body = public_result(result)
+        if body.get("result_url"):
+            # the map data is fetched from the result resource instead of living in the job row
+            body["geojson"] = None
+        return dumps(body)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                self._sweep()
+                row = self._claim()
+            except sqlite3.Error as e:
+                print("[jobs] queue error:", e)
+                self._stop.wait(JOB_POLL_S)
+                continue
+            if row is None:
+                self._stop.wait(JOB_POLL_S)
+                continue
+
+            job_id, job_class = row["id"], row["class"]
+            print("[jobs] running", job_class, job_id)
+            start = time.perf_counter()
+            alive = threading.Event()
+            threading.Thread(target=self._heartbeat, args=(job_id, alive), name=f"job-beat-{job_id[:8]}",
+                             daemon=True).start()
+            try:
+                with reporting(lambda name, **info: self._report(job_id, name, **info)):
+                    result = self._execute(job_class, json.loads(row["payload"]))
+                if self._finish(job_id, result=result.decode("utf-8")):
+                    metrics.incr(f"jobs.{job_class}.done")
+            except Exception as e:
+                print("[jobs] failed", job_id, e)
+                traceback.print_exc()
+                self._finish(job_id, error=f"internal server error: {e}")
+                metrics.incr(f"jobs.{job_class}.failed")
+            finally:
+                alive.set()
+            metrics.observe(f"jobs.{job_class}", (time.perf_counter() - start) * 1000)
+
+    def _sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < SWEEP_S:
+                return
+            self._last_sweep = now
+        with self._connect() as conn:
+            expired = conn.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?",
+                                   (now - JOB_TTL_S,)).rowcount
+            # the process running these went away without finishing them
+            lost = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'worker lost', finished = ?, updated = ? "
+                "WHERE status = 'running' AND updated < ?",
+                (now, now, now - JOB_STALE_S),
+            ).rowcount
+        if expired or lost:
+            print("[jobs] sweep: expired", expired, "lost", lost)
+
+    def start(self):
+        self._init()
+        self._stop.clear()
+        for i in range(JOB_WORKERS):
+            t = threading.Thread(target=self._work, name=f"job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        print("[jobs] started", JOB_WORKERS, "workers on", self.path)
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+
+jobs = JobQueue()
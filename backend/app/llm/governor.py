@@ -0,0 +1,174 @@
+import math
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from ..metrics import metrics
+from ..config import LLM_CONCURRENCY, LLM_TPM_BUDGET, LLM_EST_OUTPUT_TOKENS, LLM_DEFAULT_LATENCY_MS
+
+# lower runs first: a request cannot finish without its plans, while an explanation is optional;
+# batch work yields to both interactive kinds
+PLAN = 0
+EXPLAIN = 1
+BATCH = 2
+
+WINDOW_S = 60.0
+
+_deadline = ContextVar("llm_deadline", default=None)
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing an LLM call that could not start within the request's budget."""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+@contextmanager
+def deadline(budget_s):
+    """Latency budget for every LLM call made in this context; None or <= 0 disables admission control."""
+    token = _deadline.set(time.monotonic() + budget_s if budget_s and budget_s > 0 else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_s():
+    """Seconds left in the current request's budget, or None without one."""
+    due = _deadline.get()
+    return None if due is None else due - time.monotonic()
+
+
+def estimate_tokens(messages) -> int:
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return chars // 4 + LLM_EST_OUTPUT_TOKENS
+
+
+class Governor:
+    """Bounded LLM concurrency, a tokens-per-minute budget and a priority queue in front of both.
+
+    A call is admitted only if its expected queue wait fits the caller's deadline;
+    otherwise it fails fast with Overloaded (429 when the token budget is the
+    bottleneck, 503 when every slot is busy).
+    """
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, tpm: int = LLM_TPM_BUDGET):
+        self.concurrency = max(1, concurrency)
+        self.tpm = tpm
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._reserved = 0
+        self._window = deque()
+
+    def _window_tokens(self, now: float) -> int:
+        while self._window and now - self._window[0][0] >= WINDOW_S:
+            self._window.popleft()
+        return sum(n for _, n in self._window)
+
+    def _token_wait(self, need: int, now: float) -> float:
+        """Seconds until need more tokens fit in the rolling minute."""
+        if self.tpm <= 0:
+            return 0.0
+        excess = self._window_tokens(now) + self._reserved + min(need, self.tpm) - self.tpm
+        if excess <= 0:
+            return 0.0
+        for ts, n in self._window:
+            excess -= n
+            if excess <= 0:
+                return ts + WINDOW_S - now
+        # only in-flight reservations are left to free up
+        return self._latency_s()
+
+    def _latency_s(self) -> float:
+        p50 = metrics.percentile("llm.call", 0.5)
+        return (p50 if p50 is not None else LLM_DEFAULT_LATENCY_MS) / 1000
+
+    def _expected_wait(self, priority: int, need: int, now: float):
+        ahead = sum(1 for p, _ in self._queue if p <= priority)
+        busy = ahead + 1 - (self.concurrency - self._active)
+        slot_wait = math.ceil(busy / self.concurrency) * self._latency_s() if busy > 0 else 0.0
+        token_wait = self._token_wait(need, now)
+        if token_wait > slot_wait:
+            return token_wait, 429
+        return slot_wait, 503
+
+    def _can_start(self, entry, need: int, now: float) -> bool:
+        return (self._queue[0] == entry and self._active < self.concurrency
+                and self._token_wait(need, now) == 0.0)
+
+    def acquire(self, priority: int, need: int):
+        due = _deadline.get()
+        start = time.monotonic()
+        with self._cond:
+            wait_s, status = self._expected_wait(priority, need, start)
+            if due is not None and start + wait_s > due:
+                metrics.incr(f"governor.rejected.{status}")
+                raise Overloaded(status, f"LLM queue wait {wait_s:.1f}s exceeds the request budget", wait_s)
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            try:
+                while not self._can_start(entry, need, time.monotonic()):
+                    timeout = 1.0
+                    if due is not None:
+                        timeout = min(timeout, due - time.monotonic())
+                        if timeout <= 0:
+                            metrics.incr("governor.rejected.503")
+                            raise Overloaded(503, "request budget spent waiting for the LLM queue", self._latency_s())
+                    # the timeout also lets expired token-window entries free up budget
+                    self._cond.wait(timeout)
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self._active += 1
+            self._reserved += need
+            self._cond.notify_all()
+        metrics.observe(f"governor.wait.p{priority}", (time.monotonic() - start) * 1000)
+
+    def release(self, need: int, used):
+        with self._cond:
+            self._active -= 1
+            self._reserved -= need
+            self._window.append((time.monotonic(), int(used if used is not None else need)))
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int, messages):
+        """Hold one LLM slot; set usage["total"] on the yielded dict to charge actual tokens."""
+        need = estimate_tokens(messages)
+        self.acquire(priority, need)
+        usage = {}
+        start = time.perf_counter()
+        try:
+            yield usage
+        finally:
+            metrics.observe("llm.call", (time.perf_counter() - start) * 1000)
+            self.release(need, usage.get("total"))
+
+    def state(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "active": self._active,
+                "queued": len(self._queue),
+                "tokens_last_minute": self._window_tokens(now),
+                "reserved_tokens": self._reserved,
+                "concurrency": self.concurrency,
+                "tpm_budget": self.tpm,
+            }
+
+
+governor = Governor()
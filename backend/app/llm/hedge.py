@@ -0,0 +1,119 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from ..metrics import metrics
+from ..config import (
+    LLM_CONCURRENCY,
+    LLM_STAGE_TIMEOUTS,
+    HEDGE_ENABLED,
+    HEDGE_BUDGET,
+    HEDGE_MIN_DELAY_MS,
+    HEDGE_MIN_SAMPLES,
+)
+from .governor import Overloaded, remaining_s
+
+# attempts that lost a race keep running until the provider answers or times out
+_pool = ThreadPoolExecutor(max_workers=4 * LLM_CONCURRENCY, thread_name_prefix="llm")
+
+
+class Hedger:
+    """Per-stage timeouts plus one duplicate request after the stage's p95 latency.
+
+    Hedges are paid for from a credit that grows by HEDGE_BUDGET per call, so at
+    most that fraction of calls is ever duplicated.
+    """
+
+    def __init__(self, budget: float = HEDGE_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._credit = 1.0
+
+    def _earn(self):
+        with self._lock:
+            self._credit = min(self._credit + self.budget, 1.0 + 10 * self.budget)
+
+    def _spend(self) -> bool:
+        with self._lock:
+            if self._credit < 1.0:
+                return False
+            self._credit -= 1.0
+            return True
+
+    def timeout_s(self, stage: str) -> float:
+        timeout = LLM_STAGE_TIMEOUTS.get(stage, LLM_STAGE_TIMEOUTS["plan"])
+        left = remaining_s()
+        return timeout if left is None else max(0.0, min(timeout, left))
+
+    def delay_s(self, stage: str, timeout: float) -> float:
+        if metrics.count(f"llm.{stage}") < HEDGE_MIN_SAMPLES:
+            return timeout / 2
+        return max(HEDGE_MIN_DELAY_MS, metrics.percentile(f"llm.{stage}", 0.95)) / 1000
+
+    def run(self, stage: str, fn, tokens):
+        """Call fn(timeout) and return its result; tokens(result) reports what a losing attempt cost."""
+        self._earn()
+        start = time.monotonic()
+        timeout = self.timeout_s(stage)
+        # each attempt runs in a copy of the caller's context so it keeps the request deadline
+        primary = _pool.submit(contextvars.copy_context().run, fn, timeout)
+
+        def observe_primary(f):
+            # the hedge delay is the p95 of un-hedged latency: the primary's own time, whether or
+            # not it won, and calls that ran into the timeout counted at the timeout
+            elapsed = time.monotonic() - start
+            if f.cancelled():
+                return
+            if f.exception() is None or elapsed >= timeout:
+                metrics.observe(f"llm.{stage}", min(elapsed, timeout) * 1000)
+
+        primary.add_done_callback(observe_primary)
+        attempts = [primary]
+        hedge = None
+
+        done, _ = wait(attempts, timeout=min(self.delay_s(stage, timeout), timeout))
+        if not done and HEDGE_ENABLED and self._spend():
+            print(f"[hedge] {stage}: no answer after the p95 delay, firing a duplicate")
+            metrics.incr(f"hedge.{stage}.fired")
+            hedge = _pool.submit(contextvars.copy_context().run, fn, max(0.0, timeout - (time.monotonic() - start)))
+            attempts.append(hedge)
+
+        pending = list(attempts)
+        winner = None
+        first_error = None
+        while pending and winner is None:
+            left = timeout - (time.monotonic() - start)
+            done, _ = wait(pending, timeout=max(0.0, left), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for f in done:
+                pending.remove(f)
+                if f.exception() is None:
+                    winner = f
+                    break
+                if f is hedge and isinstance(f.exception(), Overloaded):
+                    # a hedge the governor would not admit is simply not fired
+                    continue
+                first_error = first_error or f.exception()
+
+        def charge(f):
+            if not f.cancelled() and f.exception() is None:
+                metrics.incr(f"hedge.{stage}.extra_tokens", tokens(f.result()))
+
+        for f in attempts:
+            if f is not winner and hedge is not None:
+                f.add_done_callback(charge)
+
+        if winner is None:
+            if first_error is not None and not pending:
+                raise first_error
+            metrics.incr(f"llm.{stage}.timeout")
+            raise TimeoutError(f"LLM {stage} call exceeded {timeout:.1f}s")
+
+        if winner is hedge:
+            metrics.incr(f"hedge.{stage}.won")
+        return winner.result()
+
+
+hedger = Hedger()
@@ -0,0 +1,150 @@
+import re
+import json
+
+FENCE = re.compile(r"```[A-Za-z]*\s*(.*?)```", re.S)
+# a JSON number, read whole so the e of an exponent is not taken for a bare word
+NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+LITERALS = {
+    "true": "true", "false": "false", "null": "null",
+    "True": "true", "False": "false", "None": "null",
+}
+
+
+def _first_object(text: str):
+    """The first balanced {...} in text, or everything from the first brace if it never closes."""
+    start = text.find("{")
+    if start == -1:
+        return None
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _number(token: str) -> str:
+    try:
+        json.loads(token)
+        return token
+    except ValueError:
+        # ".5", "1." and the like
+        return json.dumps(float(token))
+
+
+def _normalize(text: str) -> str:
+    """Rewrite common near-JSON into JSON: single quotes, bare words, Python literals, trailing commas."""
+    text = text.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'")
+    out = []
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c == '"':
+            j = i + 1
+            while j < n and text[j] != '"':
+                j += 2 if text[j] == "\\" else 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        elif c == "'":
+            j = i + 1
+            buf = []
+            while j < n and text[j] != "'":
+                if text[j] == "\\" and j + 1 < n:
+                    buf.append("'" if text[j + 1] == "'" else text[j:j + 2])
+                    j += 2
+                    continue
+                buf.append('\\"' if text[j] == '"' else text[j])
+                j += 1
+            out.append('"' + "".join(buf) + '"')
+            i = j + 1
+        elif c == ",":
+            k = i + 1
+            while k < n and text[k].isspace():
+                k += 1
+            if k == n or text[k] in "}]":
+                i += 1
+                continue
+            out.append(c)
+            i += 1
+        elif (c.isdigit() or c in "-.") and NUMBER.match(text, i):
+            j = NUMBER.match(text, i).end()
+            out.append(_number(text[i:j]))
+            i = j
+        elif c.isalpha() or c == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] in "_-"):
+                j += 1
+            word = text[i:j]
+            out.append(LITERALS.get(word, json.dumps(word)))
+            i = j
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+
+def _close(text: str) -> str:
+    """Append the closers a truncated object is missing."""
+    stack = []
+    in_str = False
+    escaped = False
+    for c in text:
+        if in_str:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_str = False
+        elif c == '"':
+            in_str = True
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+        elif c in "}]" and stack:
+            stack.pop()
+    if in_str:
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    return text + "".join(reversed(stack))
+
+
+def parse_json(raw):
+    """First JSON object in an LLM reply; returns (dict or None, whether a repair was needed)."""
+    if not raw:
+        return None, False
+    text = raw.strip()
+    try:
+        obj = json.loads(text)
+        return (obj if isinstance(obj, dict) else None), not isinstance(obj, dict)
+    except ValueError:
+        pass
+
+    fenced = FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    candidate = _first_object(text)
+    if candidate is None:
+        return None, True
+    for attempt in (candidate, _close(_normalize(candidate))):
+        try:
+            obj = json.loads(attempt)
+        except ValueError:
+            continue
+        if isinstance(obj, dict):
+            return obj, True
+    return None, True
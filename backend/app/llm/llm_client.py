@@ -1,29 +1,127 @@
-import json
+import time
 from openai import OpenAI
+from pydantic import ValidationError
 
-client = OpenAI()
+from .governor import governor, PLAN
+from .hedge import hedger
+from .json_repair import parse_json
+from ..metrics import metrics
+from ..config import LLM_REASK
 
-def call_llm(messages: list, model: str = "gpt-5-nano"):
-    resp = client.responses.create(
-        model=model,
-        input=messages,
-    )
+# retries are the hedger's job; the SDK's own (2 by default) would hide slow attempts from it
+client = OpenAI(max_retries=0)
 
-    raw = resp.output_text.strip()
-    print("RAW:", repr(raw))
 
-    try:
-        parsed = json.loads(raw)
-        error = None
-    except Exception as e:
-        print("JSON parse error:", e)
-        parsed = None
-        error = "LLM_OUTPUT_FORMAT_ERROR"
+def _cached_tokens(details) -> int:
+    # prompt-cache hits are reported per call; 0 when the provider omits them
+    return int(getattr(details, "cached_tokens", 0) or 0)
+
+
+def _request(messages: list, model: str, priority: int, timeout: float):
+    with governor.slot(priority, messages) as charge:
+        resp = client.responses.create(
+            model=model,
+            input=messages,
+            timeout=timeout,
+        )
+        charge["total"] = resp.usage.total_tokens
+    return resp
 
+
+def _complete(messages: list, model: str, priority: int, stage: str):
+    start = time.perf_counter()
+    resp = hedger.run(stage, lambda timeout: _request(messages, model, priority, timeout),
+                      lambda r: r.usage.total_tokens)
+    latency_ms = (time.perf_counter() - start) * 1000
+    raw = resp.output_text.strip()
+    print("RAW:", repr(raw))
     usage = {
         "total": resp.usage.total_tokens,
         "input": resp.usage.input_tokens,
         "output": resp.usage.output_tokens,
+        "cached_input": _cached_tokens(getattr(resp.usage, "input_tokens_details", None)),
+        "latency_ms": round(latency_ms, 1),
     }
-    
-    return parsed, usage, error
\ No newline at end of file
+    return raw, usage
+
+
+def _add_usage(a: dict, b: dict) -> dict:
+    return {k: round(a[k] + b[k], 1) if k == "latency_ms" else a[k] + b[k] for k in a}
+
+
+def _validate(obj, schema):
+    """(plan, None) when obj passes the schema, else (obj, {field: message})."""
+    if obj is None:
+        return None, {"*": "the reply was not a JSON object"}
+    if schema is None:
+        return obj, None
+    try:
+        return schema.model_validate(obj).model_dump(), None
+    except ValidationError as e:
+        failed = {}
+        for err in e.errors():
+            field = str(err["loc"][0]) if err["loc"] else "*"
+            failed.setdefault(field, err["msg"])
+        return obj, failed
+
+
+def _reask_message(failed: dict) -> str:
+    if "*" in failed:
+        return "Your previous reply could not be used. Reply again with the JSON object only, no extra text."
+    lines = "\n".join(f"- {field}: {msg}" for field, msg in failed.items())
+    return (
+        "These fields of your previous reply failed validation:\n" + lines + "\n"
+        "Reply with a JSON object containing only these keys, corrected. No extra text."
+    )
+
+
+def call_llm(messages: list, model: str = "gpt-5-nano", priority: int = PLAN, stage: str = "plan", schema=None):
+    """Plan-style call: (parsed, usage, error).
+
+    The reply is parsed tolerantly and, with a schema, validated against it. On
+    failure the model is asked once more, for just the fields that failed, and
+    those fields are merged into the first reply.
+    """
+    try:
+        raw, usage = _complete(messages, model, priority, stage)
+    except TimeoutError as e:
+        print("LLM timeout:", e)
+        return None, None, "LLM_TIMEOUT"
+
+    obj, repaired = parse_json(raw)
+    metrics.incr("llm.parse.total")
+    if repaired:
+        metrics.incr("llm.parse.repaired")
+    if obj is None:
+        metrics.incr("llm.parse.failed")
+    parsed, failed = _validate(obj, schema)
+    if failed and obj is not None:
+        metrics.incr("llm.validate.failed")
+
+    if failed and LLM_REASK:
+        print("LLM reply failed validation, re-asking for:", failed)
+        metrics.incr("llm.reask")
+        followup = messages + [
+            {"role": "assistant", "content": raw},
+            {"role": "user", "content": _reask_message(failed)},
+        ]
+        try:
+            raw2, usage2 = _complete(followup, model, priority, stage)
+            usage = _add_usage(usage, usage2)
+            fix, _ = parse_json(raw2)
+            if fix is not None:
+                merged = fix if obj is None or "*" in failed else {**obj, **{k: fix[k] for k in failed if k in fix}}
+                parsed, failed = _validate(merged, schema)
+        except TimeoutError as e:
+            print("LLM re-ask timeout:", e)
+        if not failed:
+            metrics.incr("llm.reask.fixed")
+
+    if failed:
+        if obj is None:
+            print("JSON parse error:", raw[:200])
+            return None, usage, "LLM_OUTPUT_FORMAT_ERROR"
+        detail = "; ".join(f"{k}: {v}" for k, v in failed.items())
+        print("LLM plan invalid:", detail)
+        return None, usage, f"LLM_PLAN_INVALID: {detail}"
+    return parsed, usage, None
@@ -1,52 +1,133 @@
 import json
+import time
+import hashlib
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
 
+from ..singleflight import SingleFlight, make_key
+from ..ttl_cache import TTLCache
+from ..config import EXPLAIN_CACHE_SIZE, EXPLAIN_CACHE_TTL_S, EXPLAIN_CACHE_DIGITS
+from .governor import governor, Overloaded, EXPLAIN
+from .hedge import hedger
+from .template_explain import template_explain
+from ..metrics import metrics
+
 load_dotenv(dotenv_path="../.env")
 api_key = os.getenv("OPENAI_API_KEY")
 
-client = OpenAI(api_key=api_key)
-
-
-def llm_explain(query: str, summary: dict) -> str:
-    summary_json = json.dumps(summary, ensure_ascii=False)
-
-    system_msg = (
-        "You are an urban data analyst and helpful conversational assistant. "
-        "Answer the user’s question in natural language using both your own knowledge "
-        "and the numeric summary provided. "
-        "Treat the JSON summary as ground truth about the data and describe patterns, "
-        "typical ranges, and extremes clearly. "
-        "Answer the question directly; do NOT talk about JSON, columns, or field names, "
-        "and do NOT suggest making plots or further analyses unless the user explicitly asks. "
-        "When the user asks to 'show' a distribution, describe its shape (e.g., where most values lie, "
-        "whether it is skewed, presence of outliers) in words. "
-        "Write concise, well-structured English in about 70 words ±20, using short paragraphs or bullet points. "
-        "If region is a number, it is a NYC borocode; convert it to the corresponding borough name in your explanation."
-        "when explaining with numbers, include the unit"
-    )
-
-    user_msg = (
-        f"User question:\n{query}\n\n"
-        "Below are precomputed summary statistics from the relevant dataset, in JSON format. "
-        "Use these numbers as factual evidence when answering, but do not mention JSON, keys, or field names explicitly:\n"
-        f"{summary_json}"
-    )
+client = OpenAI(api_key=api_key, max_retries=0)
+explanations = SingleFlight("explain")
+cache = TTLCache("explain", EXPLAIN_CACHE_SIZE, EXPLAIN_CACHE_TTL_S)
+
+# kept byte-identical across calls so the provider can serve it from its prompt cache
+EXPLAIN_SYSTEM = (
+    "You are an urban data analyst and helpful conversational assistant. "
+    "Answer the user’s question in natural language using both your own knowledge "
+    "and the numeric summary provided. "
+    "Treat the JSON summary as ground truth about the data and describe patterns, "
+    "typical ranges, and extremes clearly. "
+    "Answer the question directly; do NOT talk about JSON, columns, or field names, "
+    "and do NOT suggest making plots or further analyses unless the user explicitly asks. "
+    "When the user asks to 'show' a distribution, describe its shape (e.g., where most values lie, "
+    "whether it is skewed, presence of outliers) in words. "
+    "Write concise, well-structured English in about 70 words ±20, using short paragraphs or bullet points. "
+    "If region is a number, it is a NYC borocode; convert it to the corresponding borough name in your explanation."
+    "when explaining with numbers, include the unit. "
+    "The user message holds the question followed by precomputed summary statistics from the relevant dataset, "
+    "in JSON format. Use these numbers as factual evidence when answering, but do not mention JSON, keys, "
+    "or field names explicitly. A category named 'other' groups all remaining, less frequent categories."
+)
+
+
+def _rounded(value, digits: int):
+    """value with every float rounded to `digits` significant digits."""
+    if isinstance(value, float):
+        return float(f"{value:.{digits}g}")
+    if isinstance(value, dict):
+        return {str(k): _rounded(v, digits) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_rounded(v, digits) for v in value]
+    return value
+
+
+def cache_key(query: str, summary: dict) -> str:
+    """Normalized question plus a hash of the summary; float noise below EXPLAIN_CACHE_DIGITS is ignored."""
+    canonical = json.dumps(_rounded(summary, EXPLAIN_CACHE_DIGITS), sort_keys=True,
+                           separators=(",", ":"), ensure_ascii=False, default=str)
+    return make_key(" ".join(query.lower().split()), hashlib.sha1(canonical.encode("utf-8")).hexdigest())
+
+
+def _no_usage(**tag) -> dict:
+    return {"total": 0, "input": 0, "output": 0, "cached_input": 0, "latency_ms": 0.0, **tag}
+
+
+def explain_summary(query: str, summary: dict, method: str = "llm", priority: int = EXPLAIN):
+    """(text, usage) for a summary: by the LLM, by the local template, or not at all ("none")."""
+    if method == "none":
+        return None, None
+    if method == "template":
+        metrics.incr("explain.template")
+        return template_explain(summary), _no_usage(source="template")
+    return llm_explain(query, summary, priority)
+
+
+def llm_explain(query: str, summary: dict, priority: int = EXPLAIN):
+    key = cache_key(query, summary)
+    hit = cache.get(key)
+    if hit is not None:
+        print("[llm_explain] cache hit")
+        return hit, _no_usage(cache="hit")
+
+    summary_json = json.dumps(summary, ensure_ascii=False, separators=(",", ":"))
+    # identical question + summary pairs in flight share one completion
+    text, usage = explanations.do(key, _explain, query, summary, summary_json, priority)
+    if usage is not None and "source" not in usage and not text.startswith("[No explanation"):
+        # only real answers are kept; errors, skips and fallbacks are retried next time
+        cache.put(key, text)
+    return text, usage
+
+
+def _explain(query: str, summary: dict, summary_json: str, priority: int = EXPLAIN):
+    user_msg = f"User question:\n{query}\n\nSummary:\n{summary_json}"
+    messages = [
+        {"role": "system", "content": EXPLAIN_SYSTEM},
+        {"role": "user", "content": user_msg},
+    ]
+
+    def request(timeout):
+        with governor.slot(priority, messages) as charge:
+            resp = client.chat.completions.create(
+                model="gpt-5-nano",
+                messages=messages,
+                timeout=timeout,
+            )
+            charge["total"] = resp.usage.total_tokens
+        return resp
 
     try:
-        resp = client.chat.completions.create(
-            model="gpt-5-nano",
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": user_msg},
-            ],
-        )
+        start = time.perf_counter()
+        resp = hedger.run("explain", request, lambda r: r.usage.total_tokens)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        details = getattr(resp.usage, "prompt_tokens_details", None)
+        usage = {
+            "total": resp.usage.total_tokens,
+            "input": resp.usage.prompt_tokens,
+            "output": resp.usage.completion_tokens,
+            "cached_input": int(getattr(details, "cached_tokens", 0) or 0),
+            "latency_ms": round(latency_ms, 1),
+        }
 
         content = resp.choices[0].message.content
         if not content:
-            return "[No explanation generated]"
-        return content.strip()
+            return "[No explanation generated]", usage
+        return content.strip(), usage
 
+    except (TimeoutError, Overloaded) as e:
+        # a slow or rate-limited LLM must not hold the data back: narrate it locally instead
+        print("[llm_explain] falling back to the template:", getattr(e, "reason", e))
+        metrics.incr("explain.template_fallback")
+        return template_explain(summary), _no_usage(source="template")
     except Exception as e:
-        return f"[llm_explain error: {e}]"
+        return f"[llm_explain error: {e}]", None
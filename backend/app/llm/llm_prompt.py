@@ -1,57 +1,99 @@
-DB_SCHEMA_analyze = """
-db: PostgreSQL 16 + PostGIS
-
-tables:
-    buildings:
-        spine: [borocode, large_n, small_n, shape_area, shape_leng, geom]
-        cat: 
-            zoning
-            bldg_class
-            elevator : True or False (boolean)
-        num:
-            built_year
-            ground_ele : ground elevation (ft)
-            heightroof
-            bld_value_2025 : total building value (2025)
-            bld_value_2024
-            avg_prop_value_2025   : avg property value inside building (2025)
-            avg_prop_value_2024
-            value_sqft_2025
-            value_sqft_2024
-            gross_sqft
-            res_gross_sqft
-            bld_story
-
-    street_block:
-        spine: [borocode, large_n, small_n, geom]
-        cat: [ur20, zoning, bldg_class_dom]
-        num:
-            aland20 : land area
-            awater20 : water area
-            housing20 : total housing units
-            pop20 : population
-            built_year_avg
-            ground_ele_avg
-            height_avg            : avg building height (ft)
-            ele_percent           : percent of buildings with elevator
-            bld_val_2025_sum
-            bld_val_2024_sum
-            gross_sqft_sum
-            res_gross_sqft_sum
-            prop_val_2025_avg
-            prop_val_2024_avg
-            story_avg             : avg building stories
-            val_sqft_2025_avg
-            val_sqft_2024_avg
-
-    regions:
-    borocode: 1=Manhattan, 2=Bronx, 3=Brooklyn, 4=Queens, 5=Staten Island
-    large_n_by_borocode:
-        1: [way uptown manhattan, midtown manhattan, downtown manhattan, uptown manhattan]
-        2: [central bronx, west bronx, east bronx, south bronx]
-        3: [south brooklyn, north brooklyn, central brooklyn, east brooklyn]
-        4: [northeast queens, western queens, southeast queens,
-            rockaways queens, northwest queens, special queens, central queens]
-        5: [south shore staten island, east shore staten island,
-            mid staten island, north shore staten island]
-    """
\ No newline at end of file
+SCHEMA_TABLES = {
+    "buildings": {
+        "spine": ["borocode", "large_n", "small_n", "shape_area", "shape_leng", "geom"],
+        "cat": {
+            "zoning": None,
+            "bldg_class": None,
+            "elevator": "boolean, True or False",
+        },
+        "num": {
+            "built_year": None,
+            "ground_ele": "ground elevation, ft",
+            "heightroof": None,
+            "bld_value_2025": "total building value, 2025",
+            "bld_value_2024": None,
+            "avg_prop_value_2025": "avg property value inside building, 2025",
+            "avg_prop_value_2024": None,
+            "value_sqft_2025": None,
+            "value_sqft_2024": None,
+            "gross_sqft": None,
+            "res_gross_sqft": None,
+            "bld_story": None,
+        },
+    },
+    "street_block": {
+        "spine": ["borocode", "large_n", "small_n", "geom"],
+        "cat": {
+            "ur20": None,
+            "zoning": None,
+            "bldg_class_dom": None,
+        },
+        "num": {
+            "aland20": "land area",
+            "awater20": "water area",
+            "housing20": "total housing units",
+            "pop20": "population",
+            "built_year_avg": None,
+            "ground_ele_avg": None,
+            "height_avg": "avg building height, ft",
+            "ele_percent": "percent of buildings with elevator",
+            "bld_val_2025_sum": None,
+            "bld_val_2024_sum": None,
+            "gross_sqft_sum": None,
+            "res_gross_sqft_sum": None,
+            "prop_val_2025_avg": None,
+            "prop_val_2024_avg": None,
+            "story_avg": "avg building stories",
+            "val_sqft_2025_avg": None,
+            "val_sqft_2024_avg": None,
+        },
+    },
+}
+
+SCHEMA_REGIONS = """regions:
+ borocode: 1=Manhattan, 2=Bronx, 3=Brooklyn, 4=Queens, 5=Staten Island
+ large_n_by_borocode:
+  1: [way uptown manhattan, midtown manhattan, downtown manhattan, uptown manhattan]
+  2: [central bronx, west bronx, east bronx, south bronx]
+  3: [south brooklyn, north brooklyn, central brooklyn, east brooklyn]
+  4: [northeast queens, western queens, southeast queens, rockaways queens, northwest queens, special queens, central queens]
+  5: [south shore staten island, east shore staten island, mid staten island, north shore staten island]"""
+
+# what each plan mode is shown: the tables it may pick, the spine columns it may filter on, the
+# attribute sections it may choose from, and whether it emits region values. Every mode needs both
+# tables (analyze and compare pick one by scale, search pairs one column from each). Geometry,
+# shape and id columns are never plan material; analyze and compare keep the region columns
+# (compare's regions are values of borocode or large_n, and small_n may still filter), while
+# search names regions through its own fields. Search ranks regions by min/max/mean/median,
+# so it only needs the numeric columns.
+REGION_SPINE = ("borocode", "large_n", "small_n")
+MODE_SCHEMA_SECTIONS = {
+    "analyze": (("buildings", "street_block"), REGION_SPINE, ("cat", "num"), True),
+    "search": (("buildings", "street_block"), (), ("num",), False),
+    "compare": (("buildings", "street_block"), REGION_SPINE, ("cat", "num"), True),
+}
+
+
+def _render_columns(cols: dict) -> str:
+    return ", ".join(f"{name} ({desc})" if desc else name for name, desc in cols.items())
+
+
+def render_schema(tables, include_regions: bool = True, spine=None, sections=("cat", "num")) -> str:
+    """Schema text for a prompt; spine limits the listed spine columns (None lists them all)."""
+    lines = ["db: PostgreSQL 16 + PostGIS", "tables:"]
+    for table in tables:
+        spec = SCHEMA_TABLES[table]
+        cols = [c for c in spec["spine"] if spine is None or c in spine]
+        lines.append(f" {table}:")
+        if cols:
+            lines.append(f"  filter-only: [{', '.join(cols)}]" if spine is not None else f"  spine: [{', '.join(cols)}]")
+        for section in sections:
+            lines.append(f"  {section}: {_render_columns(spec[section])}")
+    if include_regions:
+        lines.append(SCHEMA_REGIONS)
+    return "\n".join(lines)
+
+
+def schema_for_mode(mode: str) -> str:
+    tables, spine, sections, include_regions = MODE_SCHEMA_SECTIONS[mode]
+    return render_schema(tables, include_regions, spine, sections)
@@ -0,0 +1,150 @@
+from typing import Any, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, field_validator
+
+from ..plan_compiler import ALLOWED_OPS
+from ..resolver import resolver
+
+
+def _lower(v):
+    return v.strip().lower() if isinstance(v, str) else v
+
+
+def _check_filters(filters):
+    if filters is None:
+        return []
+    out = []
+    for f in filters:
+        if not isinstance(f, (list, tuple)) or len(f) != 3:
+            raise ValueError(f"each filter must be [column, op, value], got {f!r}")
+        col, op, val = f
+        if op not in ALLOWED_OPS:
+            raise ValueError(f"op must be one of {', '.join(ALLOWED_OPS)}, got {op!r}")
+        out.append([col, op, val])
+    return out
+
+
+class ModeChoice(BaseModel):
+    mode: Literal["analyze", "search", "compare"]
+
+    @field_validator("mode", mode="before")
+    @classmethod
+    def lower_literals(cls, v):
+        return _lower(v)
+
+
+class AnalyzePlan(BaseModel):
+    # table is declared first so the column check can see it
+    table: Literal["buildings", "street_block"]
+    column: str
+    dtype: Literal["numeric", "categorical"]
+    scale: Literal["city", "borough", "large_n"]
+    region: Optional[Union[int, str]] = None
+    filters: List[List[Any]] = []
+
+    @field_validator("table", "dtype", "scale", mode="before")
+    @classmethod
+    def lower_literals(cls, v):
+        return _lower(v)
+
+    @field_validator("region")
+    @classmethod
+    def snap_region(cls, v, info):
+        return resolver.region(v, info.data.get("scale"))
+
+    @field_validator("column")
+    @classmethod
+    def column_in_table(cls, v, info):
+        return resolver.column(v, info.data.get("table"))
+
+    @field_validator("filters", mode="before")
+    @classmethod
+    def filters_shape(cls, v):
+        return _check_filters(v)
+
+    @field_validator("filters")
+    @classmethod
+    def snap_filters(cls, v, info):
+        return resolver.filters(v, info.data.get("table"))
+
+
+class SearchPlan(BaseModel):
+    column_s: str
+    column_b: str
+    dtype_s: Literal["numeric", "categorical"]
+    dtype_b: Literal["numeric", "categorical"]
+    scale: Optional[Literal["borough", "large_n"]] = "large_n"
+    analysis: Literal["min", "max", "mean", "median"]
+    order: Optional[Literal["ascending", "descending", "no_match"]] = "descending"
+    region: Optional[Union[int, str]] = None
+    filters: List[List[Any]] = []
+
+    @field_validator("dtype_s", "dtype_b", "scale", "analysis", "order", mode="before")
+    @classmethod
+    def lower_literals(cls, v):
+        return _lower(v)
+
+    @field_validator("column_s")
+    @classmethod
+    def column_s_in_table(cls, v):
+        return resolver.column(v, "street_block")
+
+    @field_validator("column_b")
+    @classmethod
+    def column_b_in_table(cls, v):
+        return resolver.column(v, "buildings")
+
+    @field_validator("filters", mode="before")
+    @classmethod
+    def filters_shape(cls, v):
+        return _check_filters(v)
+
+
+class ComparePlan(BaseModel):
+    table: Literal["buildings", "street_block"]
+    column: str
+    dtype: Literal["numeric", "categorical", "boolean"]
+    scale: Literal["borough", "large_n"]
+    # region1/region2 are still accepted from older prompts and folded into regions
+    region1: Optional[Union[int, str]] = None
+    region2: Optional[Union[int, str]] = None
+    regions: List[Union[int, str]] = Field(default=[], validate_default=True)
+    filters: List[List[Any]] = []
+
+    @field_validator("table", "dtype", "scale", mode="before")
+    @classmethod
+    def lower_literals(cls, v):
+        return _lower(v)
+
+    @field_validator("region1", "region2")
+    @classmethod
+    def snap_regions(cls, v, info):
+        return resolver.region(v, info.data.get("scale"))
+
+    @field_validator("regions")
+    @classmethod
+    def merge_regions(cls, v, info):
+        scale = info.data.get("scale")
+        out = []
+        for r in [info.data.get("region1"), info.data.get("region2"), *v]:
+            if r is None or r == "NO_MATCH":
+                continue
+            r = resolver.region(r, scale)
+            if r not in out:
+                out.append(r)
+        return out
+
+    @field_validator("column")
+    @classmethod
+    def column_in_table(cls, v, info):
+        return resolver.column(v, info.data.get("table"))
+
+    @field_validator("filters", mode="before")
+    @classmethod
+    def filters_shape(cls, v):
+        return _check_filters(v)
+
+    @field_validator("filters")
+    @classmethod
+    def snap_filters(cls, v, info):
+        return resolver.filters(v, info.data.get("table"))
@@ -0,0 +1,170 @@
+from .llm_prompt import SCHEMA_TABLES
+from ..resolver import BOROUGH_NAMES
+
+# unit words recognised at the end of a schema comment ("ground elevation, ft")
+UNIT_WORDS = {"ft": "ft", "feet": "ft", "sqft": "sq ft", "sq ft": "sq ft", "usd": "$", "$": "$",
+              "%": "%", "percent": "%", "m2": "m²", "sq m": "m²"}
+# Bowley skew beyond which a distribution is described as skewed
+SKEW_THRESHOLD = 0.1
+
+
+def _comment(column: str):
+    for spec in SCHEMA_TABLES.values():
+        for section in ("num", "cat"):
+            if spec[section].get(column):
+                return spec[section][column]
+    return None
+
+
+def describe_column(column: str):
+    """(label, unit) from the schema comment, falling back to the column name."""
+    comment = _comment(column) or ""
+    parts = [p.strip() for p in comment.split(",") if p.strip()]
+    unit = None
+    for p in list(parts):
+        if p.lower() in UNIT_WORDS:
+            unit = UNIT_WORDS[p.lower()]
+            parts.remove(p)
+    if unit is None:
+        name = column.lower()
+        if "sqft" in name and ("val" in name):
+            unit = "$/sq ft"
+        elif "val" in name:
+            unit = "$"
+        elif "sqft" in name:
+            unit = "sq ft"
+        elif "percent" in name or (parts and parts[0].startswith("percent")):
+            unit = "%"
+        elif "height" in name or "ele" in name.split("_"):
+            unit = "ft"
+    if parts and not parts[0].startswith("boolean"):
+        label = parts[0] + (f" ({', '.join(parts[1:])})" if parts[1:] else "")
+    else:
+        label = column.replace("_", " ")
+    return label, unit
+
+
+def region_name(region, scale) -> str:
+    """Borocodes become borough names; neighbourhood names are title-cased."""
+    if region is None or region == "NO_MATCH":
+        return "New York City" if scale in (None, "city") else "all regions"
+    try:
+        code = float(region)
+    except (TypeError, ValueError):
+        code = None
+    # integral floats ("2.0") come back from frames that upcast the borocode column
+    if code is not None and code.is_integer() and int(code) in BOROUGH_NAMES:
+        return BOROUGH_NAMES[int(code)][0].title()
+    return str(region).title()
+
+
+def fmt(value, unit=None) -> str:
+    if value is None:
+        return "n/a"
+    v = float(value)
+    if unit in ("$", "$/sq ft"):
+        for scale, suffix in ((1e9, "B"), (1e6, "M"), (1e3, "k")):
+            if abs(v) >= scale and unit == "$":
+                return f"${v / scale:,.1f}".removesuffix(".0") + suffix
+        return f"${v:,.0f}" + ("/sq ft" if unit == "$/sq ft" else "")
+    text = f"{v:,.0f}" if v.is_integer() or abs(v) >= 100 else f"{v:,.2f}".rstrip("0").rstrip(".")
+    if unit == "%":
+        return text + "%"
+    return f"{text} {unit}" if unit else text
+
+
+def _and(items: list) -> str:
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def _skew(summary: dict):
+    """Bowley (quartile) skewness, None without quartiles."""
+    p25, median, p75 = summary.get("p25"), summary.get("median"), summary.get("p75")
+    if None in (p25, median, p75) or p75 == p25:
+        return None
+    return (p75 + p25 - 2 * median) / (p75 - p25)
+
+
+def _numeric(summary: dict, label: str, unit, where: str) -> list:
+    lines = [
+        f"Across {summary['count']:,} records {where}, {label} has a median of {fmt(summary['median'], unit)} "
+        f"and a mean of {fmt(summary['mean'], unit)}, ranging from {fmt(summary['min'], unit)} "
+        f"to {fmt(summary['max'], unit)}."
+    ]
+    if summary.get("p25") is not None and summary.get("p75") is not None:
+        spread = f"Half of the values lie between {fmt(summary['p25'], unit)} and {fmt(summary['p75'], unit)}"
+        if summary.get("p10") is not None and summary.get("p90") is not None:
+            spread += f", and 80% between {fmt(summary['p10'], unit)} and {fmt(summary['p90'], unit)}"
+        lines.append(spread + ".")
+    skew = _skew(summary)
+    if skew is not None:
+        if skew > SKEW_THRESHOLD:
+            lines.append("The distribution is right-skewed, with a long tail of high values.")
+        elif skew < -SKEW_THRESHOLD:
+            lines.append("The distribution is left-skewed, with a long tail of low values.")
+        else:
+            lines.append("The distribution is roughly symmetric around the median.")
+    return lines
+
+
+def _categorical(summary: dict, label: str, where: str) -> list:
+    count = summary["count"]
+    cats = summary.get("categories") or {}
+    named = [(k, v) for k, v in cats.items() if k != "other"]
+    top = _and([f"{k} ({100 * v / count:.0f}%)" for k, v in named[:3]])
+    lines = [f"Of {count:,} records {where} with a recorded {label}, the most common values are {top}."]
+    distinct = summary.get("distinct")
+    if distinct and distinct > len(named):
+        share = 100 * cats.get("other", 0) / count
+        lines.append(f"There are {distinct} distinct values; the remaining ones account for {share:.0f}%.")
+    return lines
+
+
+def _one(summary: dict) -> str:
+    column = summary.get("data")
+    scale = summary.get("scale of analysis")
+    place = region_name(summary.get("region"), scale)
+    where = f"across {place}" if place == "all regions" else f"in {place}"
+    if not summary.get("count"):
+        return f"No records matched {where}."
+    label, unit = describe_column(column) if column else ("the value", None)
+    if "categories" in summary:
+        lines = _categorical(summary, label, where)
+    else:
+        lines = _numeric(summary, label, unit, where)
+    if summary.get("map"):
+        lines.append(f"The map shows the {summary['map']}.")
+    if summary.get("ranking"):
+        lines.append(_ranking(summary["ranking"], scale))
+    return " ".join(lines)
+
+
+def _ranking(ranking: dict, scale) -> str:
+    label, unit = describe_column(ranking["column"])
+    ranked = [f"{region_name(c['region'], scale)} ({fmt(c['metric'], unit)})" for c in ranking["candidates"]]
+    return f"Ranked by {ranking['statistic']} {label}, the top candidates are {_and(ranked)}."
+
+
+def _compare(summaries: list) -> str:
+    parts = [_one(s) for s in summaries]
+    ranked = [s for s in summaries if s.get("median") and s.get("data")]
+    if len(ranked) >= 2:
+        _, unit = describe_column(ranked[0]["data"])
+        ranked.sort(key=lambda s: s["median"], reverse=True)
+        names = [region_name(s.get("region"), s.get("scale of analysis")) for s in ranked]
+        h, l = ranked[0]["median"], ranked[-1]["median"]
+        diff = f"{100 * (h - l) / abs(l):.0f}% higher" if l else f"{fmt(h - l, unit)} higher"
+        if len(ranked) == 2:
+            parts.append(f"The median in {names[0]} is {diff} than in {names[1]}.")
+        else:
+            parts.append(f"By median, the order is {_and(names)}; {names[0]} is {diff} than {names[-1]}.")
+    return "\n\n".join(parts)
+
+
+def template_explain(summary: dict) -> str:
+    """Plain-English explanation of a create_summary result (or {"regions": [...]} for compare) without an LLM."""
+    if not summary:
+        return "No data was available to describe."
+    if "regions" in summary:
+        return _compare([s or {} for s in summary["regions"]])
+    return _one(summary)
@@ -0,0 +1,143 @@
+import os
+import json
+import glob
+import time
+import threading
+from collections import Counter, deque
+
+from .config import METRICS_DIR, METRICS_FLUSH_S, METRICS_WINDOW
+
+
+# derived rates reported with the counters: name -> (numerator, denominator)
+RATES = {
+    "llm.parse_failure_rate": ("llm.parse.failed", "llm.parse.total"),
+    "llm.reask_rate": ("llm.reask", "llm.parse.total"),
+    "llm.reask_fix_rate": ("llm.reask.fixed", "llm.reask"),
+    "explain.cache_hit_rate": ("cache.explain.hit", "cache.explain.lookup"),
+    "payload.cache_hit_rate": ("cache.payload.hit", "cache.payload.lookup"),
+    "compress.gzip.ratio": ("compress.gzip.bytes_in", "compress.gzip.bytes_out"),
+    "compress.br.ratio": ("compress.br.bytes_in", "compress.br.bytes_out"),
+    "compress.zstd.ratio": ("compress.zstd.bytes_in", "compress.zstd.bytes_out"),
+}
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """Process-local counters, latency windows and per-statement query stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        self.timings = {}
+        self.queries = {}
+        self.started = time.time()
+        self._last_flush = time.time()
+
+    def incr(self, name: str, n: float = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name: str, ms: float):
+        with self._lock:
+            window = self.timings.setdefault(name, deque(maxlen=METRICS_WINDOW))
+            window.append(ms)
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return len(self.timings.get(name, ()))
+
+    def percentile(self, name: str, q: float):
+        with self._lock:
+            values = list(self.timings.get(name, ()))
+        return _percentile(values, q)
+
+    def record_query(self, compiled: dict, ms: float, backend: str, kind: str = None, sql: str = None):
+        """Time a fetch under its compiled statement; a downgraded fetch (kind) gets its own entry and SQL."""
+        name = f"{compiled['name']}.{kind}" if kind else compiled["name"]
+        with self._lock:
+            entry = self.queries.setdefault(name, {
+                "sql": sql or compiled["sql"],
+                "kind": kind,
+                "table": compiled["table"],
+                "filter_columns": sorted({c for c, _, _ in compiled.get("filters", [])}),
+                "backend": backend,
+                "count": 0,
+                "total_ms": 0.0,
+            })
+            entry["count"] += 1
+            entry["total_ms"] += ms
+            entry["params"] = compiled["params"]
+        self.observe(f"db.{backend}", ms)
+        self.maybe_flush()
+
+    def top_queries(self, n: int = 5) -> list:
+        with self._lock:
+            items = [dict(v, name=k) for k, v in self.queries.items()]
+        return sorted(items, key=lambda q: q["count"], reverse=True)[:n]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            timings = {k: list(v) for k, v in self.timings.items()}
+            out = {
+                "uptime_s": round(time.time() - self.started, 1),
+                "counters": dict(self.counters),
+                "queries": {k: dict(v) for k, v in self.queries.items()},
+            }
+        counters = out["counters"]
+        out["rates"] = {
+            name: round(counters.get(num, 0) / counters[den], 4)
+            for name, (num, den) in RATES.items()
+            if counters.get(den)
+        }
+        out["timings_ms"] = {
+            k: {
+                "count": len(v),
+                "p50": _percentile(v, 0.50),
+                "p95": _percentile(v, 0.95),
+                "p99": _percentile(v, 0.99),
+            }
+            for k, v in timings.items()
+        }
+        return out
+
+    def maybe_flush(self):
+        if time.time() - self._last_flush >= METRICS_FLUSH_S:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.time()
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            path = os.path.join(METRICS_DIR, f"metrics.{os.getpid()}.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump(self.snapshot(), f, default=str)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            # flushing runs inside record_query; it must never fail the request being timed
+            print("[metrics] flush failed:", e)
+
+
+def load_queries(directory: str = METRICS_DIR) -> list:
+    """Merge per-statement stats flushed by every worker process."""
+    merged = {}
+    for path in glob.glob(os.path.join(directory, "metrics.*.json")):
+        try:
+            with open(path) as f:
+                queries = json.load(f).get("queries", {})
+        except (OSError, ValueError) as e:
+            print("[metrics] skipping", path, e)
+            continue
+        for name, q in queries.items():
+            entry = merged.setdefault(name, dict(q, name=name, count=0, total_ms=0.0))
+            entry["count"] += q["count"]
+            entry["total_ms"] += q["total_ms"]
+    return sorted(merged.values(), key=lambda q: q["count"], reverse=True)
+
+
+metrics = Metrics()
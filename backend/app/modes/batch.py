@@ -0,0 +1,169 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List
+
+from ..llm.llm_router import select_mode, build_analyze_plan
+from ..llm.llm_client import call_llm
+from ..llm.plan_models import ModeChoice, AnalyzePlan
+from ..llm.llm_explain import explain_summary
+from ..llm.governor import BATCH
+from ..data_backend import get_data_frame
+from ..filters import filter_mask
+from ..plan_compiler import PlanError, table_columns, normalize_filters
+from ..config import BATCH_CONCURRENCY
+from .services import summarize, run_search, run_compare
+
+
+def _item(index: int, query: str, **fields) -> dict:
+    item = {
+        "index": index,
+        "query": query,
+        "mode": None,
+        "column": None,
+        "dtype": None,
+        "scale": None,
+        "region": None,
+        "table": None,
+        "filters": None,
+        "summary": None,
+        "explanation": None,
+        "usage": None,
+        "mode_usage": None,
+        "explain_usage": None,
+        "error": None,
+    }
+    item.update(fields)
+    return item
+
+
+def _plan(index: int, query: str) -> dict:
+    """Mode selection, plus the plan call for analyze queries."""
+    mode_json, mode_usage, mode_error = call_llm(select_mode(query), priority=BATCH, stage="mode",
+                                                 schema=ModeChoice)
+    if mode_error or not mode_json:
+        return _item(index, query, mode_usage=mode_usage, error=mode_error or "LLM_MODE_ERROR")
+    mode = mode_json.get("mode")
+    if mode != "analyze":
+        return _item(index, query, mode=mode, mode_usage=mode_usage)
+
+    plan, usage, plan_error = call_llm(build_analyze_plan(query), priority=BATCH, schema=AnalyzePlan)
+    if plan_error or not plan:
+        return _item(index, query, mode=mode, usage=usage, mode_usage=mode_usage,
+                     error=plan_error or "LLM_PLAN_ERROR")
+    item = _item(
+        index, query, mode=mode, usage=usage, mode_usage=mode_usage,
+        column=plan.get("column"), dtype=plan.get("dtype"), scale=plan.get("scale"),
+        region=plan.get("region"), table=plan.get("table"),
+    )
+    # the group's shared frame compiles every member's filters, so a plan the compiler
+    # rejects has to fail here, on its own, rather than take its whole group down
+    try:
+        table_columns(item["table"])
+        item["filters"] = [list(f) for f in normalize_filters(item["table"], plan.get("filters"))]
+    except PlanError as e:
+        item["error"] = f"INVALID_PLAN: {e}"
+    return item
+
+
+def _other(item: dict, explain: str) -> dict:
+    """Search and compare run their usual pipeline; the batch only reports summaries."""
+    runner = run_search if item["mode"] == "search" else run_compare
+    result = runner(item["query"], explain=explain, priority=BATCH)
+    for key in item:
+        if key in result and key not in ("index", "query", "mode_usage"):
+            item[key] = result[key]
+    return item
+
+
+def _common_filters(items: List[dict]) -> list:
+    common = [tuple(f) for f in items[0]["filters"] if len(f) == 3]
+    for item in items[1:]:
+        own = {tuple(f) for f in item["filters"] if len(f) == 3}
+        common = [f for f in common if f in own]
+    return common
+
+
+def _group(items: List[dict]) -> List[dict]:
+    """Fetch one attribute frame for all plans on a table and scale, then summarize each plan from it."""
+    table = items[0]["table"]
+    columns = []
+    for item in items:
+        for col in [item["column"]] + [f[0] for f in item["filters"] if len(f) == 3]:
+            if col and col != "NO_MATCH" and col not in columns:
+                columns.append(col)
+    common = _common_filters(items)
+    print("[batch] shared frame:", table, items[0]["scale"], "plans:", len(items),
+          "columns:", columns, "common filters:", common)
+    result = get_data_frame(table, columns, common)
+    frame = result["gdf"]
+    for item in items:
+        if result["error"] or frame is None:
+            item["error"] = result["error"] or "DB_ERROR"
+            continue
+        try:
+            sub = frame[filter_mask(frame, item["filters"])]
+            item["summary"] = summarize(sub, item["column"], item["scale"], item["region"], item["dtype"])
+        except (KeyError, ValueError, TypeError) as e:
+            item["error"] = f"INVALID_PLAN: {e}"
+    return items
+
+
+def _explain(item: dict, explain: str) -> dict:
+    if item["error"] is None and item["summary"] is not None:
+        item["explanation"], item["explain_usage"] = explain_summary(item["query"], item["summary"], explain,
+                                                                     priority=BATCH)
+    return item
+
+
+def _guarded(fn, fallback: dict):
+    def call(*args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            print("[batch] stage failed:", e)
+            traceback.print_exc()
+            items = fallback if isinstance(fallback, list) else [fallback]
+            for item in items:
+                item["error"] = f"internal server error: {e}"
+            return fallback
+    return call
+
+
+def run_batch(queries: List[str], explain: str = "llm"):
+    """Yield one result per query as it completes.
+
+    Every query is planned in parallel (bounded by BATCH_CONCURRENCY). Once all
+    plans are in, analyze plans are grouped by table and scale, each group is
+    fetched once as an attribute-only frame, and every plan's summary is taken
+    from that frame before its explanation is requested.
+    """
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch") as pool:
+        pending = {}
+        for i, q in enumerate(queries):
+            pending[pool.submit(_guarded(_plan, _item(i, q)), i, q)] = "plan"
+        groups = {}
+        planning = len(queries)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = pending.pop(future)
+                out = future.result()
+                if stage == "plan":
+                    planning -= 1
+                    if out["error"] is not None or out["mode"] not in ("analyze", "search", "compare"):
+                        if out["error"] is None:
+                            out["error"] = f"mode '{out['mode']}' not implemented"
+                        yield out
+                    elif out["mode"] == "analyze":
+                        groups.setdefault((out["table"], out["scale"]), []).append(out)
+                    else:
+                        pending[pool.submit(_guarded(_other, out), out, explain)] = "item"
+                    if planning == 0:
+                        for items in groups.values():
+                            pending[pool.submit(_guarded(_group, items), items)] = "group"
+                elif stage == "group":
+                    for item in out:
+                        pending[pool.submit(_guarded(_explain, item), item, explain)] = "item"
+                else:
+                    yield out
@@ -5,8 +5,50 @@ from typing import List, Dict, Optional
 
 from ..llm.llm_router import select_mode, build_analyze_plan, build_search_plan, build_compare_plan
 from ..llm.llm_client import call_llm
-from ..db import get_data_analyze, get_data_search, get_data_search_final, get_data_compare
-from ..llm.llm_explain import llm_explain
+from ..llm.plan_models import ModeChoice, AnalyzePlan, SearchPlan, ComparePlan
+from ..data_backend import (
+    get_data_analyze, get_data_search, get_data_search_final, get_data_compare, get_region_shapes, SCALE_GROUP_COL,
+)
+from ..llm.llm_explain import explain_summary
+from ..llm.governor import PLAN, EXPLAIN, Overloaded, deadline
+from ..llm.llm_prompt import SCHEMA_TABLES
+from ..plan_compiler import PlanError, COMPARE_REGION_COL, resolve_level, check_stat
+from ..aggregate import PERCENTILES, percentiles
+from ..config import (
+    SUMMARY_TOP_K, SEARCH_TOP_K, SESSION_FRAME_ALL_COLUMNS, SESSION_FRAME_NUMERIC_SCALES, LLM_REQUEST_BUDGET_S,
+)
+from ..session import sessions
+from .. import cpu_pool
+from ..results import results
+from ..progress import stage
+from ..singleflight import SingleFlight, make_key
+
+runs = SingleFlight("run")
+
+# the data part of an answer, and the plan fields (beyond the compiled SQL) it depends on
+RESULT_KEYS = ("mode", "column", "dtype", "scale", "region", "table", "filters", "aggregate", "downgrade",
+               "geojson", "summary", "ranking", "ranking_geojson")
+PLAN_KEYS = ("mode", "column", "dtype", "scale", "region", "table", "filters")
+
+
+def top_categories(counts) -> dict:
+    counts = counts[counts > 0].sort_values(ascending=False)
+    category_counts = {k: int(v) for k, v in counts.head(SUMMARY_TOP_K).items()}
+    if len(counts) > SUMMARY_TOP_K:
+        category_counts["other"] = int(counts.iloc[SUMMARY_TOP_K:].sum())
+    return {"distinct": int(len(counts)), "categories": category_counts}
+
+
+def summary_from_stats(stats: dict, column: str, scale, region, note: str) -> dict:
+    """Summary for an aggregated or sampled result, from statistics computed over the full selection."""
+    result = {"data": column, "scale of analysis": scale, "region": region, "count": stats["count"]}
+    if "counts" in stats:
+        result.update(top_categories(stats["counts"]))
+    else:
+        result.update({k: stats[k] for k in ("mean", "median", "min", "max", *PERCENTILES) if k in stats})
+    result["map"] = note
+    print("[summary_from_stats] summary:", result)
+    return result
 
 
 def create_summary(gdf, column: str, scale, region, dtype):
@@ -45,6 +87,7 @@ def create_summary(gdf, column: str, scale, region, dtype):
             "median": float(s.median()),
             "min": float(s.min()),
             "max": float(s.max()),
+            **percentiles(s.to_numpy()),
         }
         print("[create_summary] Numeric: summary:", result)
         return result
@@ -67,13 +110,13 @@ def create_summary(gdf, column: str, scale, region, dtype):
             print("[create_summary] Categorical: empty series, returning:", result)
             return result
 
-        category_counts = s.value_counts().to_dict()
+        counts = s.value_counts()
         result = {
             "data": column,
             "scale of analysis": scale,
             "region": region,
             "count": int(s.count()),
-            "categories": category_counts,
+            **top_categories(counts),
         }
         print("[create_summary] Categorical: summary:", result)
         return result
@@ -86,35 +129,156 @@ def create_summary(gdf, column: str, scale, region, dtype):
         return result
 
 
-def run_analyze(query: str, history: Optional[List[Dict[str, str]]] = None):
+def summarize(gdf, column: str, scale, region, dtype):
+    """create_summary, in the CPU pool for large frames; only the summarized column is shipped there."""
+    if gdf is None or column is None or column not in gdf.columns:
+        return create_summary(gdf=gdf, column=column, scale=scale, region=region, dtype=dtype)
+    return cpu_pool.run(create_summary, pd.DataFrame(gdf[[column]]), column, scale, region, dtype)
+
+
+def _region_key(value) -> str:
+    # borocodes may arrive as 2, "2" or 2.0 depending on the frame's dtype
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def region_summaries(df, group_col: str, column: str, scale, regions: list, dtype) -> list:
+    """create_summary for every region in one groupby pass over df, in the order of regions.
+
+    Regions with no rows get the empty summary create_summary gives an empty frame, whatever the dtype.
+    """
+    found = {}
+    if dtype in ("numeric", "categorical") and column in df.columns:
+        valid = df[[group_col, column]].dropna()
+        grouped = valid.groupby(group_col, observed=True)[column]
+        if valid.empty:
+            pass
+        elif dtype == "numeric":
+            stats = grouped.agg(["count", "mean", "median", "min", "max"])
+            qs = grouped.quantile(list(PERCENTILES.values())).unstack()
+            qs.columns = list(PERCENTILES)
+            for key, row in stats.join(qs).iterrows():
+                found[_region_key(key)] = {
+                    "count": int(row["count"]),
+                    **{k: float(row[k]) for k in ("mean", "median", "min", "max", *PERCENTILES)},
+                }
+        else:
+            counts = valid.groupby([group_col, column], observed=True).size()
+            for key, part in counts.groupby(level=0, observed=True):
+                part = part.droplevel(0)
+                # like the numeric branch, a region without rows is left to the empty summary below
+                if part.sum() > 0:
+                    found[_region_key(key)] = {"count": int(part.sum()), **top_categories(part)}
+
+    out = []
+    for region in regions:
+        stats = found.get(_region_key(region))
+        if stats is None:
+            # same empty shape for numeric and categorical, still labelled with its region
+            stats = create_summary(None, column, scale, region, dtype)
+        out.append({"data": column, "scale of analysis": scale, "region": region, **stats})
+    print("[region_summaries]", len(regions), "regions,", len(found), "with data")
+    return out
+
+
+def rank_groups(df, group_col: str, column: str, agg: str, ascending: bool, k: int):
+    """Top k groups by agg of column, with count and interquartile spread, from one groupby."""
+    grouped = df.dropna(subset=[column]).groupby(group_col, observed=True)[column]
+    ranked = grouped.agg([agg, "count"]).rename(columns={agg: "metric"})
+    if ranked.empty:
+        return ranked.rename_axis(group_col).reset_index()
+    spread = grouped.quantile([PERCENTILES["p25"], PERCENTILES["p75"]]).unstack()
+    spread.columns = ["p25", "p75"]
+    ranked = ranked.join(spread).sort_values("metric", ascending=ascending, kind="stable").head(k)
+    ranked.insert(0, "rank", range(1, len(ranked) + 1))
+    return ranked.rename_axis(group_col).reset_index()
+
+
+def ranking_candidates(ranked, group_col: str) -> list:
+    def num(v):
+        return None if pd.isna(v) else float(v)
+
+    # column by column: iterrows would upcast integer borocodes to float
+    regions = ranked[group_col].tolist()
+    if group_col == "borocode":
+        regions = [int(r) for r in regions]
+    return [
+        {"rank": int(rank), "region": region, "metric": num(metric), "count": int(count),
+         "p25": num(p25), "p75": num(p75)}
+        for rank, region, metric, count, p25, p75 in zip(
+            ranked["rank"].tolist(), regions, ranked["metric"].tolist(), ranked["count"].tolist(),
+            ranked["p25"].tolist(), ranked["p75"].tolist(),
+        )
+    ]
+
+
+def publish(result: dict, plans, *parts) -> dict:
+    """Store the deterministic data part of a result under a hash of its compiled plans and the data version.
+
+    The id is returned as result_id; GET /results/{result_id} serves it with ETags.
+    """
+    rid = None
+    if not result.get("error") and plans:
+        data = {k: result.get(k) for k in RESULT_KEYS}
+        rid = results.publish(plans, data, {k: data[k] for k in PLAN_KEYS}, *parts)
+    result["result_id"] = rid
+    return result
+
+
+def build_combined_query(query: str, history: Optional[List[Dict[str, str]]] = None) -> str:
+    if not history:
+        return query
+
+    history_parts = []
+    for m in history:
+        role = m.get("role", "")
+        content = m.get("content", "")
+        if not content:
+            continue
+        if role == "user":
+            prefix = "User: "
+        elif role == "assistant":
+            prefix = "Assistant: "
+        else:
+            prefix = ""
+        history_parts.append(prefix + content)
+    history_text = "\n\n".join(history_parts)
+    return f"Previous conversation:\n{history_text}\n\nNew query:\n{query}"
+
+
+def session_frame_columns(table: str, scale, filters) -> list:
+    """Columns kept alongside a session frame so follow-up filters and columns can run in memory."""
+    spec = SCHEMA_TABLES.get(table)
+    if spec is None:
+        return []
+    attrs = list(spec["cat"]) + list(spec["num"])
+    if SESSION_FRAME_ALL_COLUMNS:
+        cols = list(attrs)
+    elif scale in SESSION_FRAME_NUMERIC_SCALES:
+        cols = list(spec["num"])
+    else:
+        cols = []
+    known = set(attrs) | (set(spec["spine"]) - {"geom"})
+    for f in filters or []:
+        if len(f) == 3 and f[0] in known and f[0] not in cols:
+            cols.append(f[0])
+    return cols
+
+
+def run_analyze(query: str, history: Optional[List[Dict[str, str]]] = None, session=None, level=None, stat=None,
+                explain: str = "llm"):
     print("[run_analyze] Incoming query:", query)
 
-    if history:
-        print("[run_analyze] History provided with", len(history), "messages")
-        history_parts = []
-        for m in history:
-            role = m.get("role", "")
-            content = m.get("content", "")
-            if not content:
-                continue
-            if role == "user":
-                prefix = "User: "
-            elif role == "assistant":
-                prefix = "Assistant: "
-            else:
-                prefix = ""
-            history_parts.append(prefix + content)
-        history_text = "\n\n".join(history_parts)
-        combined_query = f"Previous conversation:\n{history_text}\n\nNew query:\n{query}"
-    else:
-        print("[run_analyze] No history")
-        combined_query = query
+    combined_query = build_combined_query(query, history)
+    print("[run_analyze] History messages:", len(history or []))
 
     print("[run_analyze] Combined query ready")
     messages = build_analyze_plan(combined_query)
     print("[run_analyze] Messages for plan built")
+    stage("plan")
 
-    plan, usage, plan_error = call_llm(messages)
+    plan, usage, plan_error = call_llm(messages, schema=AnalyzePlan)
     print("[run_analyze] Plan received. error:", plan_error, "usage:", usage)
 
     if plan_error or not plan:
@@ -147,32 +311,112 @@ def run_analyze(query: str, history: Optional[List[Dict[str, str]]] = None):
         "table:", table,
         "filters:", filters)
 
-    db_result = get_data_analyze(column=column, scale=scale, table=table, filters=filters)
-    gdf = db_result["gdf"]
-    db_error = db_result["error"]
-    print("[run_analyze] DB result. error:", db_error, "gdf is None:", gdf is None)
+    try:
+        level = resolve_level(scale, level)
+        stat = check_stat(stat)
+    except PlanError as e:
+        print("[run_analyze] Invalid aggregation level:", e)
+        return {
+            "geojson": None,
+            "column": column,
+            "dtype": dtype,
+            "scale": scale,
+            "region": region,
+            "table": table,
+            "filters": filters,
+            "summary": None,
+            "explanation": None,
+            "usage": usage,
+            "error": f"INVALID_PLAN: {e}",
+        }
+    print("[run_analyze] Aggregation level:", level, "stat:", stat)
 
-    summary = create_summary(gdf=gdf, column=column, scale=scale, region=region, dtype=dtype)
+    gdf = None
+    # session frames hold one row per feature, so they only answer feature-level requests
+    if session is not None and level is None:
+        gdf = session.refine(table=table, column=column, scale=scale, region=region, filters=filters)
+
+    stage("data")
+    if gdf is not None:
+        source = "session"
+        plans = None
+        db_error = None
+        memory = None
+        downgrade = None
+        aggregate = None
+        stats = None
+        print("[run_analyze] Reused session frame, rows:", len(gdf))
+    else:
+        source = "db"
+        extra_columns = session_frame_columns(table, scale, filters) if session is not None else None
+        db_result = get_data_analyze(column=column, scale=scale, table=table, filters=filters,
+                                     extra_columns=extra_columns, level=level)
+        gdf = db_result["gdf"]
+        db_error = db_result["error"]
+        plans = [db_result.get("plan")]
+        memory = db_result.get("memory")
+        downgrade = db_result.get("downgrade")
+        aggregate = db_result.get("aggregate")
+        stats = db_result.get("stats")
+        print("[run_analyze] DB result. error:", db_error, "gdf is None:", gdf is None, "memory:", memory)
+
+    # handed back rather than kept here: run() stores it on every caller's session, coalesced ones included
+    session_frame = None
+    if session is not None and gdf is not None and stats is None:
+        session_frame = {"gdf": gdf, "table": table, "column": column, "scale": scale, "region": region,
+                         "filters": filters}
+
+    stage("summary")
+    if downgrade is not None:
+        note = f"{downgrade['applied']} of {downgrade['estimated_rows']} rows"
+        summary = summary_from_stats(stats, column=column, scale=scale, region=region, note=note)
+    elif aggregate is not None:
+        # categorical aggregates map each region's most common value, whatever stat was asked for
+        mapped = "dominant value" if gdf is not None and "share" in gdf.columns else stat
+        if "resolution" in aggregate:
+            note = f"{mapped} per H3 cell, {aggregate['groups']} cells at resolution {aggregate['resolution']}"
+        else:
+            note = f"{mapped} per {aggregate['level']}, {aggregate['groups']} regions"
+        summary = summary_from_stats(stats, column=column, scale=scale, region=region, note=note)
+    else:
+        summary = summarize(gdf, column, scale, region, dtype)
     print("[run_analyze] Summary created")
 
+    stage("explain")
     try:
-        explanation = llm_explain(query=query, summary=summary)
+        explanation, explain_usage = explain_summary(query, summary, explain)
         print("[run_analyze] Explanation created")
     except Exception as e:
         print("[run_analyze] llm_explain crashed:", e)
         traceback.print_exc()
         explanation = f"[llm_explain error: {e}]"
+        explain_usage = None
 
+    stage("encode")
     if gdf is not None:
-        geojson = json.loads(gdf.to_json())
-        print("[run_analyze] GeoJSON created with", len(geojson.get("features", [])), "features")
+        if aggregate is not None:
+            # the mapped value is the requested statistic; categorical aggregates carry the dominant value
+            out_cols = [c for c in (column, aggregate["level"], "count", "share") if c in gdf.columns]
+            out = gdf[out_cols + ["geom"]].copy()
+            if stat != "mean" and stat in gdf.columns and "share" not in gdf.columns:
+                out[column] = gdf[stat]
+        else:
+            out_cols = [c for c in (column, SCALE_GROUP_COL.get(scale)) if c in gdf.columns]
+            out = gdf[out_cols + ["geom"]]
+        geojson = cpu_pool.geojson(out)
+        print("[run_analyze] GeoJSON created with", len(out), "features")
     else:
         geojson = None
         print("[run_analyze] GeoJSON is None (no gdf)")
 
     print("[run_analyze] Usage:", usage)
-    return {
+    return publish({
         "mode": "analyze",
+        "session_frame": session_frame,
+        "source": source,
+        "memory": memory,
+        "downgrade": downgrade,
+        "aggregate": aggregate,
         "geojson": geojson,
         "column": column,
         "dtype": dtype,
@@ -183,39 +427,24 @@ def run_analyze(query: str, history: Optional[List[Dict[str, str]]] = None):
         "summary": summary,
         "explanation": explanation,
         "usage": usage,
+        "explain_usage": explain_usage,
         "error": db_error,
-    }
+    }, plans, stat)
 
 
-def run_search(query: str, history: Optional[List[Dict[str, str]]] = None):
+def run_search(query: str, history: Optional[List[Dict[str, str]]] = None, explain: str = "llm",
+               priority: Optional[int] = None):
     print("[run_search] Incoming query:", query)
 
-    if history:
-        print("[run_search] History provided with", len(history), "messages")
-        history_parts = []
-        for m in history:
-            role = m.get("role", "")
-            content = m.get("content", "")
-            if not content:
-                continue
-            if role == "user":
-                prefix = "User: "
-            elif role == "assistant":
-                prefix = "Assistant: "
-            else:
-                prefix = ""
-            history_parts.append(prefix + content)
-        history_text = "\n\n".join(history_parts)
-        combined_query = f"Previous conversation:\n{history_text}\n\nNew query:\n{query}"
-    else:
-        print("[run_search] No history")
-        combined_query = query
+    combined_query = build_combined_query(query, history)
+    print("[run_search] History messages:", len(history or []))
 
     print("[run_search] Combined query ready")
     messages = build_search_plan(combined_query)
     print("[run_search] Messages for plan built")
+    stage("plan")
 
-    plan, usage, plan_error = call_llm(messages)
+    plan, usage, plan_error = call_llm(messages, priority=PLAN if priority is None else priority, schema=SearchPlan)
     print("[run_search] Plan received. error:", plan_error, "usage:", usage)
 
     if plan_error or not plan:
@@ -282,6 +511,7 @@ def run_search(query: str, history: Optional[List[Dict[str, str]]] = None):
             "error": "MISSING_PLAN_FIELDS",
         }
 
+    stage("data")
     db_result = get_data_search(column=column_s)
     gdf = db_result["gdf"]
     db_error = db_result["error"]
@@ -321,10 +551,16 @@ def run_search(query: str, history: Optional[List[Dict[str, str]]] = None):
         agg_func = "mean"
     print("[run_search] Aggregation function:", agg_func)
 
-    grouped = getattr(gdf.groupby(group_col, dropna=False)[column_s], agg_func)().reset_index(name="metric")
-    print("[run_search] Grouped rows:", len(grouped))
+    if not order or order == "NO_MATCH":
+        order = "descending"
+    ascending = str(order).lower().startswith("asc")
+    print("[run_search] Order:", order, "ascending:", ascending)
+
+    ranked = cpu_pool.run(rank_groups, pd.DataFrame(gdf[[group_col, column_s]]), group_col, column_s, agg_func,
+                          ascending, max(SEARCH_TOP_K, 1))
+    print("[run_search] Ranked rows:", len(ranked))
 
-    if grouped.empty:
+    if ranked.empty:
         print("[run_search] Grouped data empty, returning")
         return {
             "geojson": None,
@@ -338,14 +574,9 @@ def run_search(query: str, history: Optional[List[Dict[str, str]]] = None):
             "error": "NO_GROUPED_DATA",
         }
 
-    if not order or order == "NO_MATCH":
-        order = "descending"
-    ascending = str(order).lower().startswith("asc")
-    print("[run_search] Order:", order, "ascending:", ascending)
-
-    gdf_analyze = grouped.sort_values("metric", ascending=ascending)
-    neighborhood = gdf_analyze.iloc[0][group_col]
-    print("[run_search] Selected neighborhood:", neighborhood)
+    candidates = ranking_candidates(ranked, group_col)
+    neighborhood = candidates[0]["region"]
+    print("[run_search] Selected neighborhood:", neighborhood, "candidates:", len(candidates))
 
     if scale == "borough":
         db_final = get_data_search_final(column=column_s, scale=scale, neighborhood=neighborhood)
@@ -355,6 +586,7 @@ def run_search(query: str, history: Optional[List[Dict[str, str]]] = None):
         db_final = get_data_search_final(column=column_s, scale=scale, neighborhood=neighborhood)
     gdf_final = db_final["gdf"]
     db_final_error = db_final["error"]
+    plans = [db_result.get("plan"), db_final.get("plan")]
     print("[run_search] Final DB result. error:", db_final_error, "gdf_final is None:", gdf_final is None)
 
     if db_final_error or gdf_final is None or gdf_final.empty:
@@ -369,27 +601,38 @@ def run_search(query: str, history: Optional[List[Dict[str, str]]] = None):
             "usage": usage,
             "error": db_final_error or "NO_FINAL_DATA",
         }
+    stage("summary")
     if scale == "borough":
-        summary = create_summary(gdf=gdf_final, column=column_s if scale == "borough" else column_b,
-                            scale=scale, region=neighborhood, dtype=dtype_s)
+        summary = summarize(gdf_final, column_s, scale, neighborhood, dtype_s)
     elif scale == "large_n":
-        summary = create_summary(gdf=gdf_final, column=column_s if scale == "borough" else column_b,
-                            scale=scale, region=neighborhood, dtype=dtype_b)
+        summary = summarize(gdf_final, column_b, scale, neighborhood, dtype_b)
+    ranking = {"column": column_s, "statistic": agg_func, "order": order, "candidates": candidates}
     print("[run_search] Summary created")
 
+    stage("explain")
     try:
-        explanation = llm_explain(query=query, summary=summary)
+        # the ranking lets the explanation answer "and the second best?" without another run
+        explanation, explain_usage = explain_summary(query, {**summary, "ranking": ranking}, explain,
+                                                     EXPLAIN if priority is None else priority)
         print("[run_search] Explanation created")
     except Exception as e:
         print("[run_search] llm_explain crashed:", e)
         traceback.print_exc()
         explanation = f"[llm_explain error: {e}]"
+        explain_usage = None
 
-    geojson = json.loads(gdf_final.to_json())
-    print("[run_search] GeoJSON created with", len(geojson.get("features", [])), "features")
+    stage("encode")
+    geojson = cpu_pool.geojson(gdf_final)
+    print("[run_search] GeoJSON created with", len(gdf_final), "features")
+    try:
+        # outlines of every candidate come from the precomputed region polygons, not another block query
+        ranking_geojson = cpu_pool.geojson(get_region_shapes(ranked, group_col))
+    except Exception as e:
+        print("[run_search] ranking shapes unavailable:", e)
+        ranking_geojson = None
 
     print("[run_search] Usage:", usage)
-    return {
+    return publish({
         "mode": "search",
         "geojson": geojson,
         "column": column_s if scale == "borough" else column_b,
@@ -399,63 +642,49 @@ def run_search(query: str, history: Optional[List[Dict[str, str]]] = None):
         "table": None,
         "filters": None,
         "summary": summary,
+        "ranking": ranking,
+        "ranking_geojson": ranking_geojson,
         "explanation": explanation,
         "usage": usage,
+        "explain_usage": explain_usage,
         "error": db_final_error,
-    }
+    }, plans)
 
 
-def run_compare(query: str, history: Optional[List[Dict[str, str]]] = None):
+def run_compare(query: str, history: Optional[List[Dict[str, str]]] = None, explain: str = "llm",
+                priority: Optional[int] = None):
     print("[run_compare] Incoming query:", query)
 
-    if history:
-        print("[run_compare] History provided with", len(history), "messages")
-        history_parts = []
-        for m in history:
-            role = m.get("role", "")
-            content = m.get("content", "")
-            if not content:
-                continue
-            if role == "user":
-                prefix = "User: "
-            elif role == "assistant":
-                prefix = "Assistant: "
-            else:
-                prefix = ""
-            history_parts.append(prefix + content)
-        history_text = "\n\n".join(history_parts)
-        combined_query = f"Previous conversation:\n{history_text}\n\nNew query:\n{query}"
-    else:
-        print("[run_compare] No history")
-        combined_query = query
+    combined_query = build_combined_query(query, history)
+    print("[run_compare] History messages:", len(history or []))
 
     print("[run_compare] Combined query ready")
     messages = build_compare_plan(combined_query)
     print("[run_compare] Messages for plan built")
+    stage("plan")
 
-    plan, usage, plan_error = call_llm(messages)
+    plan, usage, plan_error = call_llm(messages, priority=PLAN if priority is None else priority, schema=ComparePlan)
     print("[run_compare] Plan received. error:", plan_error, "usage:", usage)
 
     if plan_error or not plan:
         print("[run_compare] Plan error or empty plan, returning fallback")
         return {
             "mode": "compare",
-            "geojson": [None, None],
+            "geojson": None,
             "column": None,
             "dtype": None,
             "scale": None,
-            "region": [None, None],
+            "region": [],
             "table": None,
             "filters": None,
-            "summary": [None, None],
-            "explanation": [None, None],
+            "summary": [],
+            "explanation": None,
             "usage": usage,
             "error": plan_error or "LLM_PLAN_ERROR",
         }
 
     column = plan.get("column")
-    region1 = plan.get("region1")
-    region2 = plan.get("region2")
+    regions = plan.get("regions") or []
     dtype = plan.get("dtype")
     scale = plan.get("scale")
     table = plan.get("table")
@@ -465,116 +694,160 @@ def run_compare(query: str, history: Optional[List[Dict[str, str]]] = None):
         "column:", column,
         "dtype:", dtype,
         "scale:", scale,
-        "region1:", region1,
-        "region2:", region2,
+        "regions:", regions,
         "table:", table,
         "filters:", filters)
 
+    stage("data")
     db_result = get_data_compare(
         column=column,
         scale=scale,
         table=table,
-        region1=region1,
-        region2=region2,
+        regions=regions,
         filters=filters,
     )
     gdf = db_result["gdf"]
     db_error = db_result["error"]
-    print("[run_compare] DB result. error:", db_error, "gdf is None:", gdf is None)
+    plans = [db_result.get("plan")]
+    memory = db_result.get("memory")
+    print("[run_compare] DB result. error:", db_error, "gdf is None:", gdf is None, "memory:", memory)
 
     if db_error or gdf is None:
         print("[run_compare] DB error or gdf is None, returning")
         return {
             "mode": "compare",
-            "geojson": [None, None],
+            "geojson": None,
             "column": column,
             "dtype": dtype,
             "scale": scale,
-            "region": [region1, region2],
+            "region": regions,
             "table": table,
             "filters": filters,
-            "summary": [None, None],
-            "explanation": [None, None],
+            "summary": [None] * len(regions),
+            "explanation": None,
             "usage": usage,
             "error": db_error or "DB_ERROR",
         }
 
-    if scale == "borough":
-        gdf1 = gdf[gdf["borocode"] == region1]
-        gdf2 = gdf[gdf["borocode"] == region2]
-    elif scale == "large_n":
-        gdf1 = gdf[gdf["large_n"] == region1]
-        gdf2 = gdf[gdf["large_n"] == region2]
-    else:
+    group_col = COMPARE_REGION_COL.get(scale)
+    if group_col is None or group_col not in gdf.columns:
         print("[run_compare] Invalid scale:", scale)
         return {
             "mode": "compare",
-            "geojson": [None, None],
+            "geojson": None,
             "column": column,
             "dtype": dtype,
             "scale": scale,
-            "region": [region1, region2],
+            "region": regions,
             "table": table,
             "filters": filters,
-            "summary": [None, None],
-            "explanation": [None, None],
+            "summary": [None] * len(regions),
+            "explanation": None,
             "usage": usage,
             "error": f"INVALID_SCALE_{scale}",
         }
 
-    print("[run_compare] gdf1 rows:", len(gdf1), "gdf2 rows:", len(gdf2))
-
-    summary1 = create_summary(gdf=gdf1, column=column, scale=scale, region=region1, dtype=dtype)
-    summary2 = create_summary(gdf=gdf2, column=column, scale=scale, region=region2, dtype=dtype)
-    print("[run_compare] Summaries created for both regions")
+    print("[run_compare] rows:", len(gdf), "regions:", len(regions))
 
-    combined_summary = {
-        "region1": summary1,
-        "region2": summary2,
-    }
+    stage("summary")
+    if column in gdf.columns:
+        frame = pd.DataFrame(gdf[[group_col, column]])
+    else:
+        frame = pd.DataFrame(gdf[[group_col]])
+    summaries = cpu_pool.run(region_summaries, frame, group_col, column, scale, regions, dtype)
+    print("[run_compare] Summaries created for", len(summaries), "regions")
 
+    stage("explain")
     try:
-        explanation = llm_explain(query=query, summary=combined_summary)
-        print("[run_compare] Explanation created for both regions")
+        explanation, explain_usage = explain_summary(query, {"regions": summaries}, explain,
+                                                     EXPLAIN if priority is None else priority)
+        print("[run_compare] Explanation created for all regions")
     except Exception as e:
         print("[run_compare] llm_explain crashed:", e)
         traceback.print_exc()
         explanation = f"[llm_explain error: {e}]"
+        explain_usage = None
 
-    geojson0 = json.loads(gdf.to_json()) if gdf is not None else None
-    geojson1 = json.loads(gdf1.to_json()) if gdf1 is not None else None
-    geojson2 = json.loads(gdf2.to_json()) if gdf2 is not None else None
-    print("[run_compare] GeoJSON created. total:",
-        len(geojson0.get("features", [])) if geojson0 else 0,
-        "region1:",
-        len(geojson1.get("features", [])) if geojson1 else 0,
-        "region2:",
-        len(geojson2.get("features", [])) if geojson2 else 0)
+    stage("encode")
+    # one collection for every region; each feature carries its region in group_col for the client to split on
+    geojson = cpu_pool.geojson(gdf)
+    print("[run_compare] GeoJSON created with", len(gdf), "features")
 
     print("[run_compare] Usage:", usage)
-    return {
+    return publish({
         "mode": "compare",
-        "geojson": [geojson0, geojson1, geojson2],
+        "memory": memory,
+        "geojson": geojson,
         "column": column,
         "dtype": dtype,
         "scale": scale,
-        "region": [region1, region2],
+        "region": regions,
         "table": table,
         "filters": filters,
-        "summary": [summary1, summary2],
+        "summary": summaries,
         "explanation": explanation,
         "usage": usage,
+        "explain_usage": explain_usage,
         "error": db_error,
+    }, plans)
+
+
+def public_result(result: dict) -> dict:
+    """Fields of a run() result returned to API clients."""
+    return {
+        "mode": result['mode'],
+        "source": result.get('source'),
+        "memory": result.get('memory'),
+        "downgrade": result.get('downgrade'),
+        "aggregate": result.get('aggregate'),
+        "geojson": result['geojson'],
+        "column": result['column'],
+        "dtype": result['dtype'],
+        "scale": result['scale'],
+        "region": result['region'],
+        "table": result['table'],
+        "filters": result['filters'],
+        "summary": result['summary'],
+        "ranking": result.get('ranking'),
+        "ranking_geojson": result.get('ranking_geojson'),
+        "explanation": result['explanation'],
+        "usage": result['usage'],
+        "mode_usage": result.get('mode_usage'),
+        "explain_usage": result.get('explain_usage'),
+        "error": result['error'],
+        "session_id": result['session_id'],
+        "result_id": result.get('result_id'),
+        "result_url": f"/results/{result['result_id']}" if result.get('result_id') else None,
     }
 
 
-def run(query: str):
+def run(query: str, session_id: Optional[str] = None, history: Optional[List[Dict[str, str]]] = None,
+        level: Optional[str] = None, stat: Optional[str] = None, explain: str = "llm",
+        budget_s: float = LLM_REQUEST_BUDGET_S):
     print("[run] Top-level run called with query:", query)
+    session = sessions.get(session_id, history)
+    with session.lock, deadline(budget_s):
+        context = session.context()
+        # concurrent identical questions over the same context share one pipeline run;
+        # each caller gets its own copy to attach its session id to
+        key = make_key(" ".join(query.lower().split()), context, level, stat, explain)
+        result = dict(runs.do(key, _run, query, context, session, level, stat, explain))
+        session_frame = result.pop("session_frame", None)
+        if session_frame is not None:
+            session.keep_frame(**session_frame)
+        session.record(query, result)
+    result["session_id"] = session.id
+    return result
+
+
+def _run(query: str, history: Optional[List[Dict[str, str]]] = None, session=None, level=None, stat=None,
+         explain: str = "llm"):
     try:
-        messages = select_mode(query)
+        messages = select_mode(build_combined_query(query, history))
         print("[run] Mode selection messages built")
+        stage("mode")
 
-        mode_json, usage_mode, mode_error = call_llm(messages)
+        mode_json, usage_mode, mode_error = call_llm(messages, stage="mode", schema=ModeChoice)
         print("[run] Mode selection result. error:", mode_error, "usage:", usage_mode, "mode_json:", mode_json)
 
         if mode_error or not mode_json:
@@ -598,11 +871,11 @@ def run(query: str):
         print("[run] Selected mode:", mode)
 
         if mode == "analyze":
-            result = run_analyze(query)
+            result = run_analyze(query, history, session, level, stat, explain)
         elif mode == "search":
-            result = run_search(query)
+            result = run_search(query, history, explain)
         elif mode == "compare":
-            result = run_compare(query)
+            result = run_compare(query, history, explain)
         else:
             print("[run] Mode not implemented:", mode)
             return {
@@ -625,6 +898,9 @@ def run(query: str):
         result["mode_usage"] = usage_mode
         return result
 
+    except Overloaded:
+        # surfaced to the client as 429/503 instead of a generic error payload
+        raise
     except Exception as e:
         print("[run] Exception in top-level run:", e)
         traceback.print_exc()
@@ -0,0 +1,217 @@
+import json
+import hashlib
+
+from .llm.llm_prompt import SCHEMA_TABLES
+from .dtypes import dtype_map, TRUE_VALUES, FALSE_VALUES
+from .config import CITY_AGGREGATE_LEVEL, H3_RESOLUTIONS
+from . import hexgrid
+
+ALLOWED_OPS = ("=", ">", "<", ">=", "<=")
+SCALE_GROUP_COL = {
+    "city": "borocode",
+    "borough": "large_n",
+    "large_n": "small_n",
+}
+AGGREGATE_LEVELS = ("small_n", "large_n", "borocode", hexgrid.LEVEL)
+AGGREGATE_STATS = ("mean", "median", "count", "min", "max")
+COMPARE_REGION_COL = {
+    "borough": "borocode",
+    "large_n": "large_n",
+}
+
+
+class PlanError(ValueError):
+    pass
+
+
+def resolve_level(scale, level=None):
+    """Region level an analyze result is aggregated to, or None for one feature per row."""
+    if level in (None, "", "auto"):
+        level = CITY_AGGREGATE_LEVEL if scale == "city" else "feature"
+    if level == "feature":
+        return None
+    if level not in AGGREGATE_LEVELS:
+        raise PlanError(f"invalid aggregation level: {level}")
+    return level
+
+
+def check_stat(stat):
+    if stat not in (None,) + AGGREGATE_STATS:
+        raise PlanError(f"invalid aggregation statistic: {stat}")
+    return stat or "mean"
+
+
+def table_columns(table: str) -> list:
+    spec = SCHEMA_TABLES.get(table)
+    if spec is None:
+        raise PlanError(f"unknown table: {table}")
+    cols = [c for c in spec["spine"] if c != "geom"]
+    return cols + list(spec["cat"]) + list(spec["num"])
+
+
+def _check_column(table: str, col) -> str:
+    if not isinstance(col, str) or col not in table_columns(table):
+        raise PlanError(f"unknown column for {table}: {col}")
+    return col
+
+
+def coerce_value(table: str, col: str, val):
+    kind = dtype_map(table).get(col)
+    if col == "borocode":
+        try:
+            code = int(float(val))
+        except (TypeError, ValueError):
+            raise PlanError(f"invalid borocode: {val}")
+        if not 1 <= code <= 5:
+            raise PlanError(f"invalid borocode: {val}")
+        return code
+    if kind == "numeric":
+        try:
+            return float(val)
+        except (TypeError, ValueError):
+            raise PlanError(f"invalid numeric value for {col}: {val}")
+    if kind == "bool":
+        text = str(val).strip().lower()
+        if text not in TRUE_VALUES | FALSE_VALUES:
+            raise PlanError(f"invalid boolean value for {col}: {val}")
+        return text in TRUE_VALUES
+    if val is None or isinstance(val, (list, dict)):
+        raise PlanError(f"invalid value for {col}: {val}")
+    return str(val)
+
+
+def normalize_filters(table: str, filters) -> list:
+    """Validated, deduplicated filters in canonical (col, op) order."""
+    out = []
+    for f in filters or []:
+        if not isinstance(f, (list, tuple)) or len(f) != 3:
+            raise PlanError(f"malformed filter: {f}")
+        col, op, val = f
+        if val == "NO_MATCH":
+            continue
+        _check_column(table, col)
+        if op not in ALLOWED_OPS:
+            raise PlanError(f"operator not allowed: {op}")
+        item = (col, op, coerce_value(table, col, val))
+        if item not in out:
+            out.append(item)
+    return sorted(out, key=lambda f: (f[0], ALLOWED_OPS.index(f[1]), str(f[2])))
+
+
+def _statement(table: str, select_cols: list, conditions: list, params: list, geometry: bool = True) -> dict:
+    """Build both the driver SQL and the PREPARE body for one canonical shape."""
+    where_driver = []
+    where_prepared = []
+    for i, cond in enumerate(conditions):
+        where_driver.append(cond.format(param=f"%(p{i})s"))
+        where_prepared.append(cond.format(param=f"${i + 1}"))
+    head = f"SELECT {', '.join(select_cols + (['geom'] if geometry else []))} FROM public.{table} WHERE "
+    where_sql = " AND ".join(where_driver) or "TRUE"
+    prepared = head + (" AND ".join(where_prepared) or "TRUE")
+    return {
+        "table": table,
+        "column": select_cols[0],
+        "columns": select_cols,
+        "where_sql": where_sql,
+        "sql": head + where_sql,
+        "prepared_sql": prepared,
+        "name": "gq_" + hashlib.sha1(prepared.encode()).hexdigest()[:16],
+        "params": {f"p{i}": v for i, v in enumerate(params)},
+        "geometry": geometry,
+    }
+
+
+def plan_digest(compiled: dict) -> str:
+    """Stable hash of a compiled statement and its output options."""
+    return hashlib.sha256(json.dumps(compiled, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _select(table: str, column, fixed: list, extra_columns=None) -> list:
+    if not column or column == "NO_MATCH":
+        raise PlanError("no appropriate column")
+    cols = [_check_column(table, column)]
+    for col in fixed + list(extra_columns or []):
+        _check_column(table, col)
+        if col not in cols:
+            cols.append(col)
+    return cols
+
+
+def compile_analyze(column, scale, table, filters, extra_columns=None, level=None) -> dict:
+    group_col = SCALE_GROUP_COL.get(scale)
+    if group_col is None:
+        raise PlanError(f"invalid scale: {scale}")
+    _check_table(table)
+    select_cols = _select(table, column, [group_col], extra_columns)
+    norm = normalize_filters(table, filters)
+    compiled = _statement(table, select_cols, [f"{c} {op} {{param}}" for c, op, _ in norm], [v for _, _, v in norm])
+    compiled["filters"] = norm
+    if level is not None:
+        if level not in AGGREGATE_LEVELS:
+            raise PlanError(f"invalid aggregation level: {level}")
+        compiled["aggregate_level"] = level
+        if level == hexgrid.LEVEL:
+            if not hexgrid.available():
+                raise PlanError("hex-grid output needs the h3 package")
+            compiled["h3_resolution"] = H3_RESOLUTIONS[scale]
+    return compiled
+
+
+def compile_frame(table, columns, filters) -> dict:
+    """Attribute-only selection shared by several plans; no geometry is fetched."""
+    _check_table(table)
+    if not columns:
+        raise PlanError("no columns requested")
+    select_cols = _select(table, columns[0], list(columns[1:]))
+    norm = normalize_filters(table, filters)
+    compiled = _statement(table, select_cols, [f"{c} {op} {{param}}" for c, op, _ in norm],
+                          [v for _, _, v in norm], geometry=False)
+    compiled["filters"] = norm
+    return compiled
+
+
+def compile_search(column) -> dict:
+    table = "street_block"
+    compiled = _statement(table, _select(table, column, ["borocode", "large_n"]), [], [])
+    compiled["filters"] = []
+    return compiled
+
+
+def compile_search_final(column, scale, neighborhood) -> dict:
+    if scale == "large_n":
+        table, fixed, region_col = "buildings", ["large_n", "small_n"], "large_n"
+    elif scale == "borough":
+        table, fixed, region_col = "street_block", ["borocode", "large_n"], "borocode"
+    else:
+        raise PlanError(f"unsupported scale: {scale}")
+    if neighborhood is None:
+        raise PlanError("missing scale or neighborhood")
+    value = coerce_value(table, region_col, neighborhood)
+    compiled = _statement(table, _select(table, column, fixed), [f"{region_col} = {{param}}"], [value])
+    compiled["filters"] = [(region_col, "=", value)]
+    return compiled
+
+
+def compile_compare(column, scale, table, regions, filters) -> dict:
+    region_col = COMPARE_REGION_COL.get(scale)
+    if region_col is None:
+        raise PlanError(f"invalid scale: {scale}")
+    _check_table(table)
+    values = []
+    for r in regions:
+        v = coerce_value(table, region_col, r)
+        if v not in values:
+            values.append(v)
+    norm = [f for f in normalize_filters(table, filters) if f[0] != region_col]
+    # one shape for any number of regions: the list travels as a single array parameter
+    conditions = [f"{region_col} = ANY({{param}})"] + [f"{c} {op} {{param}}" for c, op, _ in norm]
+    compiled = _statement(table, _select(table, column, [region_col]), conditions, [values] + [v for _, _, v in norm])
+    compiled["filters"] = norm
+    compiled["region_col"] = region_col
+    compiled["regions"] = values
+    return compiled
+
+
+def _check_table(table):
+    if table not in SCHEMA_TABLES:
+        raise PlanError(f"unknown table: {table}")
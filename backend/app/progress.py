@@ -0,0 +1,21 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_reporter = ContextVar("progress_reporter", default=None)
+
+
+@contextmanager
+def reporting(fn):
+    """Send every stage() call made in this context to fn(name, **info)."""
+    token = _reporter.set(fn)
+    try:
+        yield
+    finally:
+        _reporter.reset(token)
+
+
+def stage(name: str, **info):
+    """Mark the start of a pipeline stage for whoever tracks this request (a job); a no-op otherwise."""
+    fn = _reporter.get()
+    if fn is not None:
+        fn(name, **info)
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import fcntl
+import threading
+
+import pandas as pd
+import geopandas as gpd
+
+from .config import REGIONS_DIR, REGIONS_JSON, NEIGHBORHOOD_CSV
+
+LEVELS = ("small_n", "large_n", "borocode")
+
+
+def membership() -> pd.DataFrame:
+    """One row per small_n with its large_n and borocode, from the neighbourhood list and regions.json."""
+    rows = pd.read_csv(NEIGHBORHOOD_CSV, dtype={"borocode": int, "large_n": str, "small_n": str})
+    try:
+        with open(REGIONS_JSON) as f:
+            tree = json.load(f)
+        nested = pd.DataFrame(
+            [(int(boro), large, small) for boro, larges in tree.items() for large, smalls in larges.items() for small in smalls],
+            columns=["borocode", "large_n", "small_n"],
+        )
+        merged = rows.merge(nested, how="outer", indicator=True)
+        mismatched = merged[merged["_merge"] != "both"]
+        if len(mismatched):
+            print("[regions] neighbourhood list and regions.json disagree on:", mismatched["small_n"].tolist())
+        rows = merged.drop(columns="_merge")
+    except OSError as e:
+        print("[regions] regions.json not read:", e)
+    return rows.drop_duplicates("small_n").reset_index(drop=True)
+
+
+def _path(directory: str, level: str) -> str:
+    return os.path.join(directory, f"{level}.parquet")
+
+
+def build(dissolve, directory: str = REGIONS_DIR):
+    """Dissolve street blocks once per small_n, then union those shapes up the membership tree."""
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    small = dissolve()
+    small = small.merge(membership(), on="small_n", how="left")
+    orphans = small[small["large_n"].isna()]["small_n"].tolist()
+    if orphans:
+        print("[regions] small_n without membership:", orphans)
+
+    frames = {"small_n": small}
+    for level, keep in (("large_n", ["borocode"]), ("borocode", [])):
+        parts = small.dropna(subset=[level])
+        frames[level] = parts[[level] + keep + ["geom"]].dissolve(by=level, aggfunc="first").reset_index()
+
+    for level, gdf in frames.items():
+        gdf = gdf.copy()
+        gdf["borocode"] = gdf["borocode"].astype("Int64")
+        gdf.to_parquet(_path(directory, level) + ".tmp")
+        os.replace(_path(directory, level) + ".tmp", _path(directory, level))
+        print("[regions] wrote", level, "polygons:", len(gdf))
+    print("[regions] built in", round(time.perf_counter() - start, 1), "s")
+
+
+class RegionPolygons:
+    """Dissolved region polygons per level, persisted once and read into each process on first use."""
+
+    def __init__(self, directory: str = REGIONS_DIR):
+        self.directory = directory
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _ensure_built(self, dissolve):
+        def missing():
+            return [lvl for lvl in LEVELS if not os.path.exists(_path(self.directory, lvl))]
+
+        if not missing():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".build.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if missing():
+                    build(dissolve, self.directory)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get(self, level: str, dissolve) -> gpd.GeoDataFrame:
+        """Polygons for level; dissolve() returns street blocks unioned per small_n if a build is needed."""
+        if level not in LEVELS:
+            raise ValueError(f"unknown region level: {level}")
+        with self._lock:
+            if level not in self._frames:
+                self._ensure_built(dissolve)
+                gdf = gpd.read_parquet(_path(self.directory, level))
+                self._frames[level] = gdf[[level, "geom"]].set_geometry("geom")
+                print("[regions] loaded", level, "polygons:", len(gdf))
+            return self._frames[level]
+
+
+polygons = RegionPolygons()
@@ -0,0 +1,131 @@
+import re
+import threading
+from functools import lru_cache
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.neighbors import NearestNeighbors
+
+from .llm.llm_prompt import SCHEMA_TABLES
+from .regions import membership
+from .plan_compiler import table_columns
+from .metrics import metrics
+from .config import RESOLVER_MIN_SCORE
+
+BOROUGH_NAMES = {
+    1: ["manhattan", "mn", "new york county"],
+    2: ["bronx", "the bronx", "bx"],
+    3: ["brooklyn", "bk", "kings county"],
+    4: ["queens", "qn", "queens county"],
+    5: ["staten island", "si", "richmond county"],
+}
+
+
+def _norm(text) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(text).lower()).split())
+
+
+class NameIndex:
+    """Exact lookup on normalized names, then a char n-gram TF-IDF nearest neighbour."""
+
+    def __init__(self, names, values):
+        self.exact = {}
+        for name, value in zip(names, values):
+            self.exact.setdefault(_norm(name), value)
+        keys = list(self.exact)
+        self.values = [self.exact[k] for k in keys]
+        self.vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 3))
+        self.nn = NearestNeighbors(n_neighbors=1, metric="cosine").fit(self.vectorizer.fit_transform(keys))
+        self.lookup = lru_cache(maxsize=4096)(self._lookup)
+
+    def _lookup(self, text):
+        """(value, similarity in [0, 1]) of the closest name."""
+        key = _norm(text)
+        if key in self.exact:
+            return self.exact[key], 1.0
+        if not key:
+            return None, 0.0
+        dist, idx = self.nn.kneighbors(self.vectorizer.transform([key]))
+        return self.values[idx[0][0]], 1.0 - float(dist[0][0])
+
+
+class Resolver:
+    """Snaps plan regions and columns onto values that exist, before any SQL runs.
+
+    Regions come from the neighbourhood membership (small_n names resolve to
+    their parent large_n), boroughs from names and common abbreviations, and
+    columns from the schema of the chosen table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def build(self):
+        with self._lock:
+            if self._ready:
+                return
+            members = membership()
+            large = sorted(members["large_n"].unique())
+            self.large_n = NameIndex(large + members["small_n"].tolist(), large + members["large_n"].tolist())
+            self.small_n = NameIndex(members["small_n"].tolist(), members["small_n"].tolist())
+            self.borough = NameIndex(
+                [name for names in BOROUGH_NAMES.values() for name in names],
+                [code for code, names in BOROUGH_NAMES.items() for _ in names],
+            )
+            self.columns = {}
+            for table in SCHEMA_TABLES:
+                cols = table_columns(table)
+                self.columns[table] = NameIndex(cols + [c.replace("_", " ") for c in cols], cols + cols)
+            self._ready = True
+            print("[resolver] ready:", len(large), "large_n,", len(members), "small_n")
+
+    def _index(self, name: str):
+        if not self._ready:
+            self.build()
+        return getattr(self, name)
+
+    def _snap(self, index: NameIndex, value, what: str):
+        hit, score = index.lookup(str(value))
+        if hit is None or score < RESOLVER_MIN_SCORE:
+            metrics.incr(f"resolver.miss.{what}")
+            raise ValueError(f"unknown {what}: {value!r}")
+        if hit != value:
+            metrics.incr(f"resolver.snapped.{what}")
+            print(f"[resolver] {what}: {value!r} -> {hit!r} ({score:.2f})")
+        return hit
+
+    def column(self, value, table):
+        if value == "NO_MATCH" or table not in SCHEMA_TABLES:
+            return value
+        return self._snap(self._index("columns")[table], value, "column")
+
+    def region(self, value, scale):
+        if value is None or value == "NO_MATCH":
+            return value
+        if scale == "borough":
+            if isinstance(value, (int, float)) or str(value).strip().isdigit():
+                code = int(float(value))
+                if 1 <= code <= 5:
+                    return code
+                raise ValueError(f"unknown borough: {value!r}")
+            return self._snap(self._index("borough"), value, "borough")
+        if scale == "large_n":
+            return self._snap(self._index("large_n"), value, "large_n")
+        return value
+
+    def filters(self, filters, table):
+        out = []
+        for col, op, val in filters:
+            col = self.column(col, table)
+            if op == "=" and val is not None and val != "NO_MATCH":
+                if col == "borocode":
+                    val = self.region(val, "borough")
+                elif col == "large_n":
+                    val = self.region(val, "large_n")
+                elif col == "small_n":
+                    val = self._snap(self._index("small_n"), val, "small_n")
+            out.append([col, op, val])
+        return out
+
+
+resolver = Resolver()
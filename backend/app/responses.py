@@ -0,0 +1,177 @@
+import re
+import gzip
+import json
+import time
+import uuid
+import hashlib
+import threading
+
+from fastapi.responses import Response
+
+from .metrics import metrics
+from .ttl_cache import TTLCache
+from .config import COMPRESS_ENCODINGS, COMPRESS_MIN_BYTES, PAYLOAD_CACHE_SIZE, PAYLOAD_CACHE_TTL_S
+
+# placeholder left in the skeleton where a pre-serialized value is spliced back in
+_MARK = f"@@rawjson-{uuid.uuid4().hex}-"
+_SLOT = re.compile(f'"{re.escape(_MARK)}(\\d+)"')
+
+
+class RawJSON(str):
+    """Already-serialized JSON, spliced into a response as-is instead of being parsed and re-encoded."""
+
+
+def dumps(payload) -> bytes:
+    """JSON bytes for payload; RawJSON values anywhere inside it are inserted verbatim."""
+    raws = []
+
+    def swap(value):
+        if isinstance(value, RawJSON):
+            raws.append(value)
+            return f"{_MARK}{len(raws) - 1}"
+        if isinstance(value, dict):
+            return {k: swap(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [swap(v) for v in value]
+        return value
+
+    text = json.dumps(swap(payload), ensure_ascii=False, separators=(",", ":"), default=str)
+    if raws:
+        text = _SLOT.sub(lambda m: raws[int(m.group(1))], text)
+    return text.encode("utf-8")
+
+
+def _codecs() -> dict:
+    codecs = {"gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0)}
+    # brotli and zstd are optional; without them only gzip is offered
+    try:
+        import brotli
+        codecs["br"] = lambda body: brotli.compress(body, quality=5)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        codecs["zstd"] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+    except ImportError:
+        pass
+    return {name: codecs[name] for name in COMPRESS_ENCODINGS if name in codecs}
+
+
+CODECS = _codecs()
+
+
+def negotiate(accept_encoding) -> str:
+    """Best encoding we offer for an Accept-Encoding header, or None for identity."""
+    offered = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if token.strip():
+            offered[token.strip().lower()] = q
+    best, best_q = None, 0.0
+    # CODECS is in preference order, so ties keep the earlier encoding
+    for name in CODECS:
+        q = offered.get(name, offered.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class Payload:
+    """A serialized body and its compressed variants, each computed at most once."""
+
+    def __init__(self, body: bytes, digest: str = None):
+        self.body = body
+        self.digest = digest
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        """(bytes, content-encoding or None) to send for a negotiated encoding."""
+        if encoding is None or len(self.body) < COMPRESS_MIN_BYTES:
+            return self.body, None
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                start = time.perf_counter()
+                data = CODECS[encoding](self.body)
+                metrics.observe(f"compress.{encoding}", (time.perf_counter() - start) * 1000)
+                metrics.incr(f"compress.{encoding}.bytes_in", len(self.body))
+                metrics.incr(f"compress.{encoding}.bytes_out", len(data))
+                self._encoded[encoding] = data
+        if len(data) >= len(self.body):
+            return self.body, None
+        metrics.incr(f"compress.{encoding}.served")
+        return data, encoding
+
+
+payloads = TTLCache("payload", PAYLOAD_CACHE_SIZE, PAYLOAD_CACHE_TTL_S)
+
+
+def payload_for(body: bytes) -> Payload:
+    """The cached Payload for identical bytes, so a hot answer is only ever compressed once.
+
+    Only for bodies that can repeat byte for byte, such as the stored /results data.
+    """
+    digest = hashlib.sha256(body).hexdigest()
+    payload = payloads.get(digest)
+    if payload is None:
+        payload = Payload(body, digest)
+        payloads.put(digest, payload)
+    return payload
+
+
+def etag(tag: str, encoding=None) -> str:
+    # each encoding is a different representation, so it gets its own strong validator
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def etag_matches(if_none_match, tag: str) -> bool:
+    """If-None-Match check (weak comparison, any encoding of tag matches)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        candidate = candidate.removeprefix("W/").strip('"')
+        if candidate == tag or candidate.rsplit("-", 1)[0] == tag and candidate.rsplit("-", 1)[1] in CODECS:
+            return True
+    return False
+
+
+def _representation(request, payload: Payload, headers=None, tag=None):
+    """Bytes and headers for the encoding the client's Accept-Encoding negotiates."""
+    data, encoding = payload.encoded(negotiate(request.headers.get("accept-encoding")))
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if tag:
+        headers["ETag"] = etag(tag, encoding)
+    return data, headers
+
+
+def send(request, payload: Payload, status_code: int = 200, headers=None, tag=None) -> Response:
+    """Response for a payload, compressed as the client's Accept-Encoding allows; tag adds an ETag."""
+    data, headers = _representation(request, payload, headers, tag)
+    return Response(content=data, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def not_modified(request, payload: Payload, headers=None, tag=None) -> Response:
+    """304 for a payload, validated by the same ETag send would give the full response."""
+    _, headers = _representation(request, payload, headers, tag)
+    headers.pop("Content-Encoding", None)
+    return Response(status_code=304, headers=headers)
+
+
+def json_response(request, content, status_code: int = 200, headers=None) -> Response:
+    # per-request bodies (session ids, latencies) never repeat, so they bypass the payload cache
+    return send(request, Payload(dumps(content)), status_code, headers)
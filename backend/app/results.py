@@ -0,0 +1,106 @@
+import os
+import re
+import time
+import hashlib
+import threading
+
+from .singleflight import make_key
+from .responses import dumps, payload_for
+from .ttl_cache import TTLCache
+from .data_backend import data_version
+from .config import RESULTS_DIR, RESULT_CACHE_SIZE, RESULT_TTL_S
+
+RESULT_ID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{32}$")
+
+
+def _vtag(version: str) -> str:
+    return hashlib.sha1(version.encode()).hexdigest()[:8]
+
+
+def result_id(plans: list, *parts):
+    """<data version tag>-<hash of compiled plans and parts>, or None when a plan or the data version is missing."""
+    if not plans or any(p is None for p in plans):
+        return None
+    version = data_version()
+    if not version:
+        return None
+    digest = hashlib.sha256(make_key(plans, parts, version).encode()).hexdigest()[:32]
+    return f"{_vtag(version)}-{digest}"
+
+
+def is_current(rid: str) -> bool:
+    """True when rid was minted against the data version being served now."""
+    version = data_version()
+    return bool(version) and rid.split("-", 1)[0] == _vtag(version)
+
+
+class ResultStore:
+    """Data parts of answers by result id: in memory, then as files every worker can serve."""
+
+    def __init__(self, directory: str = RESULTS_DIR):
+        self.directory = directory
+        self._cache = TTLCache("result", RESULT_CACHE_SIZE, RESULT_TTL_S)
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _path(self, rid: str) -> str:
+        return os.path.join(self.directory, rid + ".json")
+
+    def publish(self, plans: list, content: dict, *parts):
+        """Store content under its result id and return the id (None when it is not addressable)."""
+        rid = result_id(plans, *parts)
+        if rid is None:
+            return None
+        if self._cache.get(rid) is not None:
+            return rid
+        payload = payload_for(dumps(content))
+        self._cache.put(rid, payload)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp = f"{self._path(rid)}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(payload.body)
+                os.replace(tmp, self._path(rid))
+            except OSError as e:
+                print("[results] write failed:", e)
+            self._maybe_sweep()
+        return rid
+
+    def get(self, rid: str):
+        """The stored Payload, or None when it expired or was never published."""
+        payload = self._cache.get(rid)
+        if payload is not None or not self.directory:
+            return payload
+        path = self._path(rid)
+        try:
+            if time.time() - os.stat(path).st_mtime > RESULT_TTL_S:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                payload = payload_for(f.read())
+        except OSError:
+            return None
+        self._cache.put(rid, payload)
+        return payload
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < min(RESULT_TTL_S, 3600):
+                return
+            self._last_sweep = now
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.stat(path).st_mtime > RESULT_TTL_S:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            print("[results] expired", removed, "result files")
+
+
+results = ResultStore()
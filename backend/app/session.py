@@ -0,0 +1,138 @@
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from typing import List, Dict, Optional
+
+from .filters import filter_mask, is_refinement
+from .config import (
+    SESSION_TTL_S, SESSION_MAX, SESSION_RECENT_TURNS, SESSION_TURN_CHARS, SESSION_MAX_PLANS,
+    SESSION_FRAME_MAX_ROWS, SESSION_FRAME_MAX_BYTES, SESSION_FRAMES_TOTAL_BYTES,
+)
+
+STATE_KEYS = ("mode", "table", "column", "dtype", "scale", "region", "filters")
+
+
+def _clip(text: str) -> str:
+    text = " ".join(str(text).split())
+    if len(text) <= SESSION_TURN_CHARS:
+        return text
+    return text[:SESSION_TURN_CHARS] + "..."
+
+
+class Session:
+    def __init__(self, session_id: str, store=None):
+        self.id = session_id
+        self.store = store
+        self.turns = deque(maxlen=2 * SESSION_RECENT_TURNS)
+        self.plans = deque(maxlen=SESSION_MAX_PLANS)
+        self.state = {}
+        self.frame = None
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def seed(self, history: Optional[List[Dict[str, str]]]):
+        # client-side history is only used to bootstrap a fresh session
+        for m in history or []:
+            content = m.get("content", "")
+            if content and m.get("role") in ("user", "assistant"):
+                self.turns.append({"role": m["role"], "content": _clip(content)})
+
+    def context(self) -> List[Dict[str, str]]:
+        """Bounded history for the plan prompt: compact state plus the last few turns."""
+        messages = []
+        if self.state:
+            state_json = json.dumps(self.state, ensure_ascii=False, separators=(",", ":"), default=str)
+            messages.append({"role": "assistant", "content": f"Current analysis state: {state_json}"})
+        messages.extend(self.turns)
+        return messages
+
+    def keep_frame(self, gdf, table, column, scale, region, filters):
+        size = int(gdf.memory_usage(deep=True).sum())
+        if len(gdf) > SESSION_FRAME_MAX_ROWS or size > SESSION_FRAME_MAX_BYTES:
+            print("[session] frame not kept:", len(gdf), "rows,", size, "bytes")
+            self.frame = None
+            return
+        # keyed without the column: a frame that carries other columns answers them too
+        self.frame = {"key": (table, scale, region), "filters": filters, "gdf": gdf, "bytes": size}
+        if self.store is not None:
+            self.store.trim_frames(self)
+
+    def refine(self, table, column, scale, region, filters):
+        """Answer a follow-up from the previous result when its filters only narrow it down."""
+        frame = self.frame
+        if frame is None or frame["key"] != (table, scale, region):
+            return None
+        gdf = frame["gdf"]
+        if column not in gdf.columns:
+            return None
+        try:
+            if not is_refinement(filters, frame["filters"]):
+                return None
+            if any(col not in gdf.columns for col, _, _ in filters or []):
+                return None
+            mask = filter_mask(gdf, filters)
+        except (ValueError, TypeError) as e:
+            print("[session] refine failed, falling back to db:", e)
+            return None
+        print("[session] refined previous frame:", len(gdf), "->", int(mask.sum()), "rows")
+        return gdf[mask]
+
+    def record(self, query: str, result: dict):
+        self.turns.append({"role": "user", "content": _clip(query)})
+        explanation = result.get("explanation")
+        if isinstance(explanation, list):
+            explanation = " ".join(e for e in explanation if e)
+        if explanation:
+            self.turns.append({"role": "assistant", "content": _clip(explanation)})
+
+        if result.get("mode") and not result.get("error"):
+            self.state = {k: result.get(k) for k in STATE_KEYS if result.get(k) is not None}
+            self.plans.append(dict(self.state))
+        self.updated = time.time()
+
+
+class SessionStore:
+    def __init__(self):
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str], history: Optional[List[Dict[str, str]]] = None) -> Session:
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id or uuid.uuid4().hex, store=self)
+                session.seed(history)
+                self._sessions[session.id] = session
+                print("[session] created:", session.id)
+            self._sessions.move_to_end(session.id)
+            session.updated = now
+            return session
+
+    def trim_frames(self, keep: Session):
+        """Drop frames of the least recently used sessions until all frames fit SESSION_FRAMES_TOTAL_BYTES."""
+        with self._lock:
+            held = [(s, s.frame) for s in self._sessions.values() if s.frame is not None]
+            total = sum(frame["bytes"] for _, frame in held)
+            for s, frame in held:
+                if total <= SESSION_FRAMES_TOTAL_BYTES:
+                    break
+                if s is keep:
+                    continue
+                total -= frame["bytes"]
+                s.frame = None
+                print("[session] dropped frame of", s.id)
+
+    def _evict(self, now: float):
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) < SESSION_MAX and now - oldest.updated < SESSION_TTL_S:
+                break
+            del self._sessions[oldest_id]
+            print("[session] evicted:", oldest_id)
+
+
+sessions = SessionStore()
@@ -0,0 +1,63 @@
+import json
+import threading
+
+from .metrics import metrics
+from .config import SINGLE_FLIGHT
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers with the same key wait for it and share its result.
+
+    Nothing is cached: the key is released as soon as the call finishes, so a
+    later identical request runs again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        if not SINGLE_FLIGHT:
+            return fn(*args, **kwargs)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f"singleflight.{self.name}.leader")
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                print(f"[singleflight] {self.name}: {call.waiters} request(s) shared one call")
+        return call.result
+
+
+def make_key(*parts) -> str:
+    """Stable key for JSON-like parts (dicts are order-insensitive)."""
+    return json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
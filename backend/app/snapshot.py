@@ -0,0 +1,523 @@
+import os
+import sys
+import json
+import time
+import fcntl
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from .llm.llm_prompt import SCHEMA_TABLES
+from .filters import active_filters
+from .dtypes import compact_frame, dtype_map
+from .metrics import metrics
+from .guardrail import decide
+from .aggregate import numeric_stats, categorical_groups, attach, percentiles
+from .plan_compiler import table_columns
+from . import hexgrid
+from .config import SNAPSHOT_DIR, H3_RESOLUTIONS
+
+HASH_INDEX_COLS = ("borocode", "large_n", "small_n")
+# tables whose centroid H3 cells are precomputed at build time
+H3_TABLES = ("buildings",)
+OPS = ("=", ">", ">=", "<", "<=")
+
+
+def _pa():
+    # pyarrow is only needed when the snapshot backend is enabled
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+    return pa, ipc, pq
+
+
+def _pc():
+    import pyarrow.compute as pc
+    return pc
+
+
+def numeric_columns(table: str) -> set:
+    return set(SCHEMA_TABLES[table]["num"]) | ({"shape_area", "shape_leng"} & set(SCHEMA_TABLES[table]["spine"]))
+
+
+def _np(column):
+    # a single-chunk, null-free primitive column maps straight onto the file buffer
+    if column.num_chunks == 1:
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    print("[snapshot] column has", column.num_chunks, "chunks, copying")
+    return column.to_numpy()
+
+
+def _plain(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def _ipc_paths(directory: str, name: str):
+    return os.path.join(directory, f"{name}.arrow"), os.path.join(directory, f"{name}.index.arrow")
+
+
+class TableSnapshot:
+    """Read-only columnar view of one table over memory-mapped Arrow IPC files.
+
+    Numeric columns are float64 with NaN for nulls. Every other column is stored
+    as int32 codes (-1 for null) into a small category list, so all attribute
+    columns, the WKB geometry and the persisted indexes are zero-copy views
+    shared by every worker that maps the same files.
+    """
+
+    def __init__(self, name: str, table, index, meta: dict, index_meta: dict):
+        self.name = name
+        self.n = table.num_rows
+        self.crs = meta.get("crs")
+        self.version = meta.get("version")
+        self.geom = table.column("geom")
+        self.num_cols = set(meta["numeric"])
+        self.kinds = dtype_map(name)
+
+        self.values = {}
+        for col in table.column_names:
+            if col != "geom":
+                self.values[col] = _np(table.column(col))
+
+        # decoded category lists end with None so code -1 maps to a null
+        self.categories = {}
+        self.codes = {}
+        for col, cats in meta["categories"].items():
+            self.categories[col] = np.array(cats + [None], dtype=object)
+            self.codes[col] = {_key(c): i for i, c in enumerate(cats)}
+
+        if self.n:
+            pc = _pc()
+            self.avg_geom_bytes = float(pc.sum(pc.binary_length(self.geom)).as_py() or 0) / self.n
+        else:
+            self.avg_geom_bytes = 0.0
+
+        # range predicates: permutation that sorts each numeric column, NaN last
+        self.sorted = {}
+        for col in self.num_cols:
+            self.sorted[col] = (
+                _np(index.column(f"order__{col}")),
+                _np(index.column(f"sorted__{col}")),
+                index_meta["valid"][col],
+            )
+
+        # equality predicates on region columns: rows grouped by code
+        self.hashed = {}
+        for col, offsets in index_meta["offsets"].items():
+            self.hashed[col] = (_np(index.column(f"order__{col}")), np.asarray(offsets))
+
+        # H3 cell of each row's centroid, per resolution, when h3 was available at build time
+        self.cells = {}
+        for res in index_meta.get("h3", []):
+            self.cells[res] = _np(index.column(f"h3__{res}"))
+
+    def _coerce(self, col, val):
+        if col in self.num_cols:
+            return float(val)
+        if col == "borocode":
+            return int(float(val))
+        if col == "elevator":
+            return str(val).strip().lower() in ("true", "t", "1", "yes")
+        return val
+
+    def _range_rows(self, col, op, v):
+        order, sorted_vals, valid = self.sorted[col]
+        head = sorted_vals[:valid]
+        if op == ">":
+            lo, hi = np.searchsorted(head, v, side="right"), valid
+        elif op == ">=":
+            lo, hi = np.searchsorted(head, v, side="left"), valid
+        elif op == "<":
+            lo, hi = 0, np.searchsorted(head, v, side="left")
+        else:
+            lo, hi = 0, np.searchsorted(head, v, side="right")
+        return np.sort(order[lo:hi])
+
+    def _hash_rows(self, col, v):
+        code = self.codes[col].get(_key(v))
+        if code is None:
+            return np.empty(0, dtype=np.int32)
+        order, offsets = self.hashed[col]
+        # the stable sort keeps row ids ascending within each code
+        return order[offsets[code]:offsets[code + 1]]
+
+    def _compare(self, col, op, v, rows):
+        vals = self.values[col] if rows is None else self.values[col][rows]
+        if col in self.codes:
+            # evaluate the predicate once per category, then test codes
+            cats = self.categories[col][:-1]
+            keep = np.array([c is not None and _apply(op, c, v) for c in cats], dtype=bool)
+            return np.append(keep, False)[vals]
+        return _apply(op, vals, v)
+
+    def select(self, filters) -> np.ndarray:
+        """Row ids matching all filters; hash lookups first, then range scans on the survivors."""
+        rows = None
+        pending = []
+        for col, op, val in active_filters(filters):
+            if col not in self.values:
+                raise KeyError(f'column "{col}" does not exist in {self.name}')
+            if op not in OPS:
+                raise ValueError(f"unsupported op: {op}")
+            v = self._coerce(col, val)
+            if op == "=" and col in self.hashed:
+                hit = self._hash_rows(col, v)
+                rows = hit if rows is None else np.intersect1d(rows, hit, assume_unique=True)
+            else:
+                pending.append((col, op, v))
+
+        for col, op, v in pending:
+            if rows is None and col in self.sorted:
+                rows = self._range_rows(col, op, v)
+                continue
+            m = self._compare(col, op, v, rows)
+            rows = np.flatnonzero(m) if rows is None else rows[m]
+
+        if rows is None:
+            rows = np.arange(self.n)
+        return rows
+
+    def row_width(self, cols: list) -> int:
+        return int(8 * len(cols) + self.avg_geom_bytes)
+
+    def column(self, rows: np.ndarray, col: str):
+        if col not in self.values:
+            raise KeyError(f'column "{col}" does not exist in {self.name}')
+        vals = self.values[col][rows]
+        if col not in self.categories:
+            return vals
+        if self.kinds.get(col) == "category":
+            return pd.Categorical.from_codes(vals, categories=self.categories[col][:-1])
+        return self.categories[col][vals]
+
+    def geometries(self, rows: np.ndarray):
+        return shapely.from_wkb(self.geom.take(rows).to_numpy(zero_copy_only=False))
+
+    def frame(self, rows: np.ndarray, cols: list) -> gpd.GeoDataFrame:
+        data = {col: self.column(rows, col) for col in cols}
+        return gpd.GeoDataFrame(data, geometry=self.geometries(rows), crs=self.crs).rename_geometry("geom")
+
+    def cells_for(self, rows: np.ndarray, res: int) -> np.ndarray:
+        if res in self.cells:
+            return self.cells[res][rows]
+        print("[snapshot] no stored H3 cells at resolution", res, "for", self.name, "- computing")
+        return hexgrid.cells_for_geometries(self.geometries(rows), self.crs, res)
+
+
+def _apply(op, a, b):
+    if op == "=":
+        return a == b
+    if op == ">":
+        return a > b
+    if op == ">=":
+        return a >= b
+    if op == "<":
+        return a < b
+    return a <= b
+
+
+def _key(v):
+    # region keys compare equal across int/float borocodes and str names
+    if isinstance(v, (bool, np.bool_)):
+        return bool(v)
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return float(v)
+    return v
+
+
+class Snapshot:
+    def __init__(self):
+        self.tables = {}
+        self.version = None
+        self.loaded_at = None
+        self._maps = []
+
+    def dissolve_small_n(self) -> gpd.GeoDataFrame:
+        """Street blocks unioned per small_n; only run when the region polygons are (re)built."""
+        blocks = self.table("street_block")
+        gdf = blocks.frame(np.arange(blocks.n), ["small_n"])
+        gdf["small_n"] = gdf["small_n"].astype(object)
+        return gdf.dropna(subset=["small_n"]).dissolve(by="small_n").reset_index()
+
+    def load(self, directory: str = SNAPSHOT_DIR):
+        pa, ipc, _ = _pa()
+        start = time.perf_counter()
+        ensure_built(directory)
+
+        tables = {}
+        maps = []
+        for name in SCHEMA_TABLES:
+            data_path, index_path = _ipc_paths(directory, name)
+            data_map = pa.memory_map(data_path, "r")
+            index_map = pa.memory_map(index_path, "r")
+            maps.extend([data_map, index_map])
+            table = ipc.open_file(data_map).read_all()
+            index = ipc.open_file(index_map).read_all()
+            meta = json.loads(table.schema.metadata[b"snapshot"])
+            index_meta = json.loads(index.schema.metadata[b"snapshot_index"])
+            tables[name] = TableSnapshot(name, table, index, meta, index_meta)
+            print("[snapshot] mapped", name, "rows:", table.num_rows, "version:", meta.get("version"))
+
+        self.tables = tables
+        self.version = max(t.version or "" for t in tables.values())
+        self._maps = maps
+        self.loaded_at = time.time()
+        print("[snapshot] ready in", round((time.perf_counter() - start) * 1000, 1), "ms")
+
+    def table(self, name: str) -> TableSnapshot:
+        if not self.tables:
+            self.load()
+        if name not in self.tables:
+            raise KeyError(f'relation "public.{name}" does not exist')
+        return self.tables[name]
+
+
+snapshot = Snapshot()
+
+
+def _encode(name: str, df: pd.DataFrame, wkb, crs):
+    """Columnar layout for one table plus its sort/hash index table."""
+    pa, _, _ = _pa()
+    num_cols = numeric_columns(name)
+    arrays, categories = {}, {}
+    index_arrays, valid, offsets = {}, {}, {}
+
+    for col in table_columns(name):
+        if col in num_cols:
+            vals = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            order = np.argsort(vals, kind="stable").astype(np.int32)
+            arrays[col] = pa.array(vals)
+            index_arrays[f"order__{col}"] = pa.array(order)
+            index_arrays[f"sorted__{col}"] = pa.array(vals[order])
+            valid[col] = int(np.count_nonzero(~np.isnan(vals)))
+        else:
+            codes, uniques = pd.factorize(df[col], sort=True, use_na_sentinel=True)
+            codes = codes.astype(np.int32)
+            arrays[col] = pa.array(codes)
+            categories[col] = [_plain(u) for u in uniques]
+            if col in HASH_INDEX_COLS:
+                order = np.argsort(codes, kind="stable").astype(np.int32)
+                index_arrays[f"order__{col}"] = pa.array(order)
+                offsets[col] = np.searchsorted(codes[order], np.arange(len(uniques) + 1)).tolist()
+
+    arrays["geom"] = pa.array(wkb, type=pa.large_binary())
+
+    h3_levels = []
+    if name in H3_TABLES and hexgrid.available():
+        lng, lat = hexgrid.centroids_lnglat(shapely.from_wkb(wkb), crs)
+        for res in sorted(set(H3_RESOLUTIONS.values())):
+            index_arrays[f"h3__{res}"] = pa.array(hexgrid.cells_from_points(lng, lat, res))
+            h3_levels.append(res)
+
+    meta = {
+        "numeric": sorted(num_cols),
+        "categories": categories,
+        "crs": crs,
+        "version": time.strftime("%Y%m%dT%H%M%S"),
+    }
+    table = pa.table(arrays).replace_schema_metadata({b"snapshot": json.dumps(meta).encode()})
+    index = pa.table(index_arrays).replace_schema_metadata(
+        {b"snapshot_index": json.dumps({"valid": valid, "offsets": offsets, "h3": h3_levels}).encode()}
+    )
+    return table, index
+
+
+def _write_ipc(table, path: str):
+    pa, ipc, _ = _pa()
+    tmp = path + ".tmp"
+    # one uncompressed record batch per file keeps every column a single zero-copy buffer
+    with pa.OSFile(tmp, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table.combine_chunks(), max_chunksize=max(table.num_rows, 1))
+    os.replace(tmp, path)
+
+
+def _read_source(name: str, directory: str):
+    """Rows for one table, from a Parquet drop if present, otherwise from PostGIS."""
+    _, _, pq = _pa()
+    parquet = os.path.join(directory, f"{name}.parquet")
+    if os.path.exists(parquet):
+        table = pq.read_table(parquet)
+        crs = (table.schema.metadata or {}).get(b"crs")
+        df = table.drop_columns(["geom"]).to_pandas()
+        return df, table.column("geom").to_numpy(zero_copy_only=False), crs.decode() if crs else None
+
+    from .db import engine
+    if engine is None:
+        raise RuntimeError(f"no snapshot source for {name}: {parquet} missing and db_url not set")
+    sql = f"SELECT {', '.join(table_columns(name))}, geom FROM public.{name}"
+    gdf = gpd.read_postgis(sql, con=engine, geom_col="geom")
+    crs = gdf.crs.to_wkt() if gdf.crs is not None else None
+    return pd.DataFrame(gdf.drop(columns="geom")), shapely.to_wkb(gdf.geometry.values), crs
+
+
+def build(directory: str = SNAPSHOT_DIR):
+    """Write each schema table once as memory-mappable Arrow IPC files."""
+    os.makedirs(directory, exist_ok=True)
+    for name in SCHEMA_TABLES:
+        start = time.perf_counter()
+        df, wkb, crs = _read_source(name, directory)
+        table, index = _encode(name, df, wkb, crs)
+        data_path, index_path = _ipc_paths(directory, name)
+        _write_ipc(index, index_path)
+        _write_ipc(table, data_path)
+        print("[snapshot] wrote", name, "rows:", table.num_rows,
+              "in", round(time.perf_counter() - start, 1), "s")
+
+
+def ensure_built(directory: str = SNAPSHOT_DIR):
+    """Build missing snapshot files; concurrent workers wait on a file lock instead of rebuilding."""
+    def missing():
+        return [n for n in SCHEMA_TABLES if not all(os.path.exists(p) for p in _ipc_paths(directory, n))]
+
+    if not missing():
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".build.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if missing():
+                print("[snapshot] building", missing(), "in", directory)
+                build(directory)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def load():
+    snapshot.load()
+
+
+def _select_compiled(snap, compiled) -> np.ndarray:
+    filters = list(compiled["filters"])
+    if compiled.get("region_col"):
+        rows = np.unique(np.concatenate(
+            [snap.select([(compiled["region_col"], "=", r)]) for r in compiled["regions"]] or [np.empty(0, dtype=np.int32)]
+        ))
+        if filters:
+            rows = np.intersect1d(rows, snap.select(filters), assume_unique=True)
+        return rows
+    return snap.select(filters)
+
+
+def fetch_compiled(compiled, rows=None):
+    """Evaluate a compiled plan against the snapshot instead of PostGIS."""
+    start = time.perf_counter()
+    snap = snapshot.table(compiled["table"])
+    if rows is None:
+        rows = _select_compiled(snap, compiled)
+    gdf = snap.frame(rows, compiled["columns"])
+    metrics.record_query(compiled, (time.perf_counter() - start) * 1000, "snapshot")
+    print("data retrieved from snapshot:", len(gdf), "rows")
+    gdf, memory = compact_frame(gdf, compiled["table"])
+    return {"gdf": gdf, "error": None, "memory": memory}
+
+
+def fetch_frame(compiled):
+    """Attribute-only selection from the snapshot; plain DataFrame, no geometry."""
+    start = time.perf_counter()
+    snap = snapshot.table(compiled["table"])
+    rows = snap.select(compiled["filters"])
+    df = pd.DataFrame({col: snap.column(rows, col) for col in compiled["columns"]})
+    metrics.record_query(compiled, (time.perf_counter() - start) * 1000, "snapshot")
+    df, memory = compact_frame(df, compiled["table"])
+    return {"gdf": df, "error": None, "memory": memory}
+
+
+def aggregate_rows(snap, rows, col, level):
+    """One grouped pass per region plus the overall statistics the summary is built from."""
+    level_codes = snap.values[level][rows]
+    vals = snap.values[col][rows]
+    if col in snap.num_cols:
+        df = pd.DataFrame({level: snap.categories[level][level_codes], col: vals})
+        groups = df.groupby(level, dropna=True)[col].agg(["count", "mean", "median", "min", "max"]).reset_index()
+        groups = groups.rename(columns={"mean": col})
+        valid = vals[~np.isnan(vals)]
+        total = {
+            "count": len(valid),
+            "mean": valid.mean() if len(valid) else None,
+            "median": np.median(valid) if len(valid) else None,
+            "min": valid.min() if len(valid) else None,
+            "max": valid.max() if len(valid) else None,
+            **percentiles(valid),
+        }
+        stats = numeric_stats(total)
+    else:
+        keep = vals >= 0
+        cats = snap.categories[col][:-1]
+        pairs = pd.DataFrame({"l": level_codes[keep], "v": vals[keep]}).value_counts().reset_index(name="n")
+        parts = pd.DataFrame({
+            level: snap.categories[level][pairs["l"].to_numpy()],
+            "value": cats[pairs["v"].to_numpy()],
+            "n": pairs["n"].to_numpy(),
+        })
+        totals = pd.Series(np.bincount(vals[keep], minlength=len(cats)), index=cats)
+        groups, stats = categorical_groups(parts, totals, level, col)
+    return attach(groups, level, snapshot.dissolve_small_n), stats
+
+
+def hex_rows(snap, rows, col, res):
+    values = pd.Series(snap.column(rows, col))
+    return hexgrid.aggregate_cells(snap.cells_for(rows, res), values, col, col in snap.num_cols, snap.crs)
+
+
+def sample_rows(snap, rows, col, decision):
+    n = decision["sample_rows"]
+    sample = np.sort(np.random.default_rng().choice(rows, size=n, replace=False)) if len(rows) > n else rows
+    # category counts stay exact; only the geometry is sampled
+    codes = snap.values[col][rows]
+    cats = snap.categories[col][:-1]
+    counts = pd.Series(np.bincount(codes[codes >= 0], minlength=len(cats)), index=cats)
+    counts = counts[counts > 0].sort_values(ascending=False)
+    return sample, {"count": int(counts.sum()), "counts": counts}
+
+
+def fetch_guarded(compiled):
+    """Fetch a compiled plan, downgrading to an aggregate or a sample when it is too large to ship."""
+    start = time.perf_counter()
+    snap = snapshot.table(compiled["table"])
+    rows = _select_compiled(snap, compiled)
+
+    level = compiled.get("aggregate_level")
+    if level:
+        aggregate = {"level": level}
+        if level == hexgrid.LEVEL:
+            gdf, stats = hex_rows(snap, rows, compiled["column"], compiled["h3_resolution"])
+            aggregate["resolution"] = compiled["h3_resolution"]
+        else:
+            gdf, stats = aggregate_rows(snap, rows, compiled["column"], level)
+        aggregate["groups"] = len(gdf)
+        metrics.incr(f"aggregate.{level}")
+        metrics.record_query(compiled, (time.perf_counter() - start) * 1000, "snapshot", kind=f"aggregate_{level}")
+        gdf, memory = compact_frame(gdf, compiled["table"])
+        return {"gdf": gdf, "error": None, "memory": memory, "aggregate": aggregate, "stats": stats}
+
+    decision = decide(compiled, len(rows), snap.row_width(compiled["columns"]))
+    if decision is None:
+        return fetch_compiled(compiled, rows)
+
+    if decision["applied"] == "aggregate":
+        gdf, stats = aggregate_rows(snap, rows, compiled["column"], decision["level"])
+    else:
+        sample, stats = sample_rows(snap, rows, compiled["column"], decision)
+        gdf = snap.frame(sample, compiled["columns"])
+    metrics.incr(f"guardrail.{decision['applied']}")
+    kind = f"aggregate_{decision['level']}" if decision["applied"] == "aggregate" else "sample"
+    metrics.record_query(compiled, (time.perf_counter() - start) * 1000, "snapshot", kind=kind)
+    gdf, memory = compact_frame(gdf, compiled["table"])
+    result = {"gdf": gdf, "error": None, "memory": memory, "downgrade": decision, "stats": stats}
+    if decision["applied"] == "aggregate":
+        result["aggregate"] = {"level": decision["level"], "groups": len(gdf)}
+    return result
+
+
+def dissolve_small_n():
+    return snapshot.dissolve_small_n()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        build(sys.argv[2] if len(sys.argv) > 2 else SNAPSHOT_DIR)
+    else:
+        print("usage: python -m app.snapshot build [directory]")
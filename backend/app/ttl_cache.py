@@ -0,0 +1,53 @@
+import time
+import threading
+from collections import OrderedDict
+
+from .metrics import metrics
+
+
+class TTLCache:
+    """Size-bounded LRU map whose entries also expire after ttl_s seconds.
+
+    Lookups are counted as cache.<name>.lookup / cache.<name>.hit so the hit
+    rate shows up in /metrics.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl_s: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        """Cached value or None."""
+        if self.maxsize <= 0:
+            return None
+        now = time.monotonic()
+        metrics.incr(f"cache.{self.name}.lookup")
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            stored, value = entry
+            if now - stored >= self.ttl_s:
+                del self._items[key]
+                metrics.incr(f"cache.{self.name}.expired")
+                return None
+            self._items.move_to_end(key)
+        metrics.incr(f"cache.{self.name}.hit")
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                metrics.incr(f"cache.{self.name}.evicted")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# the app reads its configuration at import time: keep tests off real keys and data directories
+_tmp = tempfile.mkdtemp(prefix="geo-llm-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("DATA_VERSION", "test")
+os.environ.setdefault("JOBS_DB", os.path.join(_tmp, "jobs.sqlite3"))
+for _name in ("METRICS_DIR", "RESULTS_DIR", "SNAPSHOT_DIR", "REGIONS_DIR"):
+    os.environ.setdefault(_name, os.path.join(_tmp, _name.lower()))
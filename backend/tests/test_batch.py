@@ -0,0 +1,62 @@
+import sys
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("fastapi")
+
+from app.llm.governor import BATCH
+from app.modes.batch import run_batch
+
+batch = sys.modules["app.modes.batch"]
+
+PLANS = {
+    "tall buildings in brooklyn": {"filters": [["borocode", "=", 3]]},
+    # an unknown column would land in the shared frame's select list
+    "tall buildings with deep basements": {"filters": [["basement_depth", ">", 3]]},
+    "tall buildings in atlantis": {"filters": [["borocode", "=", "atlantis"]]},
+    "tall old buildings": {"filters": [["built_year", "<", "1950"]]},
+}
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    calls = []
+
+    def call_llm(messages, priority=None, stage="plan", schema=None):
+        calls.append(priority)
+        query = messages[-1]["content"]
+        if stage == "mode":
+            return {"mode": "analyze"}, None, None
+        plan = next(p for q, p in PLANS.items() if q in query)
+        return {"column": "heightroof", "dtype": "numeric", "scale": "city", "region": None,
+                "table": "buildings", **plan}, None, None
+
+    monkeypatch.setattr(batch, "call_llm", call_llm)
+    return calls
+
+
+def test_invalid_plan_fails_alone(fake_llm, monkeypatch):
+    fetched = []
+
+    def get_data_frame(table, columns, filters):
+        fetched.append((table, columns, filters))
+        frame = pd.DataFrame({"heightroof": [10.0, 50.0, 80.0], "borocode": [1, 3, 3],
+                              "built_year": [1900.0, 1930.0, 2000.0]})
+        return {"gdf": frame, "error": None}
+
+    monkeypatch.setattr(batch, "get_data_frame", get_data_frame)
+    items = {item["query"]: item for item in run_batch(list(PLANS), explain="none")}
+
+    for query in ("tall buildings with deep basements", "tall buildings in atlantis"):
+        assert items[query]["error"].startswith("INVALID_PLAN")
+        assert items[query]["summary"] is None
+    for query in ("tall buildings in brooklyn", "tall old buildings"):
+        assert items[query]["error"] is None
+        assert items[query]["summary"] is not None
+    assert items["tall buildings in brooklyn"]["filters"] == [["borocode", "=", 3]]
+    # one shared frame for the two valid plans, none of the bad plan's filters in it
+    assert len(fetched) == 1
+    assert fetched[0][0] == "buildings"
+    assert "basement_depth" not in fetched[0][1]
+    assert set(fake_llm) == {BATCH}
@@ -0,0 +1,55 @@
+import importlib.util
+from pathlib import Path
+
+# json_repair is plain string handling; load it by path so the test does not import the app package
+_spec = importlib.util.spec_from_file_location(
+    "json_repair", Path(__file__).resolve().parents[1] / "app" / "llm" / "json_repair.py"
+)
+json_repair = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(json_repair)
+parse_json = json_repair.parse_json
+
+
+def test_valid_json_needs_no_repair():
+    assert parse_json('{"mode": "analyze"}') == ({"mode": "analyze"}, False)
+
+
+def test_trailing_commas():
+    assert parse_json('{"a": [1, 2,], "b": 3,}') == ({"a": [1, 2], "b": 3}, True)
+
+
+def test_single_quotes():
+    assert parse_json("{'column': 'heightroof', 'note': 'say \"hi\"'}") == (
+        {"column": "heightroof", "note": 'say "hi"'}, True,
+    )
+
+
+def test_bare_keys_and_python_literals():
+    assert parse_json("{scale: large_n, region: None, ok: True}") == (
+        {"scale": "large_n", "region": None, "ok": True}, True,
+    )
+
+
+def test_exponents_are_numbers():
+    assert parse_json('{"v": 1e6,}') == ({"v": 1e6}, True)
+    assert parse_json("{v: -2.5E-3, w: 3e+2}") == ({"v": -2.5e-3, "w": 300.0}, True)
+
+
+def test_loose_numbers():
+    assert parse_json("{'v': .5, 'w': 1.}") == ({"v": 0.5, "w": 1.0}, True)
+
+
+def test_fenced_output():
+    raw = 'Here is the plan:\n```json\n{"column": "heightroof", "filters": [["heightroof", ">", 100],],}\n```'
+    assert parse_json(raw) == ({"column": "heightroof", "filters": [["heightroof", ">", 100]]}, True)
+
+
+def test_truncated_object_is_closed():
+    assert parse_json('{"column": "heightroof", "filters": [["a", "=", 1') == (
+        {"column": "heightroof", "filters": [["a", "=", 1]]}, True,
+    )
+
+
+def test_no_object():
+    assert parse_json("sorry, I cannot help") == (None, True)
+    assert parse_json("") == (None, False)
@@ -0,0 +1,31 @@
+import sys
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from app.metrics import Metrics
+
+
+def test_rates_with_missing_numerator():
+    m = Metrics()
+    m.incr("llm.parse.total", 4)
+    m.incr("cache.explain.lookup", 2)
+    m.incr("cache.explain.hit")
+    rates = m.snapshot()["rates"]
+    assert rates["llm.parse_failure_rate"] == 0
+    assert rates["llm.reask_rate"] == 0
+    assert rates["explain.cache_hit_rate"] == 0.5
+    # no denominator, no rate
+    assert "payload.cache_hit_rate" not in rates
+
+
+def test_flush_never_raises(monkeypatch):
+    m = Metrics()
+    m.timings["bad"] = None  # snapshot() fails on it
+    m.flush()
+
+    m = Metrics()
+    # the package re-exports the singleton under the module name
+    monkeypatch.setattr(sys.modules["app.metrics"], "METRICS_DIR", "/dev/null/metrics")
+    m.flush()
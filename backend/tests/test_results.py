@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.results import results
+
+client = TestClient(app)
+
+
+def _get(rid, encoding, etag=None):
+    headers = {"Accept-Encoding": encoding}
+    if etag:
+        headers["If-None-Match"] = etag
+    return client.get(f"/results/{rid}", headers=headers)
+
+
+@pytest.mark.parametrize("rows, encoding, suffix", [
+    (2000, "gzip", "-gzip"),
+    (2000, "identity", ""),
+    # below COMPRESS_MIN_BYTES the body is sent as is, whatever the client accepts
+    (1, "gzip", ""),
+])
+def test_etag_round_trip(rows, encoding, suffix):
+    content = {"rows": [{"id": i, "value": i * 1.5} for i in range(rows)]}
+    rid = results.publish([f"plan-{rows}"], content)
+    assert rid
+
+    full = _get(rid, encoding)
+    assert full.status_code == 200
+    assert full.json() == content
+    assert full.headers["ETag"] == f'"{rid}{suffix}"'
+    assert "Accept-Encoding" in full.headers["Vary"]
+
+    cached = _get(rid, encoding, full.headers["ETag"])
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == full.headers["ETag"]
+    assert "Accept-Encoding" in cached.headers["Vary"]
+    assert "Content-Encoding" not in cached.headers
+
+
+def test_unknown_result_is_404():
+    assert _get("0" * 8 + "-" + "0" * 32, "gzip").status_code == 404
@@ -0,0 +1,51 @@
+import sys
+import threading
+import time
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("fastapi")
+
+from app.modes.services import run, runs
+from app.session import sessions
+
+services = sys.modules["app.modes.services"]
+
+
+def _waiters():
+    calls = list(runs._calls.values())
+    return calls[0].waiters if calls else 0
+
+
+def test_coalesced_callers_all_keep_the_frame(monkeypatch):
+    release = threading.Event()
+    frame = pd.DataFrame({"heightroof": [60.0, 80.0]})
+
+    def fake_run(query, history, session, level, stat, explain):
+        release.wait(5)
+        return {"mode": "analyze", "explanation": "two tall buildings", "error": None,
+                "session_frame": {"gdf": frame, "table": "buildings", "column": "heightroof", "scale": "large_n",
+                                  "region": "midtown manhattan", "filters": []}}
+
+    monkeypatch.setattr(services, "_run", fake_run)
+    out = {}
+
+    def ask(session_id):
+        out[session_id] = run("tall buildings in midtown", session_id=session_id, explain="none")
+
+    callers = [threading.Thread(target=ask, args=(sid,)) for sid in ("leader", "follower")]
+    callers[0].start()
+    while not runs._calls:
+        time.sleep(0.01)
+    callers[1].start()
+    while _waiters() < 1:
+        time.sleep(0.01)
+    release.set()
+    for t in callers:
+        t.join(5)
+
+    for sid in ("leader", "follower"):
+        assert "session_frame" not in out[sid]
+        assert out[sid]["session_id"] == sid
+        assert sessions.get(sid).frame["gdf"] is frame
@@ -0,0 +1,40 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("fastapi")
+
+from app.modes.services import session_frame_columns
+from app.session import Session
+
+FILTERS = [["heightroof", ">", 50]]
+
+
+def _frame():
+    return pd.DataFrame({
+        "heightroof": [60.0, 80.0, 120.0],
+        "built_year": [1920.0, 1965.0, 2010.0],
+        "small_n": ["a", "a", "b"],
+    })
+
+
+def test_numeric_columns_kept_at_neighborhood_scale():
+    cols = session_frame_columns("buildings", "large_n", FILTERS)
+    assert "built_year" in cols and "heightroof" in cols
+    assert session_frame_columns("buildings", "city", FILTERS) == ["heightroof"]
+
+
+def test_follow_up_on_another_column_uses_the_frame():
+    session = Session("s")
+    session.keep_frame(_frame(), table="buildings", column="heightroof", scale="large_n",
+                       region="midtown manhattan", filters=FILTERS)
+
+    same_filters = session.refine("buildings", "built_year", "large_n", "midtown manhattan", FILTERS)
+    assert same_filters["built_year"].tolist() == [1920.0, 1965.0, 2010.0]
+    narrower = session.refine("buildings", "built_year", "large_n", "midtown manhattan",
+                              FILTERS + [["built_year", ">", 1950]])
+    assert len(narrower) == 2
+
+    # a column the frame does not carry, another region or wider filters go back to the data
+    assert session.refine("buildings", "bld_story", "large_n", "midtown manhattan", FILTERS) is None
+    assert session.refine("buildings", "built_year", "large_n", "north brooklyn", FILTERS) is None
+    assert session.refine("buildings", "built_year", "large_n", "midtown manhattan", []) is None
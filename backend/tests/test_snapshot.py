@@ -0,0 +1,72 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+shapely = pytest.importorskip("shapely")
+pytest.importorskip("geopandas")
+pytest.importorskip("fastapi")
+
+from app.llm.llm_prompt import SCHEMA_TABLES
+from app.plan_compiler import table_columns
+from app.snapshot import Snapshot, build, fetch_compiled
+from app import snapshot as snapshot_module
+
+ROWS = 4
+VALUES = {
+    "borocode": [1, 1, 3, 4],
+    "large_n": ["midtown manhattan", "midtown manhattan", "north brooklyn", "western queens"],
+    "small_n": ["a", "b", "c", "d"],
+    "elevator": [True, False, None, True],
+}
+
+
+def _column(table, col):
+    if col in VALUES:
+        return VALUES[col]
+    if col in SCHEMA_TABLES[table]["cat"]:
+        return ["x", "y", "x", None]
+    return [10.0, 20.0, None, 40.0]
+
+
+def _write_source(directory, table):
+    cols = {col: _column(table, col) for col in table_columns(table)}
+    points = [shapely.Point(i, i) for i in range(ROWS)]
+    cols["geom"] = pa.array(shapely.to_wkb(points).tolist(), type=pa.binary())
+    source = pa.table(cols).replace_schema_metadata({b"crs": b"EPSG:2263"})
+    pq.write_table(source, directory / f"{table}.parquet")
+
+
+@pytest.fixture
+def snap(tmp_path):
+    for table in SCHEMA_TABLES:
+        _write_source(tmp_path, table)
+    build(str(tmp_path))
+    s = Snapshot()
+    s.load(str(tmp_path))
+    return s
+
+
+def test_build_and_load(snap):
+    assert set(snap.tables) == set(SCHEMA_TABLES)
+    assert snap.version
+    blocks = snap.table("street_block")
+    assert blocks.n == ROWS
+    # every row is a WKB point: 1 byte order + 4 type + 16 coordinates
+    assert blocks.avg_geom_bytes == pytest.approx(21.0)
+    assert blocks.row_width(["pop20"]) == 8 + 21
+
+
+def test_select_uses_hash_and_range_indexes(snap):
+    blocks = snap.table("street_block")
+    assert blocks.select([["borocode", "=", 1]]).tolist() == [0, 1]
+    assert blocks.select([["pop20", ">=", 20]]).tolist() == [1, 3]
+    assert blocks.select([["borocode", "=", 1], ["pop20", ">", 15]]).tolist() == [1]
+
+
+def test_fetch_compiled_returns_frame(snap, monkeypatch):
+    monkeypatch.setattr(snapshot_module, "snapshot", snap)
+    compiled = {"name": "t", "sql": "", "params": {}, "table": "street_block", "columns": ["pop20", "borocode"],
+                "filters": [("borocode", "=", 1)]}
+    result = fetch_compiled(compiled)
+    assert result["error"] is None
+    assert sorted(result["gdf"]["pop20"].tolist()) == [10.0, 20.0]
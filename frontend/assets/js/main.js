@@ -34,7 +34,9 @@ let explanation = "";
 let columnName = null;
 let scale = null;
 let chatHistory = [];
+let sessionId = null;
 let dtype = null;
+let resultUrl = null;
 
 //--------------------------------------------------------------------
 //------------------------- Chat UI helpers --------------------------
@@ -88,6 +90,29 @@ if (analyzeCache) {
     console.log("[cache] restoring chart2 with", cache.values.length, "values");
     window.renderChart2("#chart2", cache.values, columnName || cache.column, scale, currentMode, dtype);
   }
+
+  // the map layer comes back from the result resource; the browser revalidates it with If-None-Match
+  if (cache.result_url) {
+    fetch("http://localhost:8000" + cache.result_url)
+      .then(res => (res.ok ? res.json() : null))
+      .then(result => {
+        if (!result || !result.geojson) {
+          console.log("[cache] result no longer available:", cache.result_url);
+          return;
+        }
+        geojson = result.geojson;
+        resultUrl = cache.result_url;
+        console.log("[cache] restoring map from", cache.result_url);
+        if (typeof map !== "undefined" && map) {
+          if (!map.isStyleLoaded()) {
+            map.once("load", () => applyDataSingle(geojson, columnName, currentMode, dtype));
+          } else {
+            applyDataSingle(geojson, columnName, currentMode, dtype);
+          }
+        }
+      })
+      .catch(e => console.warn("[cache] failed to fetch result:", e));
+  }
 } else {
   console.log("[cache] no analyzeCache found");
 }
@@ -114,12 +139,15 @@ form.addEventListener("submit", async e => {
     const res = await fetch("http://localhost:8000/analyze", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ query: q, history: chatHistory })
+      body: JSON.stringify({ query: q, history: chatHistory, session_id: sessionId })
     });
 
     console.log("[submit] response status:", res.status);
     const data = await res.json();
     console.log("[submit] DATA FROM BACKEND:", data);
+    if (data.session_id) {
+      sessionId = data.session_id;
+    }
 
     if (data.error) {
       console.warn("[submit] backend returned error:", data.error);
@@ -153,6 +181,7 @@ if (resetBtn) {
       outputBox.innerHTML = "";
     }
     chatHistory = [];
+    sessionId = null;
     currentMode = null;
     geojson = null;
     geojsonList = null;
@@ -251,6 +280,7 @@ function clearAllSources() {
 function handleSingleData(data) {
   console.log("[single] handleSingleData", data);
   geojson = data.geojson;
+  resultUrl = data.result_url || null;
   explanation = data.explanation || "";
   columnName = data.column || getColumnName(geojson);
   scale = data.scale || null;
@@ -262,6 +292,18 @@ function handleSingleData(data) {
     explanationExists: !!explanation
   });
   updateSingleView();
+  if (data.ranking && data.ranking.candidates && data.ranking.candidates.length > 1) {
+    appendMessage(formatRanking(data.ranking), "bot");
+  }
+}
+
+// search answers carry the top-k candidates so "and the second best?" needs no new query
+function formatRanking(ranking) {
+  const lines = ranking.candidates.map(c => {
+    const metric = c.metric == null ? "n/a" : Number(c.metric).toLocaleString(undefined, { maximumFractionDigits: 2 });
+    return `${c.rank}. ${c.region}: ${metric} (n=${c.count})`;
+  });
+  return `top ${lines.length} by ${ranking.statistic} ${ranking.column}: ` + lines.join("; ");
 }
 
 //--------------------------------------------------------------------
@@ -269,7 +311,9 @@ function handleSingleData(data) {
 //--------------------------------------------------------------------
 function handleCompareData(data) {
   console.log("[compare] data.geojson shape:", Array.isArray(data.geojson), data.geojson);
-  geojsonList = data.geojson || [];
+  geojsonList = Array.isArray(data.geojson)
+    ? data.geojson
+    : splitByRegion(data.geojson, data.scale, data.region || []);
   const expl = data.explanation || [];
   explanation = Array.isArray(expl) ? expl.join("\n\n") : expl || "";
   const g0 = geojsonList[0];
@@ -290,6 +334,21 @@ function handleCompareData(data) {
   updateCompareView();
 }
 
+//--------------------------------------------------------------------
+//------------- Helper: split compare collection by region -----------
+//--------------------------------------------------------------------
+// the backend sends every compared region in one collection; returns [all, region1, region2, ...]
+function splitByRegion(fc, scaleName, regions) {
+  if (!fc || !fc.features) return [];
+  const regionCol = scaleName === "borough" ? "borocode" : "large_n";
+  const parts = regions.map(r => ({
+    type: "FeatureCollection",
+    features: fc.features.filter(f => f.properties && String(f.properties[regionCol]) === String(r))
+  }));
+  console.log("[compare] split by", regionCol, parts.map(p => p.features.length));
+  return [fc, ...parts];
+}
+
 //--------------------------------------------------------------------
 //-------------------- Helper: infer column name ---------------------
 //--------------------------------------------------------------------
@@ -391,7 +450,8 @@ function updateSingleView() {
       explanation: explanation,
       scale: scale,
       mode: currentMode,
-      dtype: dtype
+      dtype: dtype,
+      result_url: resultUrl
     };
     console.log("[single] updating analyzeCache", cacheObj);
     try {